@@ -0,0 +1,107 @@
+"""
+Benchmark y verificación de paridad de los kernels de momentos por lotes.
+
+Compara momentos_lote / momentos_hu_lote contra cv2.moments / cv2.HuMoments
+imagen por imagen (diferencia máxima y número de valores idénticos) y mide el
+tiempo de ambos caminos.
+
+Uso (desde backend/):
+    python benchmarks/benchmark_momentos.py --n 256
+    python benchmarks/benchmark_momentos.py --imagenes /data/originals
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feature_extraction.moments import (  # noqa: E402
+    CLAVES_MOMENTOS,
+    momentos_cv2_lote,
+    hu_lote,
+)
+from preprocesamiento.preprocesamiento import ImagenPreprocesada, binarizar_otsu  # noqa: E402
+
+
+def mascaras_sinteticas(n: int, semilla: int = 0) -> list:
+    """Máscaras Otsu de 256x256 con elipses aleatorias y ruido"""
+    rng = np.random.default_rng(semilla)
+    mascaras = []
+    for _ in range(n):
+        gris = np.zeros((256, 256), np.uint8)
+        for _ in range(int(rng.integers(1, 4))):
+            centro = tuple(int(v) for v in rng.integers(30, 226, 2))
+            ejes = tuple(int(v) for v in rng.integers(5, 80, 2))
+            cv2.ellipse(gris, centro, ejes, int(rng.integers(0, 180)), 0, 360, int(rng.integers(100, 256)), -1)
+        gris = cv2.add(gris, rng.integers(0, 40, gris.shape, dtype=np.uint8))
+        mascaras.append(binarizar_otsu(gris))
+    return mascaras
+
+
+def mascaras_de_directorio(directorio: str) -> list:
+    mascaras = []
+    for nombre in sorted(os.listdir(directorio)):
+        ruta = os.path.join(directorio, nombre)
+        if not os.path.isfile(ruta):
+            continue
+        try:
+            with open(ruta, "rb") as f:
+                mascaras.append(ImagenPreprocesada.desde_bytes(f.read()).binaria)
+        except Exception as exc:
+            print(f"[BENCH] Se omite {nombre}: {exc}")
+    return mascaras
+
+
+def cronometrar(fn, repeticiones: int) -> float:
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de momentos por lotes vs cv2.moments")
+    parser.add_argument("--n", type=int, default=256, help="Número de máscaras sintéticas")
+    parser.add_argument("--imagenes", default=None, help="Directorio con imágenes reales (opcional)")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    mascaras = mascaras_de_directorio(args.imagenes) if args.imagenes else mascaras_sinteticas(args.n)
+    if not mascaras:
+        print("[BENCH] No hay imágenes")
+        return
+    print(f"[BENCH] {len(mascaras)} máscaras de {mascaras[0].shape}")
+
+    # Paridad (con IPP, cv2 calcula los momentos centrales por otra vía)
+    lote = momentos_cv2_lote(mascaras)
+    hu = hu_lote(lote)
+    nuevo_m = np.stack([lote[k] for k in CLAVES_MOMENTOS], axis=1)
+    uso_ipp = cv2.ipp.useIPP()
+    for ipp in (False, True):
+        cv2.ipp.setUseIPP(ipp)
+        referencia = [cv2.moments(m) for m in mascaras]
+        ref_m = np.array([[r[k] for k in CLAVES_MOMENTOS] for r in referencia])
+        ref_hu = np.array([cv2.HuMoments(r).flatten() for r in referencia])
+        for nombre, ref, nuevo in (("momentos", ref_m, nuevo_m), ("hu", ref_hu, hu)):
+            escala = np.maximum(np.abs(ref), np.finfo(np.float64).tiny)
+            print(
+                f"[BENCH] {nombre} (IPP={'sí' if ipp else 'no'}): idénticos {int(np.sum(ref == nuevo))}/{ref.size}, "
+                f"error relativo máx {float(np.max(np.abs(ref - nuevo) / escala)):.3e}"
+            )
+    cv2.ipp.setUseIPP(uso_ipp)
+
+    # Tiempos
+    t_cv2 = cronometrar(lambda: [cv2.HuMoments(cv2.moments(m)) for m in mascaras], args.repeticiones)
+    t_lote = cronometrar(lambda: hu_lote(momentos_cv2_lote(mascaras)), args.repeticiones)
+    print(f"[BENCH] cv2.moments + HuMoments por imagen: {t_cv2 * 1e3 / len(mascaras):.3f} ms/imagen")
+    print(f"[BENCH] kernel por lotes: {t_lote * 1e3 / len(mascaras):.3f} ms/imagen")
+
+
+if __name__ == "__main__":
+    main()
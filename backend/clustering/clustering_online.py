@@ -1,5 +1,11 @@
+import copy
+import uuid
+
 import numpy as np
 
+from clustering.metrics import IncrementalDunn, dunn_index, sampled_silhouette, silhouette_coefficient
+from clustering.vector_store import VectorStore
+
 
 def cos_sim(a: np.ndarray, b: np.ndarray) -> float:
     denom = (np.linalg.norm(a) * np.linalg.norm(b))
@@ -12,6 +18,8 @@ class Subcluster:
     def __init__(self, initial_vector: np.ndarray):
         self.centroid = initial_vector.copy()
         self.n_vectors = 1
+        # Fila del subcluster en el índice vectorizado del modelo
+        self.row: int | None = None
 
     def add(self, vector: np.ndarray):
         self.n_vectors += 1
@@ -25,6 +33,7 @@ class LinksClusterCapacityOnline:
         cluster_similarity_threshold: float = 0.75,
         subcluster_similarity_threshold: float = 0.85,
         pair_similarity_maximum: float = 0.95,
+        mmap_dir: str | None = None,
     ):
         if not capacities or any(int(c) <= 0 for c in capacities):
             raise ValueError("capacities debe ser una lista no vacía de enteros > 0")
@@ -42,12 +51,24 @@ class LinksClusterCapacityOnline:
         self.last_centroid: np.ndarray | None = None
         self.last_cluster_id: int | None = None
         
-        # Almacenar todos los vectores y sus cluster_ids para cálculo de métricas
-        self.all_vectors: list[np.ndarray] = []
-        self.all_labels: list[int] = []
-        
-        # Almacenar etiquetas verdaderas para métricas externas (opcional)
-        self.true_labels: list[int] = []
+        # Todos los vectores asignados (float32 contiguo), su cluster_id, la fila
+        # del subcluster que los recibió y las etiquetas verdaderas opcionales
+        # para métricas externas. mmap_dir respalda la matriz con un archivo.
+        self.store = VectorStore(mmap_dir=mmap_dir)
+
+        # Índice de Dunn mantenido incrementalmente en cada asignación
+        self._dunn = IncrementalDunn(self.k, self.store)
+
+        # Contador de mutaciones: identifica la versión del modelo para cachear métricas
+        self.model_id = uuid.uuid4().hex[:12]
+        self.version = 0
+
+        # Índice vectorizado de subclusters: centroides pre-normalizados (float32)
+        # en una matriz contigua, con el id de cluster de cada fila en paralelo
+        self._subclusters: list[Subcluster] = []
+        self._sc_matrix = np.empty((0, 0), dtype=np.float32)
+        self._sc_cluster_ids = np.empty(0, dtype=np.int32)
+        self._sc_valid = np.empty(0, dtype=bool)
 
     def sim_threshold(self, k: int, kp: int) -> float:
         s = (1.0 + 1.0 / k * (1.0 / self.cluster_similarity_threshold**2 - 1.0))
@@ -61,58 +82,144 @@ class LinksClusterCapacityOnline:
         )
         return float(s)
 
+    @property
+    def all_vectors(self) -> np.ndarray:
+        return self.store.vectors
+
+    @property
+    def all_labels(self) -> np.ndarray:
+        return self.store.labels
+
+    @property
+    def all_subclusters(self) -> np.ndarray:
+        return self.store.subclusters
+
+    @property
+    def true_labels(self) -> np.ndarray:
+        return self.store.true_labels
+
     def _has_capacity(self, cid: int) -> bool:
         return self.cluster_counts[cid] < self.capacities[cid]
 
+    def _index_subcluster(self, cid: int, sc: Subcluster) -> None:
+        """Agrega un subcluster al índice vectorizado (crecimiento amortizado x2)"""
+        n = len(self._subclusters)
+        if n == 0 and self._sc_matrix.shape[1] != sc.centroid.shape[0]:
+            self._sc_matrix = np.empty((16, sc.centroid.shape[0]), dtype=np.float32)
+            self._sc_cluster_ids = np.empty(16, dtype=np.int32)
+            self._sc_valid = np.empty(16, dtype=bool)
+        elif n == self._sc_matrix.shape[0]:
+            new_cap = max(16, 2 * n)
+            matrix = np.empty((new_cap, self._sc_matrix.shape[1]), dtype=np.float32)
+            matrix[:n] = self._sc_matrix[:n]
+            cluster_ids = np.empty(new_cap, dtype=np.int32)
+            cluster_ids[:n] = self._sc_cluster_ids[:n]
+            valid = np.empty(new_cap, dtype=bool)
+            valid[:n] = self._sc_valid[:n]
+            self._sc_matrix, self._sc_cluster_ids, self._sc_valid = matrix, cluster_ids, valid
+        sc.row = n
+        self._subclusters.append(sc)
+        self._sc_cluster_ids[n] = cid
+        self._refresh_subcluster(sc)
+
+    def _refresh_subcluster(self, sc: Subcluster) -> None:
+        """Actualiza la fila normalizada de un subcluster tras cambiar su centroide"""
+        norm = np.linalg.norm(sc.centroid)
+        self._sc_valid[sc.row] = norm > 0
+        self._sc_matrix[sc.row] = sc.centroid / norm if norm > 0 else 0.0
+
+    def _rebuild_subcluster_index(self) -> None:
+        """Reconstruye el índice vectorizado desde self.clusters"""
+        self._subclusters = []
+        self._sc_matrix = np.empty((0, 0), dtype=np.float32)
+        self._sc_cluster_ids = np.empty(0, dtype=np.int32)
+        self._sc_valid = np.empty(0, dtype=bool)
+        for cid, cluster in enumerate(self.clusters):
+            for sc in cluster:
+                self._index_subcluster(cid, sc)
+
+    def _nearest_subcluster(self, x: np.ndarray) -> tuple:
+        """
+        Busca el subcluster más similar entre los clusters CON CUPO disponible.
+        Un solo producto matriz-vector más un argmax enmascarado por capacidad.
+        Retorna (cid, subcluster, similitud) o (None, None, -inf).
+        """
+        n = len(self._subclusters)
+        if n == 0:
+            return None, None, -np.inf
+
+        has_capacity = np.asarray(self.cluster_counts) < np.asarray(self.capacities[:len(self.clusters)])
+        cluster_ids = self._sc_cluster_ids[:n]
+        mask = has_capacity[cluster_ids]
+        if not mask.any():
+            return None, None, -np.inf
+
+        norm = np.linalg.norm(x)
+        if norm == 0:
+            # cos_sim con un vector nulo vale -1 para todos
+            sims = np.full(n, -1.0, dtype=np.float32)
+        else:
+            sims = self._sc_matrix[:n] @ (x / norm).astype(np.float32)
+            sims[~self._sc_valid[:n]] = -1.0
+        sims[~mask] = -np.inf
+
+        best = self._subclusters[int(np.argmax(sims))]
+        # Similitud exacta (float64) para las comparaciones contra umbrales
+        return int(self._sc_cluster_ids[best.row]), best, cos_sim(x, best.centroid)
+
     def _append_new_cluster(self, x: np.ndarray) -> int:
         if len(self.clusters) >= self.k:
             raise RuntimeError("No se pueden crear más clusters (k alcanzado)")
-        self.clusters.append([Subcluster(x)])
+        sc = Subcluster(x)
+        self.clusters.append([sc])
+        self._index_subcluster(len(self.clusters) - 1, sc)
         self.cluster_counts.append(1)
         self.last_centroid = x.copy()
         self.last_cluster_id = len(self.clusters) - 1
         return self.last_cluster_id
 
+    def _record_assignment(self, x: np.ndarray, cid: int, sc: Subcluster, true_label: int = None) -> None:
+        """Registra el vector asignado para métricas (incluye el Dunn incremental)"""
+        self.store.append(x, cid, sc.row, true_label)
+        self._dunn.add(x, cid)
+        self.version += 1
+
+    @property
+    def version_token(self) -> str:
+        """Token único de la versión actual (instancia + contador de mutaciones)"""
+        return f"{self.model_id}:{self.version}"
+
+    def snapshot(self) -> "LinksClusterCapacityOnline":
+        """
+        Copia ligera de solo lectura para calcular métricas fuera del hilo que
+        asigna vectores. Los vectores no se copian: el almacén solo anexa filas.
+        """
+        snap = copy.copy(self)
+        snap.capacities = list(self.capacities)
+        snap.cluster_counts = list(self.cluster_counts)
+        snap.clusters = [list(cluster) for cluster in self.clusters]
+        snap.store = self.store.snapshot()
+        snap._dunn = self._dunn.snapshot(snap.store)
+        return snap
+
     def predict_with_centroid(self, x: np.ndarray, allow_new_clusters: bool = True, true_label: int = None) -> tuple[int, np.ndarray]:
         # ... (código inicial igual)
         
         # FASE 1: Buscar mejor cluster CON CUPO disponible
-        best_cid, best_sc, best_sim = None, None, -np.inf
-        for cid, cl in enumerate(self.clusters):
-            if not self._has_capacity(cid):
-                continue
-            for sc in cl:
-                s = cos_sim(x, sc.centroid)
-                if s > best_sim:
-                    best_sim = s
-                    best_cid = cid
-                    best_sc = sc
+        best_cid, best_sc, best_sim = self._nearest_subcluster(x)
         
         # Verificación robusta después de FASE 1
         if best_cid is not None:
             # DOUBLE-CHECK: ¿Sigue teniendo cupo?
             if not self._has_capacity(best_cid):
-                # Cupo cambió concurrentemente o lógica previa falló
-                best_cid, best_sc, best_sim = None, None, -np.inf
-                # Re-buscar excluyendo clusters sin cupo
-                for cid, cl in enumerate(self.clusters):
-                    if not self._has_capacity(cid):
-                        continue
-                    for sc in cl:
-                        s = cos_sim(x, sc.centroid)
-                        if s > best_sim:
-                            best_sim = s
-                            best_cid = cid
-                            best_sc = sc
+                # Cupo cambió concurrentemente o lógica previa falló: re-buscar
+                best_cid, best_sc, best_sim = self._nearest_subcluster(x)
         
         # Si sigue siendo None, crear nuevo cluster si es posible
         if best_cid is None or best_sc is None:
             if allow_new_clusters and len(self.clusters) < self.k:
                 cid = self._append_new_cluster(x)
-                self.all_vectors.append(x.copy())
-                self.all_labels.append(cid)
-                if true_label is not None:
-                    self.true_labels.append(true_label)
+                self._record_assignment(x, cid, self.clusters[cid][0], true_label)
                 return cid, self.last_centroid.copy()
             raise RuntimeError("No hay clusters con capacidad disponible")
         
@@ -120,23 +227,18 @@ class LinksClusterCapacityOnline:
         if not self._has_capacity(best_cid):
             if allow_new_clusters and len(self.clusters) < self.k:
                 cid = self._append_new_cluster(x)
-                self.all_vectors.append(x.copy())
-                self.all_labels.append(cid)
-                if true_label is not None:
-                    self.true_labels.append(true_label)
+                self._record_assignment(x, cid, self.clusters[cid][0], true_label)
                 return cid, self.last_centroid.copy()
             raise RuntimeError("Capacidad excedida: no hay cluster con cupo")
         
         # FASE 2: Intentar agregar al subcluster más similar
         if best_sim >= self.subcluster_similarity_threshold:
             best_sc.add(x)
+            self._refresh_subcluster(best_sc)
             self.cluster_counts[best_cid] += 1
             self.last_centroid = best_sc.centroid.copy()
             self.last_cluster_id = best_cid
-            self.all_vectors.append(x.copy())
-            self.all_labels.append(best_cid)
-            if true_label is not None:
-                self.true_labels.append(true_label)
+            self._record_assignment(x, best_cid, best_sc, true_label)
             return best_cid, self.last_centroid.copy()
         
         # FASE 3: Crear nuevo subcluster si es similar al existente
@@ -144,33 +246,26 @@ class LinksClusterCapacityOnline:
         s_link = cos_sim(new_sc.centroid, best_sc.centroid)
         if s_link >= self.sim_threshold(best_sc.n_vectors, 1):
             self.clusters[best_cid].append(new_sc)
+            self._index_subcluster(best_cid, new_sc)
             self.cluster_counts[best_cid] += 1
             self.last_centroid = new_sc.centroid.copy()
             self.last_cluster_id = best_cid
-            self.all_vectors.append(x.copy())
-            self.all_labels.append(best_cid)
-            if true_label is not None:
-                self.true_labels.append(true_label)
+            self._record_assignment(x, best_cid, new_sc, true_label)
             return best_cid, self.last_centroid.copy()
         
         # FASE 4: No cumple similitud, intentar crear nuevo cluster
         if allow_new_clusters and len(self.clusters) < self.k:
             cid = self._append_new_cluster(x)
-            self.all_vectors.append(x.copy())
-            self.all_labels.append(cid)
-            if true_label is not None:
-                self.true_labels.append(true_label)
+            self._record_assignment(x, cid, self.clusters[cid][0], true_label)
             return cid, self.last_centroid.copy()
         
         # FASE 5: Última opción - asignar al mejor con cupo (ya verificado)
         best_sc.add(x)
+        self._refresh_subcluster(best_sc)
         self.cluster_counts[best_cid] += 1
         self.last_centroid = best_sc.centroid.copy()
         self.last_cluster_id = best_cid
-        self.all_vectors.append(x.copy())
-        self.all_labels.append(best_cid)
-        if true_label is not None:
-            self.true_labels.append(true_label)
+        self._record_assignment(x, best_cid, best_sc, true_label)
         return best_cid, self.last_centroid.copy()
         
     def to_dict(self) -> dict:
@@ -188,19 +283,21 @@ class LinksClusterCapacityOnline:
             ],
             "last_centroid": self.last_centroid.tolist() if self.last_centroid is not None else None,
             "last_cluster_id": self.last_cluster_id,
-            "all_vectors": [v.tolist() for v in self.all_vectors],
-            "all_labels": self.all_labels,
-            "true_labels": self.true_labels,
+            "all_vectors": self.all_vectors.tolist(),
+            "all_labels": self.all_labels.tolist(),
+            "all_subclusters": self.all_subclusters.tolist(),
+            "true_labels": self.true_labels.tolist(),
         }
 
     @classmethod
-    def from_dict(cls, data: dict) -> "LinksClusterCapacityOnline":
+    def from_dict(cls, data: dict, mmap_dir: str | None = None) -> "LinksClusterCapacityOnline":
         """Reconstruye el modelo desde un diccionario"""
         model = cls(
             capacities=data["capacities"],
             cluster_similarity_threshold=data["cluster_similarity_threshold"],
             subcluster_similarity_threshold=data["subcluster_similarity_threshold"],
-            pair_similarity_maximum=data["pair_similarity_maximum"]
+            pair_similarity_maximum=data["pair_similarity_maximum"],
+            mmap_dir=mmap_dir,
         )
         model.cluster_counts = data["cluster_counts"]
         model.clusters = []
@@ -211,12 +308,95 @@ class LinksClusterCapacityOnline:
                 sc.n_vectors = sc_data["n_vectors"]
                 subclusters.append(sc)
             model.clusters.append(subclusters)
+        model._rebuild_subcluster_index()
         model.last_centroid = np.array(data["last_centroid"]) if data["last_centroid"] else None
         model.last_cluster_id = data["last_cluster_id"]
         # Restaurar vectores y labels
-        model.all_vectors = [np.array(v) for v in data.get("all_vectors", [])]
-        model.all_labels = data.get("all_labels", [])
-        model.true_labels = data.get("true_labels", [])
+        model.store.extend(
+            np.array(data.get("all_vectors", []), dtype=np.float32),
+            data.get("all_labels", []),
+            data.get("all_subclusters"),
+            data.get("true_labels"),
+        )
+        model._dunn = IncrementalDunn.from_store(model.k, model.store)
+        return model
+
+    def replay_assignment(self, x: np.ndarray, cid: int, sc_row: int, true_label: int = None) -> None:
+        """
+        Re-aplica una asignación ya decidida (p. ej. desde el journal) sin
+        volver a buscar: sc_row igual al número de subclusters crea uno nuevo
+        (y un cluster nuevo si cid es el siguiente id libre).
+        """
+        if sc_row == len(self._subclusters):
+            sc = Subcluster(x)
+            if cid == len(self.clusters):
+                self.clusters.append([sc])
+                self.cluster_counts.append(0)
+            else:
+                self.clusters[cid].append(sc)
+            self._index_subcluster(cid, sc)
+        else:
+            sc = self._subclusters[sc_row]
+            sc.add(x)
+            self._refresh_subcluster(sc)
+        self.cluster_counts[cid] += 1
+        self.last_centroid = sc.centroid.copy()
+        self.last_cluster_id = cid
+        self._record_assignment(x, cid, sc, true_label)
+
+    def to_arrays(self) -> tuple[dict, dict]:
+        """
+        Serialización binaria compacta: (meta JSON pequeño, arreglos numpy)
+        """
+        meta = {
+            "capacities": self.capacities,
+            "cluster_similarity_threshold": self.cluster_similarity_threshold,
+            "subcluster_similarity_threshold": self.subcluster_similarity_threshold,
+            "pair_similarity_maximum": self.pair_similarity_maximum,
+            "last_cluster_id": self.last_cluster_id,
+        }
+        n = len(self.all_vectors)
+        dim = self._sc_matrix.shape[1] if self._subclusters else 0
+        arrays = {
+            "vectors": np.asarray(self.all_vectors).reshape(n, dim),
+            "labels": np.asarray(self.all_labels),
+            "subclusters": np.asarray(self.all_subclusters),
+            "true_labels": np.asarray(self.true_labels, dtype=np.int64),
+            "has_true": np.asarray(self.store.has_true, dtype=bool),
+            "sc_centroids": np.asarray([sc.centroid for sc in self._subclusters], dtype=np.float64).reshape(len(self._subclusters), dim),
+            "sc_n_vectors": np.asarray([sc.n_vectors for sc in self._subclusters], dtype=np.int64),
+            "sc_cluster_ids": self._sc_cluster_ids[:len(self._subclusters)].copy(),
+            "cluster_counts": np.asarray(self.cluster_counts, dtype=np.int64),
+            "last_centroid": (
+                np.asarray(self.last_centroid, dtype=np.float64)
+                if self.last_centroid is not None else np.empty(0, dtype=np.float64)
+            ),
+        }
+        return meta, arrays
+
+    @classmethod
+    def from_arrays(cls, meta: dict, arrays, mmap_dir: str | None = None) -> "LinksClusterCapacityOnline":
+        """Reconstruye el modelo desde to_arrays()"""
+        model = cls(
+            capacities=meta["capacities"],
+            cluster_similarity_threshold=meta["cluster_similarity_threshold"],
+            subcluster_similarity_threshold=meta["subcluster_similarity_threshold"],
+            pair_similarity_maximum=meta["pair_similarity_maximum"],
+            mmap_dir=mmap_dir,
+        )
+        for centroid, n_vectors, cid in zip(arrays["sc_centroids"], arrays["sc_n_vectors"], arrays["sc_cluster_ids"]):
+            sc = Subcluster(np.array(centroid, dtype=np.float64))
+            sc.n_vectors = int(n_vectors)
+            if cid == len(model.clusters):
+                model.clusters.append([])
+            model.clusters[cid].append(sc)
+            model._index_subcluster(int(cid), sc)
+        model.cluster_counts = [int(c) for c in arrays["cluster_counts"]]
+        last_centroid = arrays["last_centroid"]
+        model.last_centroid = np.array(last_centroid) if len(last_centroid) else None
+        model.last_cluster_id = meta["last_cluster_id"]
+        model.store.extend(arrays["vectors"], arrays["labels"], arrays["subclusters"], arrays["true_labels"], arrays.get("has_true"))
+        model._dunn = IncrementalDunn.from_store(model.k, model.store)
         return model
 
     def get_cluster_centroids(self) -> np.ndarray:
@@ -235,104 +415,53 @@ class LinksClusterCapacityOnline:
                 centroids.append(centroid)
         return np.array(centroids) if centroids else np.array([])
 
-    def calculate_dunn_index(self) -> float:
+    def calculate_dunn_index(self, full_recompute: bool = False) -> float:
         """
         Calcula el Índice de Dunn usando los vectores reales
         DI = min_distance_between_clusters / max_distance_within_cluster
         Valores más altos indican mejor separación entre clusters
+        Por defecto usa el estado incremental (O(k²)); full_recompute=True
+        recalcula desde cero para verificación.
         """
         if len(self.all_vectors) == 0 or len(self.clusters) <= 1:
             return 0.0
         
-        # Convertir a numpy arrays
-        X = np.array(self.all_vectors)
-        labels = np.array(self.all_labels)
-        unique_labels = np.unique(labels)
+        if not full_recompute:
+            return self._dunn.dunn()
         
-        if len(unique_labels) <= 1:
-            return 0.0
-        
-        # Distancia mínima entre clusters
-        min_inter_distance = np.inf
-        for i in range(len(unique_labels)):
-            for j in range(i + 1, len(unique_labels)):
-                cluster_i = X[labels == unique_labels[i]]
-                cluster_j = X[labels == unique_labels[j]]
-                
-                # Distancia mínima entre puntos de diferentes clusters
-                for point_i in cluster_i:
-                    for point_j in cluster_j:
-                        dist = 1 - cos_sim(point_i, point_j)
-                        min_inter_distance = min(min_inter_distance, dist)
-        
-        # Distancia máxima dentro de clusters
-        max_intra_distance = 0
-        for label in unique_labels:
-            cluster_points = X[labels == label]
-            if len(cluster_points) <= 1:
-                continue
-            
-            # Calcular distancia máxima dentro del cluster
-            for i in range(len(cluster_points)):
-                for j in range(i + 1, len(cluster_points)):
-                    dist = 1 - cos_sim(cluster_points[i], cluster_points[j])
-                    max_intra_distance = max(max_intra_distance, dist)
-        
-        if max_intra_distance == 0 or min_inter_distance == np.inf:
-            return 0.0
-        
-        return float(min_inter_distance / max_intra_distance)
+        return dunn_index(self.store.vectors, self.store.labels, norms=self.store.norms)
 
-    def calculate_silhouette_coefficient(self) -> float:
+    def calculate_silhouette_coefficient(
+        self, approximate: bool = False, sample_size: int = 2000, seed: int | None = 0
+    ) -> float:
         """
         Calcula el Coeficiente de Silueta usando los vectores reales
         Rango: [-1, 1], valores más altos indican mejor clustering
+        Con approximate=True usa una muestra estratificada por cluster
+        (ver estimate_silhouette_coefficient para el intervalo de confianza).
         """
-        if len(self.all_vectors) == 0 or len(self.clusters) <= 1:
-            return 0.0
-        
-        X = np.array(self.all_vectors)
-        labels = np.array(self.all_labels)
-        unique_labels = np.unique(labels)
+        if approximate:
+            return self.estimate_silhouette_coefficient(sample_size, seed)["value"]
         
-        if len(unique_labels) <= 1:
+        if len(self.all_vectors) == 0 or len(self.clusters) <= 1:
             return 0.0
         
-        silhouette_scores = []
-        
-        for i, point in enumerate(X):
-            own_label = labels[i]
-            own_cluster = X[labels == own_label]
-            
-            # a(i) = distancia promedio al resto de puntos en su cluster
-            if len(own_cluster) <= 1:
-                a_i = 0
-            else:
-                distances = [1 - cos_sim(point, other) for other in own_cluster if not np.array_equal(point, other)]
-                a_i = np.mean(distances) if distances else 0
-            
-            # b(i) = distancia promedio mínima a puntos de otros clusters
-            b_values = []
-            for label in unique_labels:
-                if label != own_label:
-                    other_cluster = X[labels == label]
-                    distances = [1 - cos_sim(point, other) for other in other_cluster]
-                    b_values.append(np.mean(distances))
-            
-            if not b_values:
-                b_i = a_i
-            else:
-                b_i = min(b_values)
-            
-            # Silueta para el punto i
-            if max(a_i, b_i) > 0:
-                s_i = (b_i - a_i) / max(a_i, b_i)
-            else:
-                s_i = 0.0
-            
-            silhouette_scores.append(s_i)
+        return silhouette_coefficient(self.store.vectors, self.store.labels, norms=self.store.norms)
+
+    def estimate_silhouette_coefficient(
+        self, sample_size: int = 2000, seed: int | None = 0, confidence: float = 0.95
+    ) -> dict:
+        """
+        Silueta aproximada por muestreo estratificado sobre all_labels.
+        Retorna el estimado junto con su intervalo de confianza.
+        """
+        if len(self.all_vectors) == 0 or len(self.clusters) <= 1:
+            return {"value": 0.0, "ci_low": 0.0, "ci_high": 0.0, "std_error": 0.0, "sample_size": 0}
         
-        return float(np.mean(silhouette_scores)) if silhouette_scores else 0.0
+        return sampled_silhouette(
+            self.store.vectors, self.store.labels,
+            sample_size=sample_size, seed=seed, confidence=confidence, norms=self.store.norms
+        )
 
     def calculate_external_metrics(self) -> dict:
         """
@@ -373,17 +502,29 @@ class LinksClusterCapacityOnline:
         """Verifica si hay etiquetas verdaderas disponibles para evaluación externa"""
         return len(self.true_labels) > 0 and len(self.true_labels) == len(self.all_labels)
     
-    def get_comprehensive_metrics(self) -> dict:
+    def get_comprehensive_metrics(self, silhouette_sample_size: int | None = None, seed: int | None = 0) -> dict:
         """
         Retorna métricas completas:
         - Métricas internas (Dunn Index, Silhouette)
         - Métricas externas (NMI, ARI, AMI) si hay etiquetas verdaderas
+        Si se indica silhouette_sample_size, la silueta se estima por muestreo
+        y se incluye su intervalo de confianza.
         """
+        internal = {"dunn_index": self.calculate_dunn_index()}
+        if silhouette_sample_size:
+            estimate = self.estimate_silhouette_coefficient(silhouette_sample_size, seed)
+            internal["silhouette_coefficient"] = estimate["value"]
+            internal["silhouette_estimate"] = {
+                "method": "sampled",
+                "sample_size": estimate["sample_size"],
+                "confidence_interval": [estimate["ci_low"], estimate["ci_high"]],
+                "std_error": estimate["std_error"],
+            }
+        else:
+            internal["silhouette_coefficient"] = self.calculate_silhouette_coefficient()
+        
         metrics = {
-            "internal_metrics": {
-                "dunn_index": self.calculate_dunn_index(),
-                "silhouette_coefficient": self.calculate_silhouette_coefficient()
-            },
+            "internal_metrics": internal,
             "cluster_info": {
                 "total_points": len(self.all_vectors),
                 "num_clusters": len(self.clusters),
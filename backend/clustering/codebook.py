@@ -0,0 +1,221 @@
+"""
+Codebook visual para SIFT: k-means por mini-lotes (inicialización k-means++
+y pasos incrementales) y codificación BoVW (histograma de palabras visuales)
+o VLAD (residuos por palabra).
+"""
+import os
+import uuid
+
+import numpy as np
+
+CODIFICACIONES = ("bovw", "vlad")
+
+# Filas por bloque en la asignación a la palabra más cercana (acota la matriz de distancias)
+ASIGNACION_CHUNK = 8192
+
+
+class VisualCodebook:
+    """
+    K palabras visuales (float32, K x D). Mientras no hay al menos K
+    descriptores, se acumulan en `pendientes`; al alcanzarlos se inicializa
+    con k-means++ y unas pocas iteraciones de Lloyd sobre ese primer lote.
+    Después cada partial_fit aplica un paso de k-means por mini-lotes
+    (tasa de aprendizaje 1/n por palabra, Sculley 2010).
+    """
+
+    def __init__(self, k: int = 64, dim: int = 128, seed: int = 0, max_init_samples: int = 20000, init_iters: int = 10):
+        if int(k) <= 0:
+            raise ValueError("El tamaño del codebook debe ser > 0")
+        self.k = int(k)
+        self.dim = int(dim)
+        self.seed = int(seed)
+        self.max_init_samples = int(max_init_samples)
+        self.init_iters = int(init_iters)
+
+        self.centers: np.ndarray | None = None
+        self.counts = np.zeros(self.k, dtype=np.int64)
+        self.pendientes = np.empty((0, self.dim), dtype=np.float32)
+        self.n_descriptores = 0
+        self.n_actualizaciones = 0
+        # Imágenes con que se entrenó y las ingeridas desde entonces
+        self.n_imagenes = 0
+        self.imagenes_nuevas = 0
+        # Identifica la versión del codebook (cambia en cada actualización)
+        self.version_id = uuid.uuid4().hex[:12]
+
+    @property
+    def ready(self) -> bool:
+        return self.centers is not None
+
+    def output_dim(self, encoding: str) -> int:
+        if encoding == "bovw":
+            return self.k
+        if encoding == "vlad":
+            return self.k * self.dim
+        raise ValueError(f"Codificación no válida: {encoding} (use {', '.join(CODIFICACIONES)})")
+
+    def _as_descriptores(self, descriptores) -> np.ndarray:
+        X = np.asarray(descriptores, dtype=np.float32)
+        if X.size == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.dim:
+            raise ValueError(f"Se esperaban descriptores de dimensión {self.dim}")
+        return X
+
+    # ---------- asignación ----------
+
+    def assign(self, descriptores) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Palabra más cercana de cada descriptor (distancia euclídea) con
+        ||x||² - 2·x·c + ||c||² en bloques. Retorna (índices, distancias²).
+        Coste lineal en el número de descriptores.
+        """
+        if not self.ready:
+            raise ValueError("El codebook visual aún no está inicializado")
+        X = self._as_descriptores(descriptores)
+        indices = np.empty(len(X), dtype=np.int64)
+        distancias = np.empty(len(X), dtype=np.float32)
+        c_norms = np.einsum("ij,ij->i", self.centers, self.centers)
+        for inicio in range(0, len(X), ASIGNACION_CHUNK):
+            bloque = X[inicio:inicio + ASIGNACION_CHUNK]
+            d2 = c_norms[None, :] - 2.0 * (bloque @ self.centers.T)
+            idx = np.argmin(d2, axis=1)
+            indices[inicio:inicio + len(bloque)] = idx
+            x_norms = np.einsum("ij,ij->i", bloque, bloque)
+            distancias[inicio:inicio + len(bloque)] = np.maximum(d2[np.arange(len(bloque)), idx] + x_norms, 0.0)
+        return indices, distancias
+
+    # ---------- entrenamiento ----------
+
+    def _kmeans_pp(self, X: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        centers = np.empty((self.k, self.dim), dtype=np.float32)
+        centers[0] = X[rng.integers(len(X))]
+        d2 = np.einsum("ij,ij->i", X - centers[0], X - centers[0]).astype(np.float64)
+        for i in range(1, self.k):
+            total = d2.sum()
+            j = rng.choice(len(X), p=d2 / total) if total > 0 else rng.integers(len(X))
+            centers[i] = X[j]
+            diff = X - centers[i]
+            d2 = np.minimum(d2, np.einsum("ij,ij->i", diff, diff))
+        return centers
+
+    def _inicializar(self, X: np.ndarray):
+        rng = np.random.default_rng(self.seed)
+        if len(X) > self.max_init_samples:
+            X = X[rng.choice(len(X), self.max_init_samples, replace=False)]
+
+        self.centers = self._kmeans_pp(X, rng)
+        for _ in range(self.init_iters):
+            idx, _ = self.assign(X)
+            sums, counts = self._sumas_por_palabra(X, idx)
+            ocupadas = counts > 0
+            self.centers[ocupadas] = (sums[ocupadas] / counts[ocupadas, None]).astype(np.float32)
+        idx, _ = self.assign(X)
+        self.counts = np.bincount(idx, minlength=self.k).astype(np.int64)
+
+    def _sumas_por_palabra(self, X: np.ndarray, idx: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Suma de los descriptores asignados a cada palabra con un producto one-hot"""
+        onehot = np.zeros((self.k, len(X)), dtype=np.float32)
+        onehot[idx, np.arange(len(X))] = 1.0
+        return (onehot @ X).astype(np.float64), np.bincount(idx, minlength=self.k)
+
+    def partial_fit(self, descriptores) -> "VisualCodebook":
+        """Actualiza el codebook con un mini-lote de descriptores (N x D)"""
+        X = self._as_descriptores(descriptores)
+        if len(X) == 0:
+            return self
+        self.n_descriptores += len(X)
+
+        if not self.ready:
+            self.pendientes = np.concatenate([self.pendientes, X])
+            if len(self.pendientes) >= self.k:
+                self._inicializar(self.pendientes)
+                self.pendientes = np.empty((0, self.dim), dtype=np.float32)
+                self.n_actualizaciones += 1
+                self.version_id = uuid.uuid4().hex[:12]
+            return self
+
+        idx, _ = self.assign(X)
+        sums, counts = self._sumas_por_palabra(X, idx)
+        ocupadas = counts > 0
+        self.counts[ocupadas] += counts[ocupadas]
+        # c <- c + (Σx - n·c) / n_total: media móvil con tasa 1/n por palabra
+        paso = (sums[ocupadas] - counts[ocupadas, None] * self.centers[ocupadas]) / self.counts[ocupadas, None]
+        self.centers[ocupadas] = (self.centers[ocupadas] + paso).astype(np.float32)
+        self.n_actualizaciones += 1
+        self.version_id = uuid.uuid4().hex[:12]
+        return self
+
+    # ---------- codificación ----------
+
+    def bovw(self, descriptores) -> np.ndarray:
+        """Histograma de palabras visuales (K,) normalizado L2"""
+        X = self._as_descriptores(descriptores)
+        hist = np.zeros(self.k, dtype=np.float64)
+        if len(X) == 0:
+            return hist
+        idx, _ = self.assign(X)
+        hist += np.bincount(idx, minlength=self.k)
+        return hist / np.linalg.norm(hist)
+
+    def vlad(self, descriptores) -> np.ndarray:
+        """
+        VLAD (K·D,): suma de residuos x - c por palabra, normalización de
+        potencia (raíz con signo) y L2
+        """
+        X = self._as_descriptores(descriptores)
+        vlad = np.zeros((self.k, self.dim), dtype=np.float64)
+        if len(X) == 0:
+            return vlad.ravel()
+        idx, _ = self.assign(X)
+        sums, counts = self._sumas_por_palabra(X, idx)
+        vlad = sums - counts[:, None] * self.centers.astype(np.float64)
+        vlad = np.sign(vlad) * np.sqrt(np.abs(vlad))
+        norm = np.linalg.norm(vlad)
+        return (vlad / norm if norm > 0 else vlad).ravel()
+
+    def encode(self, descriptores, encoding: str = "bovw") -> np.ndarray:
+        if encoding == "bovw":
+            return self.bovw(descriptores)
+        if encoding == "vlad":
+            return self.vlad(descriptores)
+        raise ValueError(f"Codificación no válida: {encoding} (use {', '.join(CODIFICACIONES)})")
+
+    # ---------- persistencia ----------
+
+    def save(self, path: str):
+        """Guarda el codebook en .npz (escritura atómica: temporal + rename)"""
+        temporal = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temporal, "wb") as f:
+            np.savez(
+                f,
+                k=self.k,
+                dim=self.dim,
+                seed=self.seed,
+                centers=self.centers if self.ready else np.empty((0, self.dim), dtype=np.float32),
+                counts=self.counts,
+                pendientes=self.pendientes,
+                n_descriptores=self.n_descriptores,
+                n_actualizaciones=self.n_actualizaciones,
+                n_imagenes=self.n_imagenes,
+                imagenes_nuevas=self.imagenes_nuevas,
+                version_id=self.version_id,
+            )
+        os.replace(temporal, path)
+
+    @classmethod
+    def load(cls, path: str) -> "VisualCodebook":
+        with np.load(path) as data:
+            codebook = cls(k=int(data["k"]), dim=int(data["dim"]), seed=int(data["seed"]))
+            centers = data["centers"].astype(np.float32)
+            codebook.centers = centers if len(centers) else None
+            codebook.counts = data["counts"].astype(np.int64)
+            codebook.pendientes = data["pendientes"].astype(np.float32)
+            codebook.n_descriptores = int(data["n_descriptores"])
+            codebook.n_actualizaciones = int(data["n_actualizaciones"])
+            if "version_id" in data.files:
+                codebook.version_id = str(data["version_id"])
+            if "n_imagenes" in data.files:
+                codebook.n_imagenes = int(data["n_imagenes"])
+                codebook.imagenes_nuevas = int(data["imagenes_nuevas"])
+        return codebook
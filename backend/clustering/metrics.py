@@ -0,0 +1,352 @@
+"""
+Métricas internas vectorizadas (Dunn, Silueta) con distancia coseno.
+
+Los vectores pueden venir en float32 (VectorStore): las normas se calculan
+una sola vez y cada bloque se normaliza en float64 al vuelo, de modo que las
+distancias 1 - cos(a, b) se calculan por bloques con productos matriciales
+en float64 usando memoria O(chunk_size * n) en lugar de O(n²).
+Las reducciones por cluster (diámetros, mínimos entre clusters, sumas
+para a(i)/b(i)) se hacen agrupando columnas por etiqueta.
+"""
+import copy
+from statistics import NormalDist
+
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 512
+
+
+def row_norms(X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Normas L2 (float64) de cada fila, sin copiar la matriz. Retorna
+    (norms, valid) donde valid marca las filas con norma > 0.
+    """
+    X = np.asarray(X)
+    norms = np.sqrt(np.einsum("ij,ij->i", X, X, dtype=np.float64))
+    return norms, norms > 0
+
+
+def unit_rows(X: np.ndarray, norms: np.ndarray, valid: np.ndarray, idx) -> np.ndarray:
+    """
+    Filas `idx` normalizadas en float64 (las filas nulas quedan en cero).
+    Permite guardar los vectores en float32 y calcular distancias en float64.
+    """
+    block = np.asarray(X[idx], dtype=np.float64)
+    out = np.zeros_like(block)
+    np.divide(block, norms[idx][:, None], out=out, where=valid[idx][:, None])
+    return out
+
+
+def iter_distance_blocks(
+    X: np.ndarray,
+    norms: np.ndarray,
+    valid: np.ndarray,
+    rows: np.ndarray | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+):
+    """
+    Genera (start, stop, D) con D = 1 - cos(X[rows[start:stop]], X) en float64
+    (todas las filas si rows es None). Los bloques de columnas se normalizan
+    al vuelo, así que X puede ser float32 sin perder precisión en D. Igual que
+    cos_sim, un vector nulo tiene similitud -1 (distancia 2); la distancia de
+    un punto a sí mismo es 0.
+    """
+    n = X.shape[0]
+    m = n if rows is None else len(rows)
+    chunk_size = max(1, int(chunk_size))
+    for start in range(0, m, chunk_size):
+        stop = min(m, start + chunk_size)
+        block = slice(start, stop) if rows is None else rows[start:stop]
+        U = unit_rows(X, norms, valid, block)
+        D = np.empty((stop - start, n), dtype=np.float64)
+        for col in range(0, n, chunk_size):
+            col_stop = min(n, col + chunk_size)
+            D[:, col:col_stop] = U @ unit_rows(X, norms, valid, slice(col, col_stop)).T
+        # 1 - cos >= 0: se recorta el ruido de redondeo de vectores casi paralelos
+        np.clip(np.subtract(1.0, D, out=D), 0.0, None, out=D)
+        D[~valid[block], :] = 2.0
+        D[:, ~valid] = 2.0
+        own_cols = np.arange(start, stop) if rows is None else rows[start:stop]
+        D[np.arange(stop - start), own_cols] = 0.0
+        yield start, stop, D
+
+
+def _group_columns(labels: np.ndarray):
+    """
+    Ordena las columnas por etiqueta para reducir con reduceat.
+    Retorna (unique_labels, label_idx, order, starts, counts).
+    """
+    unique_labels, label_idx, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    order = np.argsort(label_idx, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return unique_labels, label_idx, order, starts, counts
+
+
+def cluster_distance_extremes(
+    X: np.ndarray, labels: np.ndarray, chunk_size: int = DEFAULT_CHUNK_SIZE, norms: np.ndarray | None = None
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Calcula por cluster el diámetro (máxima distancia intra) y la matriz
+    k x k de distancias mínimas entre clusters. Se pueden pasar las normas
+    ya calculadas (p. ej. las del VectorStore).
+    Retorna (unique_labels, diameters, inter_min).
+    """
+    labels = np.asarray(labels)
+    X = np.asarray(X)
+    norms, valid = row_norms(X) if norms is None else (norms, norms > 0)
+    unique_labels, label_idx, order, starts, _ = _group_columns(labels)
+    k = len(unique_labels)
+
+    diameters = np.zeros(k, dtype=np.float64)
+    inter_min = np.full((k, k), np.inf, dtype=np.float64)
+
+    for start, stop, D in iter_distance_blocks(X, norms, valid, chunk_size=chunk_size):
+        row_idx = label_idx[start:stop]
+        Ds = D[:, order]
+        block_min = np.minimum.reduceat(Ds, starts, axis=1)
+        block_max = np.maximum.reduceat(Ds, starts, axis=1)
+
+        own_max = block_max[np.arange(stop - start), row_idx]
+        np.maximum.at(diameters, row_idx, own_max)
+        np.minimum.at(inter_min, row_idx, block_min)
+
+    np.fill_diagonal(inter_min, np.inf)
+    return unique_labels, diameters, inter_min
+
+
+def dunn_index(
+    X: np.ndarray, labels: np.ndarray, chunk_size: int = DEFAULT_CHUNK_SIZE, norms: np.ndarray | None = None
+) -> float:
+    """
+    DI = min_distance_between_clusters / max_distance_within_cluster
+    """
+    labels = np.asarray(labels)
+    if len(labels) == 0 or len(np.unique(labels)) <= 1:
+        return 0.0
+
+    _, diameters, inter_min = cluster_distance_extremes(X, labels, chunk_size, norms)
+    return dunn_from_extremes(diameters, inter_min)
+
+
+def dunn_from_extremes(diameters: np.ndarray, inter_min: np.ndarray) -> float:
+    """
+    Índice de Dunn a partir de diámetros e inter-mínimos ya calculados (O(k²))
+    """
+    max_intra_distance = max(0.0, float(np.max(diameters))) if len(diameters) else 0.0
+    min_inter_distance = float(np.min(inter_min)) if inter_min.size else np.inf
+
+    if max_intra_distance == 0 or min_inter_distance == np.inf:
+        return 0.0
+
+    return float(min_inter_distance / max_intra_distance)
+
+
+def silhouette_values(
+    X: np.ndarray,
+    labels: np.ndarray,
+    rows: np.ndarray | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    norms: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Silueta s(i) para las filas indicadas (todas por defecto), usando las
+    distancias a todos los puntos. a(i) excluye al propio punto; un punto
+    solo en su cluster tiene a(i) = 0.
+    """
+    labels = np.asarray(labels)
+    X = np.asarray(X)
+    norms, valid = row_norms(X) if norms is None else (norms, norms > 0)
+    unique_labels, label_idx, order, starts, counts = _group_columns(labels)
+    k = len(unique_labels)
+
+    if rows is None:
+        rows = np.arange(len(labels))
+    rows = np.asarray(rows, dtype=np.int64)
+
+    values = np.empty(len(rows), dtype=np.float64)
+
+    for start, stop, D in iter_distance_blocks(X, norms, valid, rows, chunk_size):
+        own = label_idx[rows[start:stop]]
+        sums = np.add.reduceat(D[:, order], starts, axis=1)
+        # La distancia del punto consigo mismo es 0, solo se descuenta del conteo
+        own_sums = sums[np.arange(stop - start), own]
+
+        own_counts = counts[own]
+        a = np.where(own_counts > 1, own_sums / np.maximum(own_counts - 1, 1), 0.0)
+
+        means = sums / counts[None, :]
+        means[np.arange(stop - start), own] = np.inf
+        b = means.min(axis=1) if k > 1 else a
+
+        denom = np.maximum(a, b)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values[start:stop] = np.where(denom > 0, (b - a) / denom, 0.0)
+
+    return values
+
+
+def silhouette_coefficient(
+    X: np.ndarray, labels: np.ndarray, chunk_size: int = DEFAULT_CHUNK_SIZE, norms: np.ndarray | None = None
+) -> float:
+    """
+    Coeficiente de Silueta medio. Rango: [-1, 1]
+    """
+    labels = np.asarray(labels)
+    if len(labels) == 0 or len(np.unique(labels)) <= 1:
+        return 0.0
+
+    values = silhouette_values(X, labels, chunk_size=chunk_size, norms=norms)
+    return float(np.mean(values)) if len(values) else 0.0
+
+
+class IncrementalDunn:
+    """
+    Mantiene el Índice de Dunn de forma incremental para un modelo online.
+
+    En cada inserción se calculan (vectorizado, O(n·d)) las distancias del
+    nuevo vector a los ya asignados, leídos directamente del VectorStore del
+    modelo, y se actualizan el diámetro de su cluster y su fila/columna de la
+    matriz k x k de inter-mínimos. Consultar el índice cuesta O(k²).
+    """
+
+    def __init__(self, k: int, store):
+        self.k = int(k)
+        self.store = store
+        self.diameters = np.zeros(self.k, dtype=np.float64)
+        self.inter_min = np.full((self.k, self.k), np.inf, dtype=np.float64)
+        # Número de filas del almacén ya incorporadas al estado
+        self.n = 0
+
+    def add(self, x: np.ndarray, label: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        """Registra un vector asignado al cluster `label`"""
+        # Misma precisión que la fila guardada en el almacén (float32)
+        x = np.asarray(x, dtype=np.float32).astype(np.float64)
+        norm = np.linalg.norm(x)
+
+        n = self.n
+        if n > 0:
+            labels = self.store.labels[:n]
+            if norm > 0:
+                X, norms = self.store.vectors, self.store.norms
+                valid = norms[:n] > 0
+                xn = x / norm
+                D = np.empty(n, dtype=np.float64)
+                # Producto en float64 por bloques de filas (el almacén es float32)
+                for start in range(0, n, chunk_size):
+                    stop = min(n, start + chunk_size)
+                    D[start:stop] = unit_rows(X, norms, valid, slice(start, stop)) @ xn
+                np.clip(np.subtract(1.0, D, out=D), 0.0, None, out=D)
+                D[~valid] = 2.0
+            else:
+                D = np.full(n, 2.0)
+
+            own = labels == label
+            if own.any():
+                self.diameters[label] = max(self.diameters[label], float(D[own].max()))
+
+            row = np.full(self.k, np.inf)
+            np.minimum.at(row, labels, D)
+            row[label] = np.inf
+            self.inter_min[label] = np.minimum(self.inter_min[label], row)
+            self.inter_min[:, label] = self.inter_min[label]
+
+        self.n = n + 1
+
+    def snapshot(self, store=None) -> "IncrementalDunn":
+        """Copia de los extremos actuales (opcionalmente sobre otra vista del almacén)"""
+        snap = copy.copy(self)
+        snap.diameters = self.diameters.copy()
+        snap.inter_min = self.inter_min.copy()
+        if store is not None:
+            snap.store = store
+        return snap
+
+    def dunn(self) -> float:
+        """Índice de Dunn actual en O(k²)"""
+        return dunn_from_extremes(self.diameters, self.inter_min)
+
+    @classmethod
+    def from_store(cls, k: int, store, chunk_size: int = DEFAULT_CHUNK_SIZE) -> "IncrementalDunn":
+        """Inicializa el estado con un recálculo completo (p. ej. al cargar un modelo)"""
+        state = cls(k, store)
+        if len(store) == 0:
+            return state
+
+        unique_labels, diameters, inter_min = cluster_distance_extremes(
+            store.vectors, store.labels, chunk_size, store.norms
+        )
+        state.diameters[unique_labels] = diameters
+        state.inter_min[np.ix_(unique_labels, unique_labels)] = inter_min
+        state.n = len(store)
+        return state
+
+
+def stratified_sample(labels: np.ndarray, sample_size: int, seed: int | None = None) -> np.ndarray:
+    """
+    Muestreo estratificado por cluster con asignación proporcional y al
+    menos dos puntos por cluster (o el cluster entero si tiene menos), para
+    poder estimar la varianza de cada estrato. Retorna los índices ordenados.
+    """
+    labels = np.asarray(labels)
+    n = len(labels)
+    if sample_size >= n:
+        return np.arange(n)
+
+    rng = np.random.default_rng(seed)
+    unique_labels, label_idx, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    quotas = np.maximum(2, np.floor(sample_size * counts / n).astype(np.int64))
+    quotas = np.minimum(quotas, counts)
+
+    rows = []
+    for idx, quota in enumerate(quotas):
+        members = np.flatnonzero(label_idx == idx)
+        rows.append(rng.choice(members, size=int(quota), replace=False))
+    return np.sort(np.concatenate(rows))
+
+
+def sampled_silhouette(
+    X: np.ndarray,
+    labels: np.ndarray,
+    sample_size: int = 2000,
+    seed: int | None = 0,
+    confidence: float = 0.95,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    norms: np.ndarray | None = None,
+) -> dict:
+    """
+    Silueta aproximada: s(i) exacto para una muestra estratificada por cluster
+    (distancias contra todos los puntos, O(m·n·d)) y estimador estratificado
+    de la media con su intervalo de confianza normal.
+    Retorna {"value", "ci_low", "ci_high", "std_error", "sample_size"}.
+    """
+    labels = np.asarray(labels)
+    n = len(labels)
+    if n == 0 or len(np.unique(labels)) <= 1:
+        return {"value": 0.0, "ci_low": 0.0, "ci_high": 0.0, "std_error": 0.0, "sample_size": 0}
+
+    rows = stratified_sample(labels, sample_size, seed)
+    values = silhouette_values(X, labels, rows=rows, chunk_size=chunk_size, norms=norms)
+
+    # Estimador estratificado: media ponderada por tamaño de cada cluster
+    unique_labels, counts = np.unique(labels, return_counts=True)
+    sample_labels = labels[rows]
+    estimate, variance = 0.0, 0.0
+    for label, N_h in zip(unique_labels, counts):
+        s_h = values[sample_labels == label]
+        m_h = len(s_h)
+        w_h = N_h / n
+        estimate += w_h * float(np.mean(s_h))
+        if m_h > 1:
+            # Varianza con corrección por población finita (un estrato de un
+            # solo punto es un cluster de un punto: observado entero, sin varianza)
+            variance += w_h ** 2 * float(np.var(s_h, ddof=1)) / m_h * (1.0 - m_h / N_h)
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    std_error = float(np.sqrt(variance))
+    return {
+        "value": float(estimate),
+        "ci_low": float(max(-1.0, estimate - z * std_error)),
+        "ci_high": float(min(1.0, estimate + z * std_error)),
+        "std_error": std_error,
+        "sample_size": int(len(rows)),
+    }
@@ -0,0 +1,165 @@
+"""
+Almacén contiguo de los vectores asignados por un modelo de clustering online.
+
+Los vectores se guardan como una matriz float32 preasignada con crecimiento
+amortizado x2 (opcionalmente respaldada por un archivo mapeado en memoria),
+junto con sus normas L2 (float64) y las etiquetas int32 en arreglos paralelos.
+Las métricas trabajan directamente sobre estas vistas, sin re-apilar listas.
+"""
+import copy
+import os
+import tempfile
+
+import numpy as np
+
+INITIAL_CAPACITY = 16
+
+
+def _grow_array(array: np.ndarray, used: int, min_rows: int) -> np.ndarray:
+    """Copia las primeras `used` filas en un arreglo con capacidad >= min_rows"""
+    new_cap = max(INITIAL_CAPACITY, 2 * array.shape[0], min_rows)
+    grown = np.empty((new_cap,) + array.shape[1:], dtype=array.dtype)
+    grown[:used] = array[:used]
+    return grown
+
+
+class VectorStore:
+    """
+    Vectores (float32), normas (float64), etiquetas de cluster, fila de
+    subcluster y etiquetas verdaderas (int32) de cada asignación. Las
+    etiquetas verdaderas se guardan compactas (solo las proporcionadas) y
+    has_true marca qué filas tienen una.
+
+    Solo se anexan filas: las vistas tomadas con snapshot() siguen siendo
+    válidas aunque el almacén crezca (el crecimiento reasigna los buffers).
+    """
+
+    def __init__(self, dim: int | None = None, mmap_dir: str | None = None):
+        self.mmap_dir = mmap_dir or None
+        self.n = 0
+        self.n_true = 0
+        self._vectors = np.empty((0, dim or 0), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float64)
+        self._labels = np.empty(0, dtype=np.int32)
+        self._subclusters = np.empty(0, dtype=np.int32)
+        self._has_true = np.empty(0, dtype=bool)
+        self._true_labels = np.empty(0, dtype=np.int32)
+
+    def _allocate_vectors(self, rows: int, dim: int) -> np.ndarray:
+        if self.mmap_dir:
+            # Archivo temporal anónimo: se libera solo al cerrar el mapeo
+            os.makedirs(self.mmap_dir, exist_ok=True)
+            backing = tempfile.TemporaryFile(dir=self.mmap_dir, suffix=".f32")
+            return np.memmap(backing, dtype=np.float32, mode="w+", shape=(rows, dim))
+        return np.empty((rows, dim), dtype=np.float32)
+
+    def _reserve(self, rows: int, dim: int) -> None:
+        """Garantiza capacidad para `rows` filas de dimensión `dim`"""
+        if self.n == 0 and self._vectors.shape[1] != dim:
+            self._vectors = self._allocate_vectors(max(INITIAL_CAPACITY, rows), dim)
+        elif rows > self._vectors.shape[0]:
+            new_cap = max(INITIAL_CAPACITY, 2 * self._vectors.shape[0], rows)
+            vectors = self._allocate_vectors(new_cap, dim)
+            vectors[:self.n] = self._vectors[:self.n]
+            self._vectors = vectors
+        if rows > self._labels.shape[0]:
+            self._norms = _grow_array(self._norms, self.n, rows)
+            self._labels = _grow_array(self._labels, self.n, rows)
+            self._subclusters = _grow_array(self._subclusters, self.n, rows)
+            self._has_true = _grow_array(self._has_true, self.n, rows)
+
+    def append(self, x: np.ndarray, label: int, subcluster: int = -1, true_label: int | None = None) -> int:
+        """Anexa un vector asignado y retorna su índice"""
+        x = np.asarray(x, dtype=np.float32).reshape(-1)
+        n = self.n
+        self._reserve(n + 1, x.shape[0])
+        self._vectors[n] = x
+        self._norms[n] = np.linalg.norm(x.astype(np.float64))
+        self._labels[n] = label
+        self._subclusters[n] = subcluster
+        self._has_true[n] = true_label is not None
+        if true_label is not None:
+            if self.n_true == self._true_labels.shape[0]:
+                self._true_labels = _grow_array(self._true_labels, self.n_true, self.n_true + 1)
+            self._true_labels[self.n_true] = true_label
+            self.n_true += 1
+        self.n = n + 1
+        return n
+
+    def extend(
+        self,
+        vectors: np.ndarray,
+        labels: np.ndarray,
+        subclusters: np.ndarray | None = None,
+        true_labels: np.ndarray | None = None,
+        has_true: np.ndarray | None = None,
+    ) -> None:
+        """
+        Anexa un bloque de asignaciones (p. ej. al restaurar un snapshot).
+        has_true indica qué filas tienen etiqueta verdadera; sin él se asume
+        que las true_labels corresponden a las primeras filas del bloque.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        m = len(labels)
+        if m == 0:
+            return
+        vectors = vectors.reshape(m, -1)
+        n = self.n
+        self._reserve(n + m, vectors.shape[1])
+        self._vectors[n:n + m] = vectors
+        self._norms[n:n + m] = np.sqrt(np.einsum("ij,ij->i", vectors, vectors, dtype=np.float64))
+        self._labels[n:n + m] = labels
+        self._subclusters[n:n + m] = -1 if subclusters is None else subclusters
+        t = 0 if true_labels is None else len(true_labels)
+        if has_true is not None and len(has_true) == m:
+            self._has_true[n:n + m] = has_true
+        else:
+            self._has_true[n:n + m] = np.arange(m) < t
+        if t:
+            self._true_labels = _grow_array(self._true_labels, self.n_true, self.n_true + t)
+            self._true_labels[self.n_true:self.n_true + t] = true_labels
+            self.n_true += t
+        self.n = n + m
+
+    def __len__(self) -> int:
+        return self.n
+
+    @property
+    def dim(self) -> int:
+        return int(self._vectors.shape[1])
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self.n]
+
+    @property
+    def norms(self) -> np.ndarray:
+        return self._norms[:self.n]
+
+    @property
+    def labels(self) -> np.ndarray:
+        return self._labels[:self.n]
+
+    @property
+    def subclusters(self) -> np.ndarray:
+        return self._subclusters[:self.n]
+
+    @property
+    def has_true(self) -> np.ndarray:
+        return self._has_true[:self.n]
+
+    @property
+    def true_labels(self) -> np.ndarray:
+        return self._true_labels[:self.n_true]
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria reservada por los buffers (incluye capacidad libre)"""
+        return int(
+            self._vectors.nbytes + self._norms.nbytes + self._labels.nbytes
+            + self._subclusters.nbytes + self._has_true.nbytes + self._true_labels.nbytes
+        )
+
+    def snapshot(self) -> "VectorStore":
+        """Vista de solo lectura con el número de filas actual (comparte buffers)"""
+        return copy.copy(self)
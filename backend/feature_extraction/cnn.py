@@ -2,6 +2,8 @@ import cv2
 import numpy as np
 from sklearn.preprocessing import normalize
 
+from preprocesamiento.preprocesamiento import decodificar_imagen, codificar_png
+
 # Singleton para el modelo CNN
 _cnn_model = None
 
@@ -17,45 +19,73 @@ def get_cnn_model():
             raise ValueError("TensorFlow no está instalado")
     return _cnn_model
 
-def procesar_cnn_con_descriptores(image_bytes: bytes):
+def _entrada_cnn(img: np.ndarray) -> tuple:
     """
-    Extrae características CNN de una imagen usando ResNet50
+    Redimensiona a 256x256 (entrada del modelo) y convierte a RGB
+    (replicando el canal si la imagen es gris). Retorna (img_resized, img_rgb).
+    """
+    img_resized = img
+    if img.shape[:2] != (256, 256):
+        img_resized = cv2.resize(img, (256, 256), interpolation=cv2.INTER_AREA)
+
+    if img_resized.ndim == 2:
+        img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_GRAY2RGB)
+    else:
+        img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
+    return img_resized, img_rgb
+
+
+def procesar_cnn_lote(imagenes: list, batch_size: int = 32) -> list:
+    """
+    Extrae características CNN de varias imágenes ya decodificadas (gris o BGR)
+    con una sola llamada al modelo: todas se preprocesan en un único tensor
+    N x 256 x 256 x 3 y la inferencia se hace en lotes de `batch_size`.
+    Retorna [(img_resized, vector normalizado)] en el mismo orden de entrada.
     """
     try:
         from tensorflow.keras.applications.resnet50 import preprocess_input
-        from tensorflow.keras.preprocessing.image import img_to_array
     except ImportError:
         raise ValueError("TensorFlow no está instalado")
 
-    # Decodificar imagen
-    img_array = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-    if img is None:
-        raise ValueError("No se pudo decodificar la imagen")
-
-    # Redimensionar a 256x256 (entrada del modelo)
-    img_resized = cv2.resize(img, (256, 256), interpolation=cv2.INTER_AREA)
-    
-    # Convertir BGR a RGB
-    img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
-    
-    # Preprocesar para ResNet50
-    x = img_to_array(img_rgb)
-    x = np.expand_dims(x, axis=0)
+    if not imagenes:
+        return []
+
+    visualizaciones = []
+    x = np.empty((len(imagenes), 256, 256, 3), dtype=np.float32)
+    for i, img in enumerate(imagenes):
+        img_resized, img_rgb = _entrada_cnn(img)
+        visualizaciones.append(img_resized)
+        x[i] = img_rgb
+
+    # Preprocesar para ResNet50 y extraer características por lotes
     x = preprocess_input(x)
-    
-    # Obtener modelo y extraer características
     model = get_cnn_model()
-    features = model.predict(x, verbose=0)
-    features_flat = features.flatten()
-    
-    # Normalizar características
-    features_normalized = normalize(features_flat.reshape(1, -1), norm='l2')[0]
-    
-    # Crear imagen de visualización (opcional - mostrar imagen original)
-    success, buffer = cv2.imencode(".png", img_resized)
-    if not success:
-        raise ValueError("No se pudo codificar la imagen CNN")
-    
-    return buffer.tobytes(), features_normalized.astype(float).tolist()
+    features = model.predict(x, batch_size=max(1, int(batch_size)), verbose=0)
+    features = features.reshape(len(imagenes), -1)
+
+    # Normalizar características (L2 por fila)
+    features_normalized = normalize(features, norm='l2')
+
+    return [
+        (visualizacion, vector.astype(float).tolist())
+        for visualizacion, vector in zip(visualizaciones, features_normalized)
+    ]
+
+
+def procesar_cnn_imagen(img: np.ndarray):
+    """
+    Extrae características CNN de una imagen ya decodificada (gris o BGR).
+    Retorna la imagen de visualización (ndarray, sin codificar) y el vector normalizado.
+    """
+    return procesar_cnn_lote([img], batch_size=1)[0]
+
+
+def procesar_cnn_con_descriptores(image_bytes: bytes):
+    """
+    Extrae características CNN de una imagen usando ResNet50
+    """
+    img = decodificar_imagen(image_bytes, cv2.IMREAD_COLOR)
+
+    visualizacion, features = procesar_cnn_imagen(img)
 
+    return codificar_png(visualizacion, "imagen CNN"), features
@@ -1,33 +1,128 @@
+from functools import lru_cache
+
 import cv2
 import numpy as np
-from skimage.feature import hog
 
-def procesar_hog_con_descriptores(image_bytes: bytes):
+from preprocesamiento.preprocesamiento import decodificar_imagen, codificar_png
+
+# Parámetros HOG comunes a ambos backends y a la visualización
+HOG_ORIENTACIONES = 6
+HOG_PIXELES_POR_CELDA = (16, 16)
+HOG_CELDAS_POR_BLOQUE = (2, 2)
+
+# skimage: vector de referencia. opencv: cv2.HOGDescriptor con la misma
+# geometría y el mismo orden de componentes, mucho más rápido pero no
+# idéntico (interpola orientación y posición), así que un modelo no debe
+# mezclar vectores de ambos backends.
+HOG_BACKENDS = ("skimage", "opencv")
+
+
+def _hog_skimage(gris: np.ndarray, visualize: bool):
     try:
         from skimage.feature import hog
     except ImportError:
         raise ValueError("scikit-image no está instalado")
 
-    img_array = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        raise ValueError("No se pudo decodificar la imagen")
-
-    features, hog_image = hog(
-        img,
-        orientations=6,
-        pixels_per_cell=(16, 16),
-        cells_per_block=(2, 2),
+    return hog(
+        gris,
+        orientations=HOG_ORIENTACIONES,
+        pixels_per_cell=HOG_PIXELES_POR_CELDA,
+        cells_per_block=HOG_CELDAS_POR_BLOQUE,
         block_norm="L2-Hys",
-        visualize=True,
+        visualize=visualize,
         feature_vector=True,
     )
 
+
+@lru_cache(maxsize=4)
+def _descriptor_opencv(alto: int, ancho: int) -> cv2.HOGDescriptor:
+    """
+    HOGDescriptor equivalente a la configuración de skimage para una imagen
+    de alto x ancho (ventana = celdas completas desde la esquina superior
+    izquierda, sin ponderación gaussiana, orientación sin signo)
+    """
+    celda_y, celda_x = HOG_PIXELES_POR_CELDA
+    bloque_y, bloque_x = HOG_CELDAS_POR_BLOQUE
+    ventana = ((ancho // celda_x) * celda_x, (alto // celda_y) * celda_y)
+    return cv2.HOGDescriptor(
+        ventana,
+        (bloque_x * celda_x, bloque_y * celda_y),
+        (celda_x, celda_y),
+        (celda_x, celda_y),
+        HOG_ORIENTACIONES,
+        1,
+        1e6,
+        cv2.HOGDESCRIPTOR_L2HYS,
+        0.2,
+        False,
+        64,
+        False,
+    )
+
+
+def _hog_opencv(gris: np.ndarray) -> np.ndarray:
+    alto, ancho = gris.shape[:2]
+    celda_y, celda_x = HOG_PIXELES_POR_CELDA
+    bloque_y, bloque_x = HOG_CELDAS_POR_BLOQUE
+    celdas_y, celdas_x = alto // celda_y, ancho // celda_x
+    if celdas_y < bloque_y or celdas_x < bloque_x:
+        raise ValueError("Imagen demasiado pequeña para HOG")
+
+    recorte = np.ascontiguousarray(gris[:celdas_y * celda_y, :celdas_x * celda_x], dtype=np.uint8)
+    features = _descriptor_opencv(alto, ancho).compute(recorte).ravel()
+
+    # OpenCV recorre bloques y celdas por columnas; se reordena al layout de
+    # skimage (bloque_fila, bloque_col, celda_fila, celda_col, orientación)
+    features = features.reshape(
+        celdas_x - bloque_x + 1, celdas_y - bloque_y + 1, bloque_x, bloque_y, HOG_ORIENTACIONES
+    ).transpose(1, 0, 3, 2, 4)
+    return features.ravel().astype(np.float64)
+
+
+def descriptor_hog_gris(gris: np.ndarray, backend: str = "skimage") -> np.ndarray:
+    """
+    Solo el vector HOG (sin visualización) de una imagen en escala de grises
+    """
+    if backend == "skimage":
+        return np.asarray(_hog_skimage(gris, visualize=False), dtype=np.float64)
+    if backend == "opencv":
+        return _hog_opencv(gris)
+    raise ValueError(f"Backend HOG no válido: {backend} (use {', '.join(HOG_BACKENDS)})")
+
+
+def descriptores_hog_lote(grises: list, backend: str = "skimage") -> list:
+    """
+    Vectores HOG de varias imágenes en escala de grises, en el orden recibido
+    """
+    return [descriptor_hog_gris(gris, backend) for gris in grises]
+
+
+def visualizacion_hog_gris(gris: np.ndarray) -> np.ndarray:
+    """
+    Visualización HOG (ndarray uint8, sin codificar). Solo se calcula cuando
+    alguien pide el artefacto *_hog.png.
+    """
+    _, hog_image = _hog_skimage(gris, visualize=True)
+    hog_norm = cv2.normalize(hog_image, None, 0, 255, cv2.NORM_MINMAX)
+    return hog_norm.astype(np.uint8)
+
+
+def procesar_hog_gris(gris: np.ndarray):
+    """
+    Calcula HOG sobre una imagen en escala de grises ya decodificada.
+    Retorna la visualización (ndarray uint8, sin codificar) y el vector de características.
+    """
+    features, hog_image = _hog_skimage(gris, visualize=True)
+
     hog_norm = cv2.normalize(hog_image, None, 0, 255, cv2.NORM_MINMAX)
     hog_uint8 = hog_norm.astype(np.uint8)
 
-    success, buffer = cv2.imencode(".png", hog_uint8)
-    if not success:
-        raise ValueError("No se pudo codificar la imagen HOG")
+    return hog_uint8, features.astype(float).tolist()
+
+
+def procesar_hog_con_descriptores(image_bytes: bytes):
+    img = decodificar_imagen(image_bytes, cv2.IMREAD_GRAYSCALE)
+
+    hog_uint8, features = procesar_hog_gris(img)
 
-    return buffer.tobytes(), features.astype(float).tolist()
+    return codificar_png(hog_uint8, "imagen HOG"), features
@@ -1,84 +1,232 @@
+from functools import lru_cache
+
 import cv2
 import numpy as np
 
+from preprocesamiento.preprocesamiento import decodificar_imagen, binarizar_otsu
+from feature_extraction.zernike import zernike_lote, GRADO_ZERNIKE
 
-def calcular_momentos(image_bytes: bytes) -> dict:
-    img_array = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        raise ValueError("No se pudo decodificar la imagen")
-
-    _, binaria = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-
-    moments = cv2.moments(binaria)
-
-    return {
-        "m00": moments["m00"],
-        "m10": moments["m10"],
-        "m01": moments["m01"],
-        "m20": moments["m20"],
-        "m11": moments["m11"],
-        "m02": moments["m02"],
-        "m30": moments["m30"],
-        "m21": moments["m21"],
-        "m12": moments["m12"],
-        "m03": moments["m03"],
-        "mu20": moments["mu20"],
-        "mu11": moments["mu11"],
-        "mu02": moments["mu02"],
-        "mu30": moments["mu30"],
-        "mu21": moments["mu21"],
-        "mu12": moments["mu12"],
-        "mu03": moments["mu03"],
-        "nu20": moments["nu20"],
-        "nu11": moments["nu11"],
-        "nu02": moments["nu02"],
-        "nu30": moments["nu30"],
-        "nu21": moments["nu21"],
-        "nu12": moments["nu12"],
-        "nu03": moments["nu03"],
-    }
 
+def _binarizar_bytes(image_bytes: bytes) -> np.ndarray:
+    img = decodificar_imagen(image_bytes, cv2.IMREAD_GRAYSCALE)
+    return binarizar_otsu(img)
 
-def calcular_momentos_hu(image_bytes: bytes) -> dict:
-    img_array = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        raise ValueError("No se pudo decodificar la imagen")
 
-    _, binaria = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+# Familias de descriptores de forma que comparten la misma máscara binaria
+FAMILIAS_FORMA = ("moments", "hu", "zernike")
 
-    moments = cv2.moments(binaria)
-    hu_moments = cv2.HuMoments(moments).flatten().tolist()
+CLAVES_MOMENTOS = (
+    "m00", "m10", "m01", "m20", "m11", "m02", "m30", "m21", "m12", "m03",
+    "mu20", "mu11", "mu02", "mu30", "mu21", "mu12", "mu03",
+    "nu20", "nu11", "nu02", "nu30", "nu21", "nu12", "nu03",
+)
 
-    return {
-        "hu1": hu_moments[0],
-        "hu2": hu_moments[1],
-        "hu3": hu_moments[2],
-        "hu4": hu_moments[3],
-        "hu5": hu_moments[4],
-        "hu6": hu_moments[5],
-        "hu7": hu_moments[6],
-    }
 
+def _momentos_desde_cv2(moments: dict) -> dict:
+    return {clave: moments[clave] for clave in CLAVES_MOMENTOS}
 
-def calcular_momentos_zernike(image_bytes: bytes, radius: int = 128) -> dict:
-    try:
-        import mahotas
-    except ImportError:
-        raise ValueError("Mahotas no está instalado")
 
-    img_array = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        raise ValueError("No se pudo decodificar la imagen")
+def _hu_desde_cv2(moments: dict) -> dict:
+    hu_moments = cv2.HuMoments(moments).flatten().tolist()
+    return {f"hu{i + 1}": valor for i, valor in enumerate(hu_moments)}
+
+
+def momentos_desde_binaria(binaria: np.ndarray) -> dict:
+    return _momentos_desde_cv2(cv2.moments(binaria))
+
+
+def momentos_hu_desde_binaria(binaria: np.ndarray) -> dict:
+    return _hu_desde_cv2(cv2.moments(binaria))
+
+
+def _zernike_a_dict(zernike) -> dict:
+    return {f"z{i+1}": float(val) for i, val in enumerate(zernike)}
+
+
+def momentos_zernike_desde_binaria(binaria: np.ndarray, radius: int = 128) -> dict:
+    return _zernike_a_dict(zernike_lote([binaria], radius=radius, degree=GRADO_ZERNIKE)[0])
+
+
+def momentos_zernike_lote(binarias: list, radius: int = 128) -> list:
+    """
+    Zernike de varias máscaras binarias del mismo tamaño con un solo producto
+    contra la base precalculada. Retorna una lista de dicts en el orden recibido.
+    """
+    return [_zernike_a_dict(fila) for fila in zernike_lote(binarias, radius=radius, degree=GRADO_ZERNIKE)]
+
+
+# Imágenes por producto matricial: bloques pequeños mantienen la pila en caché
+MOMENTOS_CHUNK = 4
+
+
+@lru_cache(maxsize=16)
+def _potencias_coordenadas(n: int, dtype: str = "float64") -> np.ndarray:
+    """Malla de potencias (n, 4): columna p = coordenada**p, p = 0..3"""
+    coordenadas = np.arange(n, dtype=np.float64)
+    potencias = np.stack([coordenadas ** p for p in range(4)], axis=1).astype(dtype)
+    potencias.flags.writeable = False
+    return potencias
+
+
+def momentos_cv2_lote(binarias) -> dict:
+    """
+    Equivalente vectorizado de cv2.moments para una pila (N, H, W) de
+    imágenes binarias. Con las mallas de potencias precalculadas se obtienen
+    los perfiles por fila (Σx x^p·I, p=0,1) y por columna (Σy y^q·I, q=0,1)
+    con dos productos matriciales; los diez momentos crudos salen de
+    contraer esos perfiles. Los perfiles son enteros exactos (float32 mientras
+    quepan en 2^24, float64 si no) y los centrales/normalizados siguen el
+    mismo orden de operaciones que OpenCV, así que el resultado coincide con
+    cv2.moments (implementación de referencia, sin IPP).
+    Retorna {clave: array (N,)} con las claves de cv2.moments.
+    """
+    binarias = list(binarias)
+    m = np.zeros((len(binarias), 4, 4), dtype=np.float64)
+    if binarias:
+        alto, ancho = np.shape(binarias[0])
+        if any(np.shape(b) != (alto, ancho) for b in binarias):
+            raise ValueError("Todas las imágenes del lote deben tener el mismo tamaño")
+        maximo = max(float(np.max(b)) for b in binarias)
+        exacto_f32 = maximo * max(alto, ancho) ** 2 / 2 < 2 ** 24
+        dtype = "float32" if exacto_f32 else "float64"
+
+        potencias_x = _potencias_coordenadas(ancho)
+        potencias_y = _potencias_coordenadas(alto)
+        lineales_x = _potencias_coordenadas(ancho, dtype)[:, :2]
+        lineales_y = _potencias_coordenadas(alto, dtype)[:, :2]
+
+        for inicio in range(0, len(binarias), MOMENTOS_CHUNK):
+            pila = np.stack(binarias[inicio:inicio + MOMENTOS_CHUNK]).astype(dtype)
+            bloque = m[inicio:inicio + len(pila)]
+            # filas[n, y, p] = Σx x^p·I ; columnas[n, q, x] = Σy y^q·I
+            filas = (pila @ lineales_x).astype(np.float64)
+            columnas = (lineales_y.T @ pila).astype(np.float64)
+
+            # m_p0 = Σx x^p·columnas0 ; m_0q = Σy y^q·filas0
+            bloque[:, :, 0] = columnas[:, 0, :] @ potencias_x
+            bloque[:, 0, 1:] = filas[:, :, 0] @ potencias_y[:, 1:]
+            # m11 = Σy y·filas1 ; m12 = Σy y²·filas1 ; m21 = Σx x²·columnas1
+            bloque[:, 1, 1:3] = filas[:, :, 1] @ potencias_y[:, 1:3]
+            bloque[:, 2, 1] = columnas[:, 1, :] @ potencias_x[:, 2]
+
+    r = {f"m{p}{q}": m[:, p, q] for p in range(4) for q in range(4) if p + q <= 3}
+    m00 = r["m00"]
+
+    # Centroide (cx = cy = 0 si la imagen está vacía, como OpenCV)
+    con_masa = np.abs(m00) > np.finfo(np.float64).eps
+    inv_m00 = np.divide(1.0, m00, out=np.zeros_like(m00), where=con_masa)
+    cx = r["m10"] * inv_m00
+    cy = r["m01"] * inv_m00
+
+    mu20 = r["m20"] - r["m10"] * cx
+    mu11 = r["m11"] - r["m10"] * cy
+    mu02 = r["m02"] - r["m01"] * cy
+    r["mu20"], r["mu11"], r["mu02"] = mu20, mu11, mu02
+    r["mu30"] = r["m30"] - cx * (3 * mu20 + cx * r["m10"])
+    mu11_2 = mu11 + mu11
+    r["mu21"] = r["m21"] - cx * (mu11_2 + cx * r["m01"]) - cy * mu20
+    r["mu12"] = r["m12"] - cy * (mu11_2 + cy * r["m10"]) - cx * mu02
+    r["mu03"] = r["m03"] - cy * (3 * mu02 + cy * r["m01"])
+
+    inv_sqrt_m00 = np.sqrt(np.abs(inv_m00))
+    s2 = inv_m00 * inv_m00
+    s3 = s2 * inv_sqrt_m00
+    for clave in ("20", "11", "02"):
+        r[f"nu{clave}"] = r[f"mu{clave}"] * s2
+    for clave in ("30", "21", "12", "03"):
+        r[f"nu{clave}"] = r[f"mu{clave}"] * s3
+
+    return r
+
+
+def hu_lote(r: dict) -> np.ndarray:
+    """Siete invariantes de Hu (N, 7) con la misma secuencia que cv2.HuMoments"""
+    nu20, nu11, nu02 = r["nu20"], r["nu11"], r["nu02"]
+    nu30, nu21, nu12, nu03 = r["nu30"], r["nu21"], r["nu12"], r["nu03"]
+
+    t0 = nu30 + nu12
+    t1 = nu21 + nu03
+    q0 = t0 * t0
+    q1 = t1 * t1
+    n4 = 4 * nu11
+    s = nu20 + nu02
+    d = nu20 - nu02
+
+    hu = np.empty((len(nu20), 7), dtype=np.float64)
+    hu[:, 0] = s
+    hu[:, 1] = d * d + n4 * nu11
+    hu[:, 3] = q0 + q1
+    hu[:, 5] = d * (q0 - q1) + n4 * t0 * t1
+
+    t0 = t0 * (q0 - 3 * q1)
+    t1 = t1 * (3 * q0 - q1)
+    q0 = nu30 - 3 * nu12
+    q1 = 3 * nu21 - nu03
+
+    hu[:, 2] = q0 * q0 + q1 * q1
+    hu[:, 4] = q0 * t0 + q1 * t1
+    hu[:, 6] = q1 * t0 - q0 * t1
+    return hu
+
+
+def momentos_lote(binarias) -> list:
+    """Momentos regulares/centrales/normalizados de varias máscaras (lista de dicts)"""
+    r = momentos_cv2_lote(binarias)
+    return [
+        {clave: float(r[clave][i]) for clave in CLAVES_MOMENTOS}
+        for i in range(len(r["m00"]))
+    ]
+
+
+def momentos_hu_lote(binarias) -> list:
+    """Invariantes de Hu de varias máscaras (lista de dicts hu1..hu7)"""
+    hu = hu_lote(momentos_cv2_lote(binarias))
+    return [{f"hu{j + 1}": float(valor) for j, valor in enumerate(fila)} for fila in hu]
+
+
+def descriptores_forma(binaria: np.ndarray, familias=FAMILIAS_FORMA, radius: int = 128) -> dict:
+    """
+    Extractor fusionado: a partir de una sola máscara binaria deriva momentos
+    regulares/centrales/normalizados, invariantes de Hu y Zernike según las
+    familias pedidas (descriptores_forma_lote con una imagen).
+    Retorna {familia: descriptores}.
+    """
+    return descriptores_forma_lote([binaria], familias, radius)[0]
+
+
+def descriptores_forma_lote(binarias, familias=FAMILIAS_FORMA, radius: int = 128) -> list:
+    """
+    Extractor fusionado por lotes: un solo momentos_cv2_lote para momentos y
+    Hu y un solo zernike_lote para Zernike sobre toda la pila de máscaras.
+    Retorna [{familia: descriptores}] en el orden recibido.
+    """
+    invalidas = [f for f in familias if f not in FAMILIAS_FORMA]
+    if invalidas:
+        raise ValueError(f"Familias de descriptores no válidas: {', '.join(invalidas)}")
+
+    binarias = list(binarias)
+    result = [{} for _ in binarias]
+    if "moments" in familias or "hu" in familias:
+        r = momentos_cv2_lote(binarias)
+        if "moments" in familias:
+            for i, descriptores in enumerate(result):
+                descriptores["moments"] = {clave: float(r[clave][i]) for clave in CLAVES_MOMENTOS}
+        if "hu" in familias:
+            for descriptores, fila in zip(result, hu_lote(r)):
+                descriptores["hu"] = {f"hu{j + 1}": float(valor) for j, valor in enumerate(fila)}
+    if "zernike" in familias:
+        for descriptores, fila in zip(result, zernike_lote(binarias, radius=radius, degree=GRADO_ZERNIKE)):
+            descriptores["zernike"] = _zernike_a_dict(fila)
+    return result
 
-    _, binaria = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
 
-    zernike = mahotas.features.zernike_moments(binaria, radius=radius, degree=8)
+def calcular_momentos(image_bytes: bytes) -> dict:
+    return momentos_desde_binaria(_binarizar_bytes(image_bytes))
+
 
-    result = {}
-    for i, val in enumerate(zernike):
-        result[f"z{i+1}"] = float(val)
+def calcular_momentos_hu(image_bytes: bytes) -> dict:
+    return momentos_hu_desde_binaria(_binarizar_bytes(image_bytes))
 
-    return result
\ No newline at end of file
+
+def calcular_momentos_zernike(image_bytes: bytes, radius: int = 128) -> dict:
+    return momentos_zernike_desde_binaria(_binarizar_bytes(image_bytes), radius=radius)
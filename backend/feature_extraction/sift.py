@@ -1,29 +1,45 @@
-
 import cv2
 import numpy as np
 
+from preprocesamiento.preprocesamiento import decodificar_imagen, codificar_png
 
-def procesar_sift_con_descriptores(image_bytes: bytes):
-    img_array = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-    if img is None:
-        raise ValueError("No se pudo decodificar la imagen")
 
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+SIFT_DIM = 128
+
+
+def compactar_descriptores(descriptors) -> np.ndarray:
+    """
+    Descriptores (N, 128) en el tipo más compacto sin pérdida: uint8 si todos
+    son enteros en [0, 255] (el caso de SIFT en OpenCV), float32 si no
+    """
+    if descriptors is None or len(descriptors) == 0:
+        return np.empty((0, SIFT_DIM), dtype=np.uint8)
+    descriptors = np.asarray(descriptors, dtype=np.float32)
+    if descriptors.min() >= 0 and descriptors.max() <= 255 and np.array_equal(descriptors, np.round(descriptors)):
+        return descriptors.astype(np.uint8)
+    return descriptors
+
+
+def procesar_sift_gris(gris: np.ndarray):
+    """
+    Detecta keypoints SIFT sobre una imagen en escala de grises ya decodificada.
+    Retorna la visualización (ndarray, sin codificar) y los descriptores como
+    ndarray (N, 128) compacto (ver compactar_descriptores).
+    """
     sift = cv2.SIFT_create()
-    keypoints, descriptors = sift.detectAndCompute(gray, None)
+    keypoints, descriptors = sift.detectAndCompute(gris, None)
 
     salida = cv2.drawKeypoints(
-        img, keypoints, None, flags=cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS
+        gris, keypoints, None, flags=cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS
     )
 
-    success, buffer = cv2.imencode(".png", salida)
-    if not success:
-        raise ValueError("No se pudo codificar la imagen SIFT")
+    return salida, compactar_descriptores(descriptors)
+
+
+def procesar_sift_con_descriptores(image_bytes: bytes):
+    img = decodificar_imagen(image_bytes, cv2.IMREAD_COLOR)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
-    if descriptors is None:
-        desc_list = []
-    else:
-        desc_list = descriptors.astype(float).tolist()
+    salida, descriptores = procesar_sift_gris(gray)
 
-    return buffer.tobytes(), desc_list
\ No newline at end of file
+    return codificar_png(salida, "imagen SIFT"), descriptores.astype(float).tolist()
@@ -1,18 +1,24 @@
 import os
-import uuid
+from email.utils import parsedate_to_datetime
 from typing import List
-from fastapi import FastAPI, File, HTTPException, UploadFile, Form
+from fastapi import FastAPI, File, HTTPException, UploadFile, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 
 # Importar routers
-from routers import moments_router, hu_router, zernike_router, sift_router, hog_router, cnn_router
+from routers import moments_router, hu_router, zernike_router, sift_router, hog_router, cnn_router, shape_router, recluster_router
 
 # Importar servicios
 from services.file_service import file_service
 from services.image_service import image_service
 from services.clustering_service import clustering_service
-from utils.helpers import get_data_paths, validate_file_type, validate_file_size
+from services.metrics_service import metrics_service
+from services.worker_pool import worker_pool
+from services.image_index import image_index
+from services.gallery_service import gallery_service
+from services.artifact_locator import artifact_locator, image_id_from_name, ARTIFACT_CACHE_CONTROL
+from services.derived_artifacts import derived_artifacts
+from utils.helpers import get_data_paths, etag_matches, ARTIFACT_SERVING
 
 # Importar modelos
 from models.clustering_models import clustering_models
@@ -36,28 +42,86 @@ app.include_router(zernike_router.router, prefix="/api")
 app.include_router(sift_router.router, prefix="/api")
 app.include_router(hog_router.router, prefix="/api")
 app.include_router(cnn_router.router, prefix="/api")
+app.include_router(shape_router.router, prefix="/api")
+app.include_router(recluster_router.router, prefix="/api")
 
 # Obtener rutas de datos
 paths = get_data_paths()
 
 
+@app.on_event("startup")
+def load_artifacts():
+    """Rutas de los artefactos e inventario de derivados en memoria antes de la primera petición"""
+    artifact_locator.load()
+    derived_artifacts.load()
+
+
+@app.on_event("shutdown")
+def shutdown_worker_pool():
+    """Cierra los procesos trabajadores al detener la aplicación"""
+    worker_pool.shutdown()
+
+
 # ===== ENDPOINTS BÁSICOS =====
 
+def _gallery_response(request: Request, limit, cursor, method, cluster, tag, fields, body):
+    """
+    Respuesta paginada con ETag fuerte (versión del índice + consulta); si
+    If-None-Match coincide se responde 304 sin leer los items
+    """
+    try:
+        query = gallery_service.prepare(limit, cursor, method, cluster, tag, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    headers = {"ETag": query["etag"], "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), query["etag"]):
+        return Response(status_code=304, headers=headers)
+    
+    page = gallery_service.fetch(query)
+    headers["X-Total-Count"] = str(page["total"])
+    if page["next_cursor"]:
+        headers["X-Next-Cursor"] = page["next_cursor"]
+    return JSONResponse(body(page), headers=headers)
+
+
 @app.get("/images")
-def list_images():
-    """Lista todas las imágenes almacenadas"""
-    return file_service.load_index()
+def list_images(
+    request: Request,
+    limit: int | None = Query(None),
+    cursor: str | None = Query(None),
+    method: str | None = Query(None),
+    cluster: int | None = Query(None),
+    tag: str | None = Query(None),
+    fields: str | None = Query(None),
+):
+    """
+    Lista las imágenes almacenadas (una página; el cursor de la siguiente va
+    en la cabecera X-Next-Cursor y el total en X-Total-Count)
+    """
+    return _gallery_response(request, limit, cursor, method, cluster, tag, fields, lambda page: page["items"])
 
 @app.get("/gallery")
-def get_gallery():
-    """Obtiene todas las imágenes de la galería con URLs completas"""
-    items = file_service.load_index()
-    return {"items": items, "total": len(items)}
+def get_gallery(
+    request: Request,
+    limit: int | None = Query(None),
+    cursor: str | None = Query(None),
+    method: str | None = Query(None),
+    cluster: int | None = Query(None),
+    tag: str | None = Query(None),
+    fields: str | None = Query(None),
+):
+    """
+    Página de la galería: filtros por method (asignadas en el modelo activo),
+    cluster y tag; fields limita los campos de cada item
+    """
+    return _gallery_response(request, limit, cursor, method, cluster, tag, fields, lambda page: page)
 
 @app.delete("/images")
 def delete_images():
     """Elimina todas las imágenes almacenadas"""
     try:
+        derived_artifacts.clear()
         file_service.delete_all_images()
         # Limpiar los modelos de clustering
         clustering_models.reset_model("moments")
@@ -72,137 +136,114 @@ async def upload_images(files: List[UploadFile] = File(...)):
     if not files:
         raise HTTPException(status_code=400, detail="No se enviaron archivos")
 
-    items = file_service.load_index()
     new_items = []
 
-    for file in files:
-        try:
-            # Validar archivo
-            validate_file_type(file.content_type)
-            content = await file.read()
-            validate_file_size(content, file.filename)
+    # Validar y procesar en el pool de trabajadores (resultados en orden de subida)
+    procesadas = await image_service.process_files(files)
+    existentes = image_index.get_many([p[0]["image_id"] for p in procesadas if not isinstance(p, Exception)])
 
-            # Procesar imagen
-            image_data = image_service.process_image(content, file.content_type, file.filename)
+    for file, procesada in zip(files, procesadas):
+        try:
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, _ = procesada
             
             # Guardar archivos
             file_service.save_image_files(image_data, paths)
 
-            # Crear item para el índice
-            item = file_service.create_image_result(image_data, file.filename)
-            items.append(item)
+            # Crear item para el índice (un contenido ya subido conserva su item)
+            item = existentes.get(image_data["image_id"]) or file_service.create_image_result(image_data, file.filename)
             new_items.append(item)
 
         except Exception as exc:
             raise HTTPException(status_code=400, detail=str(exc))
 
-    file_service.save_index(items)
+    # Una sola transacción para todo el lote
+    file_service.add_to_index(new_items)
     return {"items": new_items}
 
 
 # ===== ENDPOINTS DE ARCHIVOS =====
 
+def _artifact_response(request: Request, found, detail: str):
+    """
+    Sirve un artefacto ya resuelto (ruta y stat en memoria): Cache-Control
+    immutable, ETag/Last-Modified, 304 condicional y peticiones Range. En modo
+    accel, detrás de nginx, solo se responde con la cabecera X-Accel-Redirect.
+    """
+    if found is None:
+        raise HTTPException(status_code=404, detail=detail)
+    path, stat = found
+    if ARTIFACT_SERVING == "accel" and request.headers.get("x-sendfile-type", "").lower() == "x-accel-redirect":
+        # nginx envía el archivo (condicionales y Range incluidos); Cache-Control pasa tal cual
+        return Response(headers={"X-Accel-Redirect": artifact_locator.accel_uri(path), "Cache-Control": ARTIFACT_CACHE_CONTROL})
+    etag = artifact_locator.etag(stat)
+    headers = {"Cache-Control": ARTIFACT_CACHE_CONTROL, "ETag": etag}
+    
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and not if_none_match:
+        try:
+            if int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp():
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+    return FileResponse(path, stat_result=stat, headers=headers)
+
+
+async def _derived_response(request: Request, resolucion, detail: str):
+    """
+    Espera la resolución de derived_artifacts (que genera desde el original
+    un derivado que no está en disco) y sirve el archivo con _artifact_response
+    """
+    try:
+        found = await resolucion
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generando artefacto: {e}")
+    return _artifact_response(request, found, detail)
+
+
 @app.get("/files/originals/{filename}")
-def get_original(filename: str):
+def get_original(request: Request, filename: str):
     """Obtiene una imagen original"""
-    path = file_service.get_file_path("originals", filename)
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="Archivo no encontrado")
-    return FileResponse(path)
+    return _artifact_response(request, artifact_locator.resolve_name(filename, ("original",)), "Archivo no encontrado")
 
 
 @app.get("/files/processed/{filename}")
-def get_processed(filename: str):
-    """Obtiene una imagen procesada (escala de grises)"""
-    path = file_service.get_file_path("processed", filename)
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="Archivo no encontrado")
-    return FileResponse(path)
+async def get_processed(request: Request, filename: str):
+    """
+    Obtiene una imagen procesada (escala de grises) o una visualización
+    SIFT, HOG o CNN; se generan desde el original la primera vez que se piden
+    """
+    return await _derived_response(request, derived_artifacts.resolve_name(filename, ("processed", "sift", "hog", "cnn")), "Archivo no encontrado")
 
 
 @app.get("/files/binarized/{filename}")
-def get_binarized(filename: str):
-    """Obtiene una imagen binarizada"""
-    path = file_service.get_file_path("binarized", filename)
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="Archivo no encontrado")
-    return FileResponse(path)
+async def get_binarized(request: Request, filename: str):
+    """Obtiene una imagen binarizada (se genera desde el original la primera vez)"""
+    return await _derived_response(request, derived_artifacts.resolve_name(filename, ("binarized",)), "Archivo no encontrado")
 
 
 # ===== ENDPOINTS ADICIONALES PARA FRONTEND =====
 
 @app.get("/image/{base_name}_grayscale.jpg")
-def get_image_grayscale(base_name: str):
-    """Obtiene la versión en escala de grises de una imagen"""
-    processed_path = file_service.get_file_path("processed", f"{base_name}.jpg")
-    if not os.path.exists(processed_path):
-        processed_path = file_service.get_file_path("processed", f"{base_name}.png")
-    if not os.path.exists(processed_path):
-        processed_path = file_service.get_file_path("processed", f"{base_name}.jpeg")
-    
-    if os.path.exists(processed_path):
-        return FileResponse(processed_path)
-    
-    raise HTTPException(status_code=404, detail="Imagen en escala de grises no encontrada")
+async def get_image_grayscale(request: Request, base_name: str):
+    """Obtiene la versión en escala de grises de una imagen ({id}_grayscale.jpg)"""
+    return await _derived_response(request, derived_artifacts.resolve(image_id_from_name(base_name), "processed"), "Imagen en escala de grises no encontrada")
 
 
 @app.get("/image/{base_name}_binary.jpg")
-def get_image_binary(base_name: str):
-    """Obtiene la versión binaria de una imagen"""
-    binary_path = file_service.get_file_path("binarized", f"{base_name}.jpg")
-    if not os.path.exists(binary_path):
-        binary_path = file_service.get_file_path("binarized", f"{base_name}.png")
-    if not os.path.exists(binary_path):
-        binary_path = file_service.get_file_path("binarized", f"{base_name}.jpeg")
-    
-    if os.path.exists(binary_path):
-        return FileResponse(binary_path)
-    
-    raise HTTPException(status_code=404, detail="Imagen binaria no encontrada")
+async def get_image_binary(request: Request, base_name: str):
+    """Obtiene la versión binaria de una imagen ({id}_binary.jpg)"""
+    return await _derived_response(request, derived_artifacts.resolve(image_id_from_name(base_name), "binarized"), "Imagen binaria no encontrada")
 
 
 @app.get("/image/{filename}")
-def get_image(filename: str):
-    """Obtiene una imagen por nombre (original por defecto)"""
-    # Primero intentar obtener la original
-    original_path = file_service.get_file_path("originals", filename)
-    if os.path.exists(original_path):
-        return FileResponse(original_path)
-    
-    # Si no existe, buscar en procesadas
-    processed_path = file_service.get_file_path("processed", filename)
-    if os.path.exists(processed_path):
-        return FileResponse(processed_path)
-        
-    raise HTTPException(status_code=404, detail="Imagen no encontrada")
-
-
-@app.get("/gallery")
-def get_gallery_data():
-    """Obtiene datos estructurados para la galería del frontend"""
-    items = file_service.load_index()
-    
-    gallery_data = []
-    for item in items:
-        gallery_item = {
-            "id": str(uuid.uuid4()),
-            "filename": item["filename"],
-            "name": item["filename"].rsplit('.', 1)[0],  # Sin extensión
-            "tag": item.get("tag", "Sin etiqueta"),
-            "method": item.get("method", "moments"),
-            "cluster": item.get("cluster_id", 0),
-            "size": item.get("file_size", 0),
-            "dimensions": item.get("dimensions", {"width": 0, "height": 0}),
-            "uploadDate": item.get("timestamp", ""),
-            "urls": {
-                "original": f"/image/{item['filename']}",
-                "grayscale": f"/image/{item['filename'].rsplit('.', 1)[0]}_grayscale.jpg",
-                "binary": f"/image/{item['filename'].rsplit('.', 1)[0]}_binary.jpg"
-            }
-        }
-        gallery_data.append(gallery_item)
-    
-    return {"images": gallery_data, "total": len(gallery_data)}
+async def get_image(request: Request, filename: str):
+    """Obtiene una imagen por nombre de archivo (original o procesada)"""
+    return await _derived_response(request, derived_artifacts.resolve_name(filename, ("original", "processed", "sift", "hog", "cnn")), "Imagen no encontrada")
 
 
 # ===== ENDPOINTS DE COMPATIBILIDAD (LEGACY) =====
@@ -218,13 +259,14 @@ async def analyze_legacy(files: List[UploadFile] = File(...), capacities: str =
             clustering_models.get_model("moments", caps)
         
         results = []
-        for file in files:
-            file_content = await file.read()
-            image_data = image_service.process_image(file_content, file.content_type, file.filename)
-            momentos, vector_normalizado = image_service.extract_moments(image_data["resized_bytes"])
+        procesadas = await image_service.process_files(files, "moments")
+        for file, procesada in zip(files, procesadas):
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, (momentos, vector_normalizado) = procesada
             
             if clustering_models.has_active_model("moments"):
-                cluster_id, centroid = clustering_service.predict_cluster("moments", vector_normalizado)
+                cluster_id, centroid = clustering_service.predict_cluster("moments", vector_normalizado, image_id=image_data["image_id"])
                 file_service.save_image_files(image_data, paths)
                 result = file_service.create_image_result(
                     image_data, file.filename, 
@@ -240,7 +282,7 @@ async def analyze_legacy(files: List[UploadFile] = File(...), capacities: str =
         response = {"results": results}
         if clustering_models.has_active_model("moments"):
             clustering_service.save_model_state("moments")
-            response["metrics"] = clustering_service.get_metrics("moments")
+            response.update(metrics_service.get_deferred("moments"))
         
         return response
         
@@ -255,12 +297,13 @@ async def add_images_legacy(files: List[UploadFile] = File(...)):
         clustering_service.ensure_model_exists("moments", "No hay modelo de clustering activo. Usa /analyze primero")
         
         results = []
-        for file in files:
-            file_content = await file.read()
-            image_data = image_service.process_image(file_content, file.content_type, file.filename)
-            momentos, vector_normalizado = image_service.extract_moments(image_data["resized_bytes"])
+        procesadas = await image_service.process_files(files, "moments")
+        for file, procesada in zip(files, procesadas):
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, (momentos, vector_normalizado) = procesada
             
-            cluster_id, centroid = clustering_service.predict_cluster("moments", vector_normalizado, allow_new_clusters=False)
+            cluster_id, centroid = clustering_service.predict_cluster("moments", vector_normalizado, allow_new_clusters=False, image_id=image_data["image_id"])
             file_service.save_image_files(image_data, paths)
             result = file_service.create_image_result(
                 image_data, file.filename,
@@ -270,7 +313,7 @@ async def add_images_legacy(files: List[UploadFile] = File(...)):
             results.append(result)
         
         clustering_service.save_model_state("moments")
-        return {"results": results, "metrics": clustering_service.get_metrics("moments")}
+        return {"results": results, **metrics_service.get_deferred("moments")}
         
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
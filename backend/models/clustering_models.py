@@ -3,9 +3,10 @@ Gestión centralizada de modelos de clustering
 """
 import json
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from clustering.clustering_online import LinksClusterCapacityOnline
-from utils.helpers import get_data_paths
+from models.model_storage import ModelStorage
+from utils.helpers import get_data_paths, JOURNAL_COMPACT_MIN_RECORDS, VECTOR_STORE_MMAP_DIR
 
 
 class ClusteringModels:
@@ -15,6 +16,8 @@ class ClusteringModels:
     _instance = None
     _models: Dict[str, Optional[LinksClusterCapacityOnline]] = {}
     _capacities: Dict[str, Optional[list]] = {}
+    # model_type -> (model_id, vectores ya persistidos)
+    _persisted: Dict[str, Tuple[str, int]] = {}
     
     def __new__(cls):
         if cls._instance is None:
@@ -40,6 +43,7 @@ class ClusteringModels:
             "hog": None,
             "cnn": None,
         }
+        self._persisted = {}
     
     def get_model(self, model_type: str, capacities: list = None) -> LinksClusterCapacityOnline:
         """
@@ -50,11 +54,23 @@ class ClusteringModels:
         
         # Si se proporcionan nuevas capacidades o no existe el modelo, crear uno nuevo
         if (capacities and self._capacities[model_type] != capacities) or self._models[model_type] is None:
-            self._models[model_type] = LinksClusterCapacityOnline(capacities=capacities)
+            self._models[model_type] = self.new_model(capacities)
             self._capacities[model_type] = capacities
         
         return self._models[model_type]
     
+    @staticmethod
+    def new_model(capacities: list) -> LinksClusterCapacityOnline:
+        """Crea un modelo vacío sin activarlo (p. ej. para construirlo aparte)"""
+        return LinksClusterCapacityOnline(capacities=capacities, mmap_dir=VECTOR_STORE_MMAP_DIR)
+    
+    def set_model(self, model_type: str, model: LinksClusterCapacityOnline):
+        """Reemplaza el modelo activo por uno ya construido"""
+        if model_type not in self._models:
+            raise ValueError(f"Tipo de modelo no válido: {model_type}")
+        self._models[model_type] = model
+        self._capacities[model_type] = model.capacities
+    
     def reset_model(self, model_type: str):
         """Resetea un modelo específico"""
         if model_type in self._models:
@@ -94,6 +110,7 @@ class ClusteringModels:
             )
         
         model.capacities = new_capacities
+        model.version += 1
         self._capacities[model_type] = new_capacities
         
         return {
@@ -105,41 +122,71 @@ class ClusteringModels:
             ]
         }
     
+    @staticmethod
+    def _state_file(model_type: str) -> str:
+        paths = get_data_paths()
+        return paths[f"cluster_state_file_{model_type}"] if model_type != "moments" else paths["cluster_state_file"]
+    
     def save_state(self, model_type: str):
-        """Guarda el estado de un modelo"""
+        """
+        Guarda el estado de un modelo. Si el modelo ya tiene un snapshot en disco
+        solo se anexan al journal los vectores nuevos; el journal se compacta en
+        un snapshot nuevo cuando crece tanto como el propio snapshot.
+        """
         model = self._models.get(model_type)
         if not model:
             return
         
-        paths = get_data_paths()
-        state_file = paths[f"cluster_state_file_{model_type}"] if model_type != "moments" else paths["cluster_state_file"]
+        storage = ModelStorage(self._state_file(model_type))
         
         try:
-            with open(state_file, "w", encoding="utf-8") as f:
-                json.dump(model.to_dict(), f, ensure_ascii=False, indent=2)
+            persisted = self._persisted.get(model_type)
+            if not persisted or persisted[0] != model.model_id or not storage.exists():
+                count = storage.write_snapshot(model)
+            else:
+                snapshot_records = storage.snapshot_records()
+                journal_records = persisted[1] - snapshot_records
+                if journal_records >= max(JOURNAL_COMPACT_MIN_RECORDS, snapshot_records):
+                    count = storage.write_snapshot(model)
+                else:
+                    count = storage.append_journal(model, persisted[1])
+            self._persisted[model_type] = (model.model_id, count)
         except Exception as e:
+            self._persisted.pop(model_type, None)
             print(f"Error guardando estado de {model_type}: {e}")
     
     def load_state(self, model_type: str) -> bool:
-        """Carga el estado de un modelo desde archivo"""
-        paths = get_data_paths()
-        state_file = paths[f"cluster_state_file_{model_type}"] if model_type != "moments" else paths["cluster_state_file"]
-        
-        if not os.path.exists(state_file):
-            return False
+        """
+        Carga el estado de un modelo: snapshot binario + replay del journal, o el
+        JSON heredado si aún no existe el formato binario
+        """
+        state_file = self._state_file(model_type)
+        storage = ModelStorage(state_file)
         
         try:
+            loaded = storage.load(mmap_dir=VECTOR_STORE_MMAP_DIR)
+            if loaded is not None:
+                model, _ = loaded
+                self._models[model_type] = model
+                self._capacities[model_type] = model.capacities
+                self._persisted[model_type] = (model.model_id, len(model.all_vectors))
+                return True
+            
+            if not os.path.exists(state_file):
+                return False
+            
             with open(state_file, "r", encoding="utf-8") as f:
                 state_data = json.load(f)
             
-            # Recrear modelo desde el estado guardado
-            self._models[model_type] = LinksClusterCapacityOnline.from_dict(state_data)
+            # Recrear modelo desde el estado guardado (formato JSON heredado);
+            # el próximo guardado lo migra a snapshot binario
+            self._models[model_type] = LinksClusterCapacityOnline.from_dict(state_data, mmap_dir=VECTOR_STORE_MMAP_DIR)
             self._capacities[model_type] = self._models[model_type].capacities
+            self._persisted.pop(model_type, None)
             return True
         except Exception as e:
             print(f"Error cargando estado de {model_type}: {e}")
             return False
 
-
 # Instancia global singleton
 clustering_models = ClusteringModels()
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""
+Persistencia binaria de modelos de clustering: snapshot compacto + journal de solo-anexado.
+
+Para un archivo de estado base (p. ej. cluster_state_hu.json) se usan:
+- <base>.meta.json : parámetros y capacidades (pequeño, se reescribe en cada guardado)
+- <base>.npz       : snapshot con vectores (float32), etiquetas y centroides de subclusters
+- <base>.journal   : registros de tamaño fijo con cada vector asignado desde el snapshot
+
+Guardar tras cada petición solo anexa los vectores nuevos (O(lote)); la compactación
+periódica vuelca el journal en un snapshot nuevo. Cada registro lleva su posición
+absoluta (seq): al restaurar se omiten los que el snapshot ya contiene, así que una
+caída entre el reemplazo del snapshot y el vaciado del journal no duplica vectores.
+"""
+import json
+import os
+from typing import Optional, Tuple
+import numpy as np
+from clustering.clustering_online import LinksClusterCapacityOnline
+
+FORMAT_VERSION = 2
+
+
+def _journal_dtype(dim: int, format_version: int = FORMAT_VERSION) -> np.dtype:
+    if format_version < 2:
+        return np.dtype([
+            ("label", "<i4"),
+            ("subcluster", "<i4"),
+            ("has_true", "<i4"),
+            ("true_label", "<i8"),
+            ("vector", "<f4", (dim,)),
+        ])
+    return np.dtype([
+        ("seq", "<i8"),
+        ("label", "<i4"),
+        ("subcluster", "<i4"),
+        ("has_true", "<i4"),
+        ("true_label", "<i8"),
+        ("vector", "<f4", (dim,)),
+    ])
+
+
+def _atomic_write(path: str, write) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class ModelStorage:
+    """
+    Lectura/escritura del formato snapshot + journal para un archivo de estado base
+    """
+
+    def __init__(self, state_file: str):
+        base = os.path.splitext(state_file)[0]
+        self.meta_file = f"{base}.meta.json"
+        self.snapshot_file = f"{base}.npz"
+        self.journal_file = f"{base}.journal"
+
+    def exists(self) -> bool:
+        return os.path.exists(self.meta_file) and os.path.exists(self.snapshot_file)
+
+    def _write_meta(self, model: LinksClusterCapacityOnline, meta: dict, snapshot_records: int) -> None:
+        meta = dict(meta)
+        meta.update({
+            "format_version": FORMAT_VERSION,
+            "dim": int(model._sc_matrix.shape[1]) if model._subclusters else 0,
+            "snapshot_records": int(snapshot_records),
+            "last_centroid": model.last_centroid.tolist() if model.last_centroid is not None else None,
+        })
+        payload = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+        _atomic_write(self.meta_file, lambda f: f.write(payload))
+
+    def write_snapshot(self, model: LinksClusterCapacityOnline) -> int:
+        """
+        Escribe un snapshot completo y vacía el journal. Retorna los registros persistidos.
+        """
+        meta, arrays = model.to_arrays()
+        _atomic_write(self.snapshot_file, lambda f: np.savez(f, **arrays))
+        self._write_meta(model, meta, len(arrays["labels"]))
+        # El journal queda vacío: todo lo anterior está en el snapshot (si no
+        # llega a vaciarse, sus registros se omiten al restaurar por su seq)
+        with open(self.journal_file, "wb"):
+            pass
+        return len(arrays["labels"])
+
+    def append_journal(self, model: LinksClusterCapacityOnline, start: int) -> int:
+        """
+        Anexa al journal los vectores asignados desde el índice `start`.
+        Retorna el total de registros persistidos.
+        """
+        n = len(model.all_vectors)
+        if n > start:
+            dim = int(model._sc_matrix.shape[1])
+            records = np.zeros(n - start, dtype=_journal_dtype(dim))
+            records["seq"] = np.arange(start, n)
+            records["vector"] = np.asarray(model.all_vectors[start:n], dtype=np.float32)
+            records["label"] = model.all_labels[start:n]
+            records["subcluster"] = model.all_subclusters[start:n]
+            # Etiqueta verdadera por registro, solo en las filas que la tienen
+            has_true = model.store.has_true[start:n]
+            if has_true.any():
+                offset = int(np.count_nonzero(model.store.has_true[:start]))
+                records["has_true"] = has_true
+                records["true_label"][has_true] = model.true_labels[offset:offset + int(np.count_nonzero(has_true))]
+            with open(self.journal_file, "ab") as f:
+                f.write(records.tobytes())
+        self._write_meta(model, self._model_meta(model), self.snapshot_records())
+        return n
+
+    @staticmethod
+    def _model_meta(model: LinksClusterCapacityOnline) -> dict:
+        return {
+            "capacities": model.capacities,
+            "cluster_similarity_threshold": model.cluster_similarity_threshold,
+            "subcluster_similarity_threshold": model.subcluster_similarity_threshold,
+            "pair_similarity_maximum": model.pair_similarity_maximum,
+            "last_cluster_id": model.last_cluster_id,
+        }
+
+    def snapshot_records(self) -> int:
+        try:
+            with open(self.meta_file, "r", encoding="utf-8") as f:
+                return int(json.load(f).get("snapshot_records", 0))
+        except (OSError, ValueError):
+            return 0
+
+    def journal_records(self, dim: int, format_version: int = FORMAT_VERSION) -> int:
+        if dim <= 0 or not os.path.exists(self.journal_file):
+            return 0
+        return os.path.getsize(self.journal_file) // _journal_dtype(dim, format_version).itemsize
+
+    def load(self, mmap_dir: Optional[str] = None) -> Optional[Tuple[LinksClusterCapacityOnline, int]]:
+        """
+        Restaura snapshot + replay del journal. Retorna (modelo, registros en journal)
+        o None si no hay estado binario. Un registro final incompleto se ignora, y
+        también los que el snapshot ya contiene (compactación interrumpida).
+        """
+        if not self.exists():
+            return None
+
+        with open(self.meta_file, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with np.load(self.snapshot_file) as data:
+            arrays = {key: data[key] for key in data.files}
+        model = LinksClusterCapacityOnline.from_arrays(meta, arrays, mmap_dir=mmap_dir)
+
+        version = int(meta.get("format_version", 1))
+        dim = int(meta.get("dim", 0)) or (arrays["vectors"].shape[1] if arrays["vectors"].ndim == 2 else 0)
+        count = self.journal_records(dim, version)
+        replayed = 0
+        if count:
+            records = np.fromfile(self.journal_file, dtype=_journal_dtype(dim, version), count=count)
+            for record in records:
+                if version >= 2:
+                    seq = int(record["seq"])
+                    if seq < len(model.all_vectors):
+                        continue
+                    if seq > len(model.all_vectors):
+                        print(f"[STORAGE] Journal con hueco en {self.journal_file} (seq {seq}), se ignora el resto")
+                        break
+                replayed += 1
+                true_label = int(record["true_label"]) if record["has_true"] else None
+                model.replay_assignment(
+                    record["vector"].astype(np.float64),
+                    int(record["label"]),
+                    int(record["subcluster"]),
+                    true_label,
+                )
+        # Las capacidades del meta son las vigentes (pueden haberse actualizado)
+        model.capacities = [int(c) for c in meta["capacities"]]
+        if version < FORMAT_VERSION and count:
+            # Journal del formato anterior: se compacta para anexar ya con el nuevo
+            self.write_snapshot(model)
+        return model, replayed
@@ -104,50 +104,84 @@ def procesar_prioridad_unica(img, percentiles):
 #   Reemplaza la lógica interna con tu preprocesamiento real.
 # ====================================================
 
-def reescalar_imagen_bytes(image_bytes: bytes, size=(256, 256)) -> bytes:
+def decodificar_imagen(image_bytes: bytes, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
     img_array = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+    img = cv2.imdecode(img_array, flags)
     if img is None:
         raise ValueError("No se pudo decodificar la imagen")
+    return img
 
-    resized = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
-    success, buffer = cv2.imencode(".png", resized)
-    if not success:
-        raise ValueError("No se pudo codificar la imagen reescalada")
 
+def codificar_png(img: np.ndarray, descripcion: str = "imagen") -> bytes:
+    success, buffer = cv2.imencode(".png", img)
+    if not success:
+        raise ValueError(f"No se pudo codificar la {descripcion}")
     return buffer.tobytes()
 
 
-def procesar_imagen_bytes(image_bytes: bytes) -> bytes:
-    img_array = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-    if img is None:
-        raise ValueError("No se pudo decodificar la imagen")
+def binarizar_otsu(gris: np.ndarray) -> np.ndarray:
+    _, binaria = cv2.threshold(gris, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binaria
+
+
+def reescalar_imagen_bytes(image_bytes: bytes, size=(256, 256)) -> bytes:
+    img = decodificar_imagen(image_bytes, cv2.IMREAD_COLOR)
+    resized = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    return codificar_png(resized, "imagen reescalada")
+
 
+def procesar_imagen_bytes(image_bytes: bytes) -> bytes:
+    img = decodificar_imagen(image_bytes, cv2.IMREAD_COLOR)
     resized = cv2.resize(img, (256, 256), interpolation=cv2.INTER_AREA)
 
     # === EJEMPLO: convertir a escala de grises ===
     # Reemplaza este bloque por tu lógica real.
     procesada = escala_grises(resized)
 
-    success, buffer = cv2.imencode(".png", procesada)
-    if not success:
-        raise ValueError("No se pudo codificar la imagen procesada")
-
-    return buffer.tobytes()
+    return codificar_png(procesada, "imagen procesada")
 
 
 def binarizar_imagen_bytes(image_bytes: bytes) -> bytes:
-    img_array = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        raise ValueError("No se pudo decodificar la imagen")
-
-    _, binaria = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    img = decodificar_imagen(image_bytes, cv2.IMREAD_GRAYSCALE)
+    return codificar_png(binarizar_otsu(img), "imagen binarizada")
 
-    success, buffer = cv2.imencode(".png", binaria)
-    if not success:
-        raise ValueError("No se pudo codificar la imagen binarizada")
 
-    return buffer.tobytes()
+# ====================================================
+#   PIPELINE EN MEMORIA (DECODIFICAR UNA SOLA VEZ)
+# ====================================================
 
+class ImagenPreprocesada:
+    """
+    Imagen decodificada una sola vez con sus versiones reescalada (BGR),
+    en escala de grises y binarizada como ndarrays.
+
+    Los extractores trabajan directamente sobre estos arreglos; la
+    codificación PNG solo se hace (y se memoriza) cuando se persiste
+    un artefacto.
+    """
+
+    TIPOS_PNG = ("original", "procesada", "binarizada")
+
+    def __init__(self, bgr: np.ndarray, gris: np.ndarray, binaria: np.ndarray):
+        self.bgr = bgr
+        self.gris = gris
+        self.binaria = binaria
+        self._png: dict = {}
+
+    @classmethod
+    def desde_bytes(cls, image_bytes: bytes, size=(256, 256)) -> "ImagenPreprocesada":
+        img = decodificar_imagen(image_bytes, cv2.IMREAD_COLOR)
+        bgr = cv2.resize(img, size, interpolation=cv2.INTER_AREA) if img.shape[1::-1] != tuple(size) else img
+        gris = escala_grises(bgr)
+        return cls(bgr, gris, binarizar_otsu(gris))
+
+    def png(self, tipo: str) -> bytes:
+        """
+        Codifica (una vez) la versión indicada: original, procesada o binarizada
+        """
+        if tipo not in self.TIPOS_PNG:
+            raise ValueError(f"Tipo de imagen no válido: {tipo}")
+        if tipo not in self._png:
+            img = {"original": self.bgr, "procesada": self.gris, "binarizada": self.binaria}[tipo]
+            self._png[tipo] = codificar_png(img, f"imagen {tipo}")
+        return self._png[tipo]
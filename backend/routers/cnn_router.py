@@ -1,11 +1,14 @@
 """
 Router para endpoints de CNN (ResNet50)
 """
+import asyncio
 from typing import List
 from fastapi import APIRouter, File, UploadFile, Form, HTTPException
 from models.clustering_models import clustering_models
 from services.image_service import image_service
 from services.clustering_service import clustering_service
+from services.metrics_service import metrics_service
+from services.cnn_inference_service import cnn_inference_service
 from services.file_service import file_service
 from utils.helpers import get_data_paths
 
@@ -35,24 +38,27 @@ async def analyze_images_cnn(
     results = []
     paths = get_data_paths()
 
-    for file in files:
+    # FASE 1: leer y preprocesar todas las imágenes en el pool de trabajadores
+    imagenes = []
+    for file, procesada in zip(files, await image_service.process_files(files)):
+        if isinstance(procesada, Exception):
+            raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {procesada}")
+        imagenes.append(procesada[0])
+
+    # FASE 2: extraer características CNN en lotes (compartidos con otras peticiones)
+    try:
+        extraidas = await image_service.extract_cnn_features_cached(imagenes, cnn_inference_service.extract)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Error procesando imágenes CNN: {exc}")
+
+    # FASE 3: guardar y asignar cluster en el orden de subida
+    for file, image_data, (_, features, vector_normalizado) in zip(files, imagenes, extraidas):
         try:
-            # Procesar imagen básica
-            file_content = await file.read()
-            image_data = image_service.process_image(file_content, file.content_type, file.filename)
-            
-            # Extraer características CNN
-            cnn_bytes, features, vector_normalizado = image_service.extract_cnn_features(image_data["processed_bytes"])
-            
             # Guardar archivo original
             file_service.save_image_files(image_data, paths)
             
-            # Guardar archivo CNN procesado (imagen redimensionada a 224x224)
             file_names = image_data["file_names"]
-            cnn_name = f"{image_data['image_id']}_cnn.png"
-            cnn_path = paths["processed_dir"] + "/" + cnn_name
-            with open(cnn_path, "wb") as f:
-                f.write(cnn_bytes)
+            cnn_name = file_names["cnn"]
             
             # Crear resultado base
             result = {
@@ -66,7 +72,7 @@ async def analyze_images_cnn(
             
             # Si hay modelo de clustering y embeddings, hacer predicción
             if clustering_models.has_active_model("cnn") and features and vector_normalizado is not None:
-                cluster_id, centroid = clustering_service.predict_cluster("cnn", vector_normalizado, allow_new_clusters=True)
+                cluster_id, centroid = clustering_service.predict_cluster("cnn", vector_normalizado, allow_new_clusters=True, image_id=image_data["image_id"])
                 result.update({
                     "cluster_id": cluster_id,
                     "ultimo_centroide": centroid.tolist()
@@ -78,12 +84,11 @@ async def analyze_images_cnn(
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {exc}")
 
-    # Guardar estado y obtener métricas si hay modelo
+    # Guardar estado y encolar métricas si hay modelo (se devuelven las últimas ya calculadas)
     response = {"results": results}
     if clustering_models.has_active_model("cnn"):
         clustering_service.save_model_state("cnn")
-        metrics = clustering_service.get_metrics("cnn")
-        response["metrics"] = metrics
+        response.update(metrics_service.get_deferred("cnn"))
     
     return response
 
@@ -101,30 +106,33 @@ async def add_images_cnn(files: List[UploadFile] = File(...)):
     results = []
     paths = get_data_paths()
 
-    for file in files:
+    # FASE 1: leer y preprocesar todas las imágenes en el pool de trabajadores
+    imagenes = []
+    for file, procesada in zip(files, await image_service.process_files(files)):
+        if isinstance(procesada, Exception):
+            raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {procesada}")
+        imagenes.append(procesada[0])
+
+    # FASE 2: extraer características CNN en lotes (compartidos con otras peticiones)
+    try:
+        extraidas = await image_service.extract_cnn_features_cached(imagenes, cnn_inference_service.extract)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Error procesando imágenes CNN: {exc}")
+
+    # FASE 3: asignar cluster y guardar en el orden de subida
+    for file, image_data, (_, features, vector_normalizado) in zip(files, imagenes, extraidas):
         try:
-            # Procesar imagen básica
-            file_content = await file.read()
-            image_data = image_service.process_image(file_content, file.content_type, file.filename)
-            
-            # Extraer características CNN
-            cnn_bytes, features, vector_normalizado = image_service.extract_cnn_features(image_data["processed_bytes"])
-            
             if not features or vector_normalizado is None:
                 raise ValueError("No se pudieron extraer características CNN válidas")
             
             # Predecir cluster (sin crear nuevos)
-            cluster_id, centroid = clustering_service.predict_cluster("cnn", vector_normalizado, allow_new_clusters=False)
+            cluster_id, centroid = clustering_service.predict_cluster("cnn", vector_normalizado, allow_new_clusters=False, image_id=image_data["image_id"])
             
             # Guardar archivo original
             file_service.save_image_files(image_data, paths)
             
-            # Guardar archivo CNN procesado
             file_names = image_data["file_names"]
-            cnn_name = f"{image_data['image_id']}_cnn.png"
-            cnn_path = paths["processed_dir"] + "/" + cnn_name
-            with open(cnn_path, "wb") as f:
-                f.write(cnn_bytes)
+            cnn_name = file_names["cnn"]
             
             # Crear resultado
             result = {
@@ -144,13 +152,12 @@ async def add_images_cnn(files: List[UploadFile] = File(...)):
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {exc}")
 
-    # Guardar estado y obtener métricas
+    # Guardar estado y encolar métricas (se devuelven las últimas ya calculadas)
     clustering_service.save_model_state("cnn")
-    metrics = clustering_service.get_metrics("cnn")
     
     return {
         "results": results,
-        "metrics": metrics
+        **metrics_service.get_deferred("cnn")
     }
 
 
@@ -171,4 +178,26 @@ def get_cluster_status_cnn():
     """
     Retorna el estado actual del clustering CNN
     """
-    return clustering_service.get_model_status("cnn")
\ No newline at end of file
+    return clustering_service.get_model_status("cnn")
+
+
+@router.get("/inference-stats")
+def get_inference_stats_cnn():
+    """
+    Retorna la profundidad de la cola y estadísticas de tamaño de lote del servidor de inferencia CNN
+    """
+    return cnn_inference_service.get_stats()
+
+
+@router.get("/metrics")
+async def get_metrics_cnn(timeout: float | None = None):
+    """
+    Retorna las métricas de la versión actual del clustering CNN, esperando a que terminen de calcularse
+    """
+    try:
+        clustering_service.ensure_model_exists("cnn")
+        return await metrics_service.wait("cnn", timeout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Las métricas aún se están calculando")
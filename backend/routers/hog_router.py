@@ -1,11 +1,13 @@
 """
 Router para endpoints de HOG
 """
+import asyncio
 from typing import List
 from fastapi import APIRouter, File, UploadFile, Form, HTTPException
 from models.clustering_models import clustering_models
 from services.image_service import image_service
 from services.clustering_service import clustering_service
+from services.metrics_service import metrics_service
 from services.file_service import file_service
 from utils.helpers import get_data_paths
 
@@ -35,21 +37,18 @@ async def analyze_images_hog(
     results = []
     paths = get_data_paths()
 
-    for file in files:
+    # Preprocesar y extraer características en el pool de trabajadores (orden de subida)
+    procesadas = await image_service.process_files(files, "hog")
+
+    for file, procesada in zip(files, procesadas):
         try:
-            # Procesar imagen básica
-            file_content = await file.read()
-            image_data = image_service.process_image(file_content, file.content_type, file.filename)
-            
-            # Extraer características HOG
-            hog_bytes, descriptores_hog, vector_normalizado = image_service.extract_hog_features(image_data["processed_bytes"])
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, (descriptores_hog, vector_normalizado) = procesada
             
-            # Guardar archivo original
+            # Guardar archivos (la visualización HOG se genera al pedir processed_url)
             file_service.save_image_files(image_data, paths)
             
-            # Guardar archivo HOG procesado
-            file_service.save_specialized_image_file(hog_bytes, "hog", image_data, paths)
-            
             # Crear resultado base
             result = file_service.create_image_result(
                 image_data=image_data,
@@ -63,7 +62,7 @@ async def analyze_images_hog(
             
             # Si hay modelo de clustering y descriptores, hacer predicción
             if clustering_models.has_active_model("hog") and descriptores_hog and vector_normalizado is not None:
-                cluster_id, centroid = clustering_service.predict_cluster("hog", vector_normalizado, allow_new_clusters=True)
+                cluster_id, centroid = clustering_service.predict_cluster("hog", vector_normalizado, allow_new_clusters=True, image_id=image_data["image_id"])
                 result.update({
                     "cluster_id": cluster_id,
                     "ultimo_centroide": centroid.tolist()
@@ -75,12 +74,11 @@ async def analyze_images_hog(
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {exc}")
 
-    # Guardar estado y obtener métricas si hay modelo
+    # Guardar estado y encolar métricas si hay modelo (se devuelven las últimas ya calculadas)
     response = {"results": results}
     if clustering_models.has_active_model("hog"):
         clustering_service.save_model_state("hog")
-        metrics = clustering_service.get_metrics("hog")
-        response["metrics"] = metrics
+        response.update(metrics_service.get_deferred("hog"))
     
     return response
 
@@ -98,27 +96,24 @@ async def add_images_hog(files: List[UploadFile] = File(...)):
     results = []
     paths = get_data_paths()
 
-    for file in files:
+    # Preprocesar y extraer características en el pool de trabajadores (orden de subida)
+    procesadas = await image_service.process_files(files, "hog")
+
+    for file, procesada in zip(files, procesadas):
         try:
-            # Procesar imagen básica
-            file_content = await file.read()
-            image_data = image_service.process_image(file_content, file.content_type, file.filename)
-            
-            # Extraer características HOG
-            hog_bytes, descriptores_hog, vector_normalizado = image_service.extract_hog_features(image_data["processed_bytes"])
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, (descriptores_hog, vector_normalizado) = procesada
             
             if not descriptores_hog or vector_normalizado is None:
                 raise ValueError("No se pudieron extraer características HOG válidas")
             
             # Predecir cluster (sin crear nuevos)
-            cluster_id, centroid = clustering_service.predict_cluster("hog", vector_normalizado, allow_new_clusters=False)
+            cluster_id, centroid = clustering_service.predict_cluster("hog", vector_normalizado, allow_new_clusters=False, image_id=image_data["image_id"])
             
-            # Guardar archivo original
+            # Guardar archivos (la visualización HOG se genera al pedir processed_url)
             file_service.save_image_files(image_data, paths)
             
-            # Guardar archivo HOG procesado
-            file_service.save_specialized_image_file(hog_bytes, "hog", image_data, paths)
-            
             # Crear resultado
             result = file_service.create_image_result(
                 image_data=image_data,
@@ -137,13 +132,12 @@ async def add_images_hog(files: List[UploadFile] = File(...)):
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {exc}")
 
-    # Guardar estado y obtener métricas
+    # Guardar estado y encolar métricas (se devuelven las últimas ya calculadas)
     clustering_service.save_model_state("hog")
-    metrics = clustering_service.get_metrics("hog")
     
     return {
         "results": results,
-        "metrics": metrics
+        **metrics_service.get_deferred("hog")
     }
 
 
@@ -164,4 +158,18 @@ def get_cluster_status_hog():
     """
     Retorna el estado actual del clustering HOG
     """
-    return clustering_service.get_model_status("hog")
\ No newline at end of file
+    return clustering_service.get_model_status("hog")
+
+
+@router.get("/metrics")
+async def get_metrics_hog(timeout: float | None = None):
+    """
+    Retorna las métricas de la versión actual del clustering HOG, esperando a que terminen de calcularse
+    """
+    try:
+        clustering_service.ensure_model_exists("hog")
+        return await metrics_service.wait("hog", timeout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Las métricas aún se están calculando")
@@ -1,11 +1,13 @@
 """
 Router para endpoints de momentos Hu
 """
+import asyncio
 from typing import List
 from fastapi import APIRouter, File, UploadFile, Form, HTTPException
 from models.clustering_models import clustering_models
 from services.image_service import image_service
 from services.clustering_service import clustering_service
+from services.metrics_service import metrics_service
 from services.file_service import file_service
 from utils.helpers import get_data_paths
 
@@ -35,17 +37,17 @@ async def analyze_images_hu(
     results = []
     paths = get_data_paths()
 
-    for file in files:
+    # Preprocesar y extraer características en el pool de trabajadores (orden de subida)
+    procesadas = await image_service.process_files(files, "hu")
+
+    for file, procesada in zip(files, procesadas):
         try:
-            # Procesar imagen
-            file_content = await file.read()
-            image_data = image_service.process_image(file_content, file.content_type, file.filename)
-            
-            # Extraer momentos Hu
-            momentos_hu, vector_normalizado = image_service.extract_hu_moments(image_data["resized_bytes"])
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, (momentos_hu, vector_normalizado) = procesada
             
             # Predecir cluster
-            cluster_id, centroid = clustering_service.predict_cluster("hu", vector_normalizado)
+            cluster_id, centroid = clustering_service.predict_cluster("hu", vector_normalizado, image_id=image_data["image_id"])
             
             # Guardar archivos
             file_service.save_image_files(image_data, paths)
@@ -64,13 +66,12 @@ async def analyze_images_hu(
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {exc}")
 
-    # Guardar estado y obtener métricas
+    # Guardar estado y encolar métricas (se devuelven las últimas ya calculadas)
     clustering_service.save_model_state("hu")
-    metrics = clustering_service.get_metrics("hu")
     
     return {
         "results": results,
-        "metrics": metrics
+        **metrics_service.get_deferred("hu")
     }
 
 
@@ -87,17 +88,17 @@ async def add_images_hu(files: List[UploadFile] = File(...)):
     results = []
     paths = get_data_paths()
 
-    for file in files:
+    # Preprocesar y extraer características en el pool de trabajadores (orden de subida)
+    procesadas = await image_service.process_files(files, "hu")
+
+    for file, procesada in zip(files, procesadas):
         try:
-            # Procesar imagen
-            file_content = await file.read()
-            image_data = image_service.process_image(file_content, file.content_type, file.filename)
-            
-            # Extraer momentos Hu
-            momentos_hu, vector_normalizado = image_service.extract_hu_moments(image_data["resized_bytes"])
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, (momentos_hu, vector_normalizado) = procesada
             
             # Predecir cluster (sin crear nuevos)
-            cluster_id, centroid = clustering_service.predict_cluster("hu", vector_normalizado, allow_new_clusters=False)
+            cluster_id, centroid = clustering_service.predict_cluster("hu", vector_normalizado, allow_new_clusters=False, image_id=image_data["image_id"])
             
             # Guardar archivos
             file_service.save_image_files(image_data, paths)
@@ -116,13 +117,12 @@ async def add_images_hu(files: List[UploadFile] = File(...)):
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {exc}")
 
-    # Guardar estado y obtener métricas
+    # Guardar estado y encolar métricas (se devuelven las últimas ya calculadas)
     clustering_service.save_model_state("hu")
-    metrics = clustering_service.get_metrics("hu")
     
     return {
         "results": results,
-        "metrics": metrics
+        **metrics_service.get_deferred("hu")
     }
 
 
@@ -143,4 +143,18 @@ def get_cluster_status_hu():
     """
     Retorna el estado actual del clustering de momentos Hu
     """
-    return clustering_service.get_model_status("hu")
\ No newline at end of file
+    return clustering_service.get_model_status("hu")
+
+
+@router.get("/metrics")
+async def get_metrics_hu(timeout: float | None = None):
+    """
+    Retorna las métricas de la versión actual del clustering de momentos Hu, esperando a que terminen de calcularse
+    """
+    try:
+        clustering_service.ensure_model_exists("hu")
+        return await metrics_service.wait("hu", timeout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Las métricas aún se están calculando")
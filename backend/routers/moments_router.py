@@ -1,11 +1,13 @@
 """
 Router para endpoints de momentos regulares
 """
+import asyncio
 from typing import List
 from fastapi import APIRouter, File, UploadFile, Form, HTTPException
 from models.clustering_models import clustering_models
 from services.image_service import image_service
 from services.clustering_service import clustering_service
+from services.metrics_service import metrics_service
 from services.file_service import file_service
 from utils.helpers import get_data_paths
 
@@ -35,17 +37,17 @@ async def analyze_images(
     results = []
     paths = get_data_paths()
 
-    for file in files:
+    # Preprocesar y extraer características en el pool de trabajadores (orden de subida)
+    procesadas = await image_service.process_files(files, "moments")
+
+    for file, procesada in zip(files, procesadas):
         try:
-            # Procesar imagen
-            file_content = await file.read()
-            image_data = image_service.process_image(file_content, file.content_type, file.filename)
-            
-            # Extraer momentos
-            momentos, vector_normalizado = image_service.extract_moments(image_data["resized_bytes"])
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, (momentos, vector_normalizado) = procesada
             
             # Predecir cluster
-            cluster_id, centroid = clustering_service.predict_cluster("moments", vector_normalizado)
+            cluster_id, centroid = clustering_service.predict_cluster("moments", vector_normalizado, image_id=image_data["image_id"])
             
             # Guardar archivos
             file_service.save_image_files(image_data, paths)
@@ -64,13 +66,12 @@ async def analyze_images(
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {exc}")
 
-    # Guardar estado y obtener métricas
+    # Guardar estado y encolar métricas (se devuelven las últimas ya calculadas)
     clustering_service.save_model_state("moments")
-    metrics = clustering_service.get_metrics("moments")
     
     return {
         "results": results,
-        "metrics": metrics
+        **metrics_service.get_deferred("moments")
     }
 
 
@@ -87,17 +88,17 @@ async def add_images(files: List[UploadFile] = File(...)):
     results = []
     paths = get_data_paths()
 
-    for file in files:
+    # Preprocesar y extraer características en el pool de trabajadores (orden de subida)
+    procesadas = await image_service.process_files(files, "moments")
+
+    for file, procesada in zip(files, procesadas):
         try:
-            # Procesar imagen
-            file_content = await file.read()
-            image_data = image_service.process_image(file_content, file.content_type, file.filename)
-            
-            # Extraer momentos
-            momentos, vector_normalizado = image_service.extract_moments(image_data["resized_bytes"])
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, (momentos, vector_normalizado) = procesada
             
             # Predecir cluster (sin crear nuevos)
-            cluster_id, centroid = clustering_service.predict_cluster("moments", vector_normalizado, allow_new_clusters=False)
+            cluster_id, centroid = clustering_service.predict_cluster("moments", vector_normalizado, allow_new_clusters=False, image_id=image_data["image_id"])
             
             # Guardar archivos
             file_service.save_image_files(image_data, paths)
@@ -116,13 +117,12 @@ async def add_images(files: List[UploadFile] = File(...)):
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {exc}")
 
-    # Guardar estado y obtener métricas
+    # Guardar estado y encolar métricas (se devuelven las últimas ya calculadas)
     clustering_service.save_model_state("moments")
-    metrics = clustering_service.get_metrics("moments")
     
     return {
         "results": results,
-        "metrics": metrics
+        **metrics_service.get_deferred("moments")
     }
 
 
@@ -139,17 +139,30 @@ async def update_capacities(capacities: str = Form(...)):
 
 
 @router.get("/cluster-status")
-def get_cluster_status():
+async def get_cluster_status():
     """
     Retorna el estado actual del clustering de momentos regulares con métricas
     """
     status = clustering_service.get_model_status("moments")
     
-    # Agregar métricas de evaluación
+    # Agregar métricas de evaluación (de la versión actual, calculadas en segundo plano)
     try:
-        metrics = clustering_service.get_metrics("moments")
-        status["metrics"] = metrics
+        status["metrics"] = (await metrics_service.wait("moments"))["metrics"]
     except:
         status["metrics"] = None
     
-    return status
\ No newline at end of file
+    return status
+
+
+@router.get("/metrics")
+async def get_metrics(timeout: float | None = None):
+    """
+    Retorna las métricas de la versión actual del clustering de momentos regulares, esperando a que terminen de calcularse
+    """
+    try:
+        clustering_service.ensure_model_exists("moments")
+        return await metrics_service.wait("moments", timeout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Las métricas aún se están calculando")
@@ -0,0 +1,108 @@
+"""
+Router para re-agrupar imágenes ya guardadas (sin volver a subirlas)
+"""
+import asyncio
+import json
+import os
+from fastapi import APIRouter, Form, HTTPException
+from fastapi.responses import StreamingResponse
+from services.clustering_service import clustering_service
+from services.metrics_service import metrics_service
+from services.file_service import file_service
+from services.recluster_service import recluster_service, RECLUSTER_METHODS
+from services.image_index import image_index
+from utils.helpers import generate_file_names
+
+router = APIRouter(tags=["recluster"])
+
+
+def _ndjson(evento: dict) -> bytes:
+    return (json.dumps(evento, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _image_item(image_id: str, items: dict) -> dict:
+    """Item de la galería de la imagen, o uno construido a partir de su original"""
+    if image_id in items:
+        return dict(items[image_id])
+    path, content_type = file_service.find_original(image_id)
+    image_data = {"image_id": image_id, "file_names": generate_file_names(image_id, content_type)}
+    return file_service.create_image_result(image_data, os.path.basename(path))
+
+
+@router.post("/{method}/recluster")
+async def recluster(
+    method: str,
+    image_ids: str | None = Form(None),
+    capacities: str | None = Form(None),
+    clusters: int | None = Form(None),
+):
+    """
+    Agrupa desde cero imágenes ya guardadas: image_ids separados por comas o,
+    si se omite, todo el índice de la galería. Usa los vectores del feature
+    store y solo extrae los que falten. El modelo nuevo se construye completo
+    y reemplaza al activo antes de responder. La respuesta es NDJSON: un
+    evento "start", un "assignment" (o "error") por imagen en orden y un
+    "done" final con el estado de las métricas.
+    """
+    if method not in RECLUSTER_METHODS:
+        raise HTTPException(status_code=404, detail=f"Método no válido: {method}")
+
+    if image_ids:
+        ids = list(dict.fromkeys(i.strip() for i in image_ids.split(",") if i.strip()))
+    else:
+        ids = image_index.list_ids()
+    if not ids:
+        raise HTTPException(status_code=400, detail="No hay imágenes para agrupar")
+
+    # Se valida y se resuelve todo antes de tocar el modelo activo: un error
+    # aquí deja intacto el modelo que hubiera
+    try:
+        caps = clustering_service.resolve_capacities(capacities, clusters)
+        vectores, errores, extraidas = await recluster_service.resolve_vectors(method, ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    pares = [(image_id, vectores[image_id]) for image_id in ids if image_id in vectores]
+    if not pares:
+        raise HTTPException(status_code=400, detail=f"Ninguna imagen tiene vector: {next(iter(errores.values()), 'Sin vector')}")
+
+    # El modelo se construye aparte y solo se activa (y guarda) completo
+    model, asignaciones, fallo = await asyncio.to_thread(clustering_service.build_model, method, caps, pares)
+    clustering_service.install_model(method, model, asignaciones)
+    done = {
+        "type": "done",
+        "assigned": len(asignaciones),
+        "num_clusters": len(model.clusters),
+        **metrics_service.get_deferred(method),
+    }
+    asignadas = {image_id: (cluster_id, centroid) for image_id, cluster_id, centroid in asignaciones}
+    items = image_index.get_many(ids)
+    print(f"[RECLUSTER] method={method} model={model.model_id} asignadas={len(asignaciones)}/{len(ids)}")
+
+    def eventos():
+        # Solo se emiten resultados ya calculados: desconectarse no afecta al modelo
+        yield _ndjson({
+            "type": "start",
+            "method": method,
+            "total": len(ids),
+            "from_store": len(vectores) - extraidas,
+            "extracted": extraidas,
+        })
+        for image_id in ids:
+            if image_id not in vectores:
+                yield _ndjson({"type": "error", "id": image_id, "detail": errores.get(image_id, "Sin vector")})
+                continue
+            if image_id not in asignadas:
+                # Capacidad agotada o dimensión distinta: el resto tampoco entró
+                yield _ndjson({"type": "error", "id": image_id, "detail": fallo[1] if fallo else "Sin asignar"})
+                break
+            cluster_id, centroid = asignadas[image_id]
+            try:
+                result = _image_item(image_id, items)
+            except ValueError:
+                result = {"id": image_id}
+            result.update({"type": "assignment", "cluster_id": cluster_id, "ultimo_centroide": centroid.tolist()})
+            yield _ndjson(result)
+        yield _ndjson(done)
+
+    return StreamingResponse(eventos(), media_type="application/x-ndjson")
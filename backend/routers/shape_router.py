@@ -0,0 +1,175 @@
+"""
+Router multi-descriptor de forma: momentos regulares, Hu y Zernike de una sola binarización
+"""
+from typing import List
+from fastapi import APIRouter, File, UploadFile, Form, HTTPException
+from feature_extraction.moments import FAMILIAS_FORMA
+from models.clustering_models import clustering_models
+from services.image_service import image_service
+from services.clustering_service import clustering_service
+from services.metrics_service import metrics_service
+from services.file_service import file_service
+from utils.helpers import get_data_paths
+
+router = APIRouter(prefix="/shape", tags=["shape"])
+
+# Clave con la que cada familia aparece en los resultados (igual que en su router)
+CLAVES_RESULTADO = {"moments": "moments", "hu": "momentos_hu", "zernike": "momentos_zernike"}
+
+
+def _parse_methods(methods: str | None) -> tuple:
+    """
+    Parsea la lista de familias separadas por comas (todas por defecto)
+    """
+    if not methods:
+        return FAMILIAS_FORMA
+    familias = tuple(dict.fromkeys(m.strip().lower() for m in methods.split(",") if m.strip()))
+    invalidas = [f for f in familias if f not in FAMILIAS_FORMA]
+    if not familias or invalidas:
+        raise HTTPException(
+            status_code=400,
+            detail=f"methods inválido: use una lista de {', '.join(FAMILIAS_FORMA)}"
+        )
+    return familias
+
+
+@router.post("/analyze")
+async def analyze_images_shape(
+    files: List[UploadFile] = File(...),
+    methods: str | None = Form(None),
+    capacities: str | None = Form(None),
+    clusters: int | None = Form(None),
+    reset: bool = Form(False),
+):
+    """
+    Extrae varias familias de momentos (moments, hu, zernike) decodificando y
+    binarizando cada imagen una sola vez, y asigna cada vector al clustering
+    de su familia
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No se enviaron archivos")
+
+    familias = _parse_methods(methods)
+
+    # Inicializar el clustering de cada familia si se proporcionan parámetros
+    if capacities or clusters or reset:
+        try:
+            for familia in familias:
+                caps = clustering_service.initialize_clustering(familia, capacities, clusters, reset)
+                clustering_models.get_model(familia, caps)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    results = []
+    paths = get_data_paths()
+
+    # Preprocesar y extraer todas las familias en el pool de trabajadores (orden de subida)
+    procesadas = await image_service.process_files(files, "shape", familias)
+
+    for file, procesada in zip(files, procesadas):
+        try:
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, descriptores = procesada
+
+            # Guardar archivos
+            file_service.save_image_files(image_data, paths)
+
+            # Crear resultado base con los descriptores de cada familia
+            result = file_service.create_image_result(
+                image_data=image_data,
+                filename=file.filename,
+                features={CLAVES_RESULTADO[f]: descriptores[f][0] for f in familias}
+            )
+
+            # Asignar cluster en cada familia con modelo activo
+            result["clusters"] = {}
+            for familia in familias:
+                if clustering_models.has_active_model(familia):
+                    cluster_id, centroid = clustering_service.predict_cluster(familia, descriptores[familia][1], allow_new_clusters=True, image_id=image_data["image_id"])
+                    result["clusters"][familia] = {
+                        "cluster_id": cluster_id,
+                        "ultimo_centroide": centroid.tolist()
+                    }
+                    print(f"[SHAPE-CLUSTER] id={image_data['image_id']} familia={familia} cluster={cluster_id}")
+
+            results.append(result)
+
+        except Exception as exc:
+            raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {exc}")
+
+    # Guardar estado y encolar métricas de cada familia con modelo activo
+    metrics = {}
+    for familia in familias:
+        if clustering_models.has_active_model(familia):
+            clustering_service.save_model_state(familia)
+            metrics[familia] = metrics_service.get_deferred(familia)
+
+    return {"results": results, "metrics": metrics}
+
+
+@router.post("/add-images")
+async def add_images_shape(
+    files: List[UploadFile] = File(...),
+    methods: str | None = Form(None),
+):
+    """
+    Agrega nuevas imágenes a los clusterings existentes de cada familia de momentos
+    """
+    familias = _parse_methods(methods)
+    try:
+        for familia in familias:
+            clustering_service.ensure_model_exists(
+                familia, f"No hay modelo de clustering activo para {familia}. Usa /shape/analyze primero"
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not files:
+        raise HTTPException(status_code=400, detail="No se enviaron archivos")
+
+    results = []
+    paths = get_data_paths()
+
+    # Preprocesar y extraer todas las familias en el pool de trabajadores (orden de subida)
+    procesadas = await image_service.process_files(files, "shape", familias)
+
+    for file, procesada in zip(files, procesadas):
+        try:
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, descriptores = procesada
+
+            # Predecir cluster en cada familia (sin crear nuevos)
+            asignaciones = {}
+            for familia in familias:
+                cluster_id, centroid = clustering_service.predict_cluster(familia, descriptores[familia][1], allow_new_clusters=False, image_id=image_data["image_id"])
+                asignaciones[familia] = {
+                    "cluster_id": cluster_id,
+                    "ultimo_centroide": centroid.tolist()
+                }
+
+            # Guardar archivos
+            file_service.save_image_files(image_data, paths)
+
+            # Crear resultado
+            result = file_service.create_image_result(
+                image_data=image_data,
+                filename=file.filename,
+                features={CLAVES_RESULTADO[f]: descriptores[f][0] for f in familias}
+            )
+            result["clusters"] = asignaciones
+
+            results.append(result)
+            print(f"[ADD-SHAPE-CLUSTER] id={image_data['image_id']} clusters={ {f: a['cluster_id'] for f, a in asignaciones.items()} }")
+
+        except Exception as exc:
+            raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {exc}")
+
+    # Guardar estado y encolar métricas (se devuelven las últimas ya calculadas)
+    metrics = {}
+    for familia in familias:
+        clustering_service.save_model_state(familia)
+        metrics[familia] = metrics_service.get_deferred(familia)
+
+    return {"results": results, "metrics": metrics}
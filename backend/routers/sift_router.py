@@ -1,17 +1,83 @@
 """
 Router para endpoints de SIFT
 """
+import asyncio
 from typing import List
 from fastapi import APIRouter, File, UploadFile, Form, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
 from models.clustering_models import clustering_models
 from services.image_service import image_service
 from services.clustering_service import clustering_service
+from services.metrics_service import metrics_service
 from services.file_service import file_service
+from services.sift_encoding_service import sift_encoding_service, CODEBOOK_VECTOR_KEYS
+from services.recluster_service import recluster_service
+from services.descriptor_store import sift_descriptor_store
+from services.feature_store import feature_stores
 from utils.helpers import get_data_paths
 
 router = APIRouter(prefix="/sift", tags=["sift"])
 
 
+def _descriptor_features(image_id: str, descriptores) -> dict:
+    """
+    Guarda los descriptores en el almacén binario y retorna solo el conteo y
+    la referencia para descargarlos (GET /api/sift/descriptors/{id})
+    """
+    if not sift_descriptor_store.exists(image_id):
+        sift_descriptor_store.save(image_id, descriptores)
+    return {
+        "num_keypoints": len(descriptores),
+        "descriptors_url": f"/api/sift/descriptors/{image_id}",
+        "descriptors_dtype": str(descriptores.dtype),
+    }
+
+
+async def _encode(procesadas: list) -> list:
+    """
+    Vector codificado de cada imagen procesada (None si falló o no se pudo
+    codificar). Los descriptores de las imágenes nuevas se guardan antes: si
+    con ellas toca (re)entrenar el codebook, el refit los incluye.
+    """
+    nuevas = [
+        procesada for procesada in procesadas
+        if not isinstance(procesada, Exception) and not procesada[0].get("deduplicated")
+    ]
+    for image_data, (_, descriptores, _) in nuevas:
+        if not sift_descriptor_store.exists(image_data["image_id"]):
+            sift_descriptor_store.save(image_data["image_id"], descriptores)
+    if sift_encoding_service.observe(len(nuevas)):
+        try:
+            await recluster_service.refit_sift_codebook(automatic=True)
+        except ValueError as e:
+            # Pocos descriptores todavía: se reintenta con las próximas imágenes
+            print(f"[SIFT-CODEBOOK] No se pudo entrenar: {e}")
+    return sift_encoding_service.encode_batch(
+        [None if isinstance(procesada, Exception) else procesada[1][1] for procesada in procesadas]
+    )
+
+
+def _cluster_error(descriptores) -> str:
+    """Motivo por el que una imagen no tiene vector SIFT para agrupar"""
+    if not len(descriptores):
+        return "No se encontraron descriptores SIFT"
+    status = sift_encoding_service.get_status()
+    return (
+        f"El codebook visual aún no está entrenado "
+        f"({status['images_since_training']}/{status['min_images']} imágenes)"
+    )
+
+
+def _store_vectors(procesadas: list, vectores: list):
+    """Guarda en el feature store los vectores ya codificados (los que se agrupan)"""
+    pares = [
+        (procesada[0]["image_id"], vector)
+        for procesada, vector in zip(procesadas, vectores)
+        if not isinstance(procesada, Exception) and vector is not None
+    ]
+    feature_stores.for_method("sift").put_many([p[0] for p in pares], [p[1] for p in pares])
+
+
 @router.post("/analyze")
 async def analyze_images_sift(
     files: List[UploadFile] = File(...),
@@ -19,7 +85,8 @@ async def analyze_images_sift(
     clusters: int = Form(None)
 ):
     """
-    Analiza imágenes con SIFT y realiza clustering usando promedio de descriptores
+    Analiza imágenes con SIFT y realiza clustering con la codificación
+    configurada (BoVW/VLAD sobre el codebook visual, o promedio de descriptores)
     """
     if not files:
         raise HTTPException(status_code=400, detail="No se enviaron archivos")
@@ -35,52 +102,53 @@ async def analyze_images_sift(
     results = []
     paths = get_data_paths()
 
-    for file in files:
+    # Preprocesar y extraer características en el pool de trabajadores (orden de subida)
+    procesadas = await image_service.process_files(files, "sift")
+
+    # Codificar con el codebook visual (las imágenes nuevas pueden disparar su entrenamiento)
+    vectores = await _encode(procesadas)
+    _store_vectors(procesadas, vectores)
+
+    for file, procesada, vector_normalizado in zip(files, procesadas, vectores):
         try:
-            # Procesar imagen básica
-            file_content = await file.read()
-            image_data = image_service.process_image(file_content, file.content_type, file.filename)
-            
-            # Extraer características SIFT
-            sift_bytes, descriptores, vector_normalizado = image_service.extract_sift_features(image_data["processed_bytes"])
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, (_, descriptores, _) = procesada
             
             # Guardar archivo original
             file_service.save_image_files(image_data, paths)
             
-            # Guardar archivo SIFT procesado
-            file_service.save_specialized_image_file(sift_bytes, "sift", image_data, paths)
-            
-            # Crear resultado base
+            # Crear resultado base (los descriptores van al almacén binario, no al JSON)
             result = file_service.create_image_result(
                 image_data=image_data,
                 filename=file.filename,
-                features={
-                    "descriptores": descriptores,
-                    "num_keypoints": len(descriptores) if descriptores else 0
-                },
+                features=_descriptor_features(image_data["image_id"], descriptores),
                 file_type="sift"
             )
             
             # Si hay modelo de clustering y descriptores, hacer predicción
-            if clustering_models.has_active_model("sift") and descriptores and vector_normalizado is not None:
-                cluster_id, centroid = clustering_service.predict_cluster("sift", vector_normalizado, allow_new_clusters=True)
+            if clustering_models.has_active_model("sift") and len(descriptores) and vector_normalizado is not None:
+                cluster_id, centroid = clustering_service.predict_cluster("sift", vector_normalizado, allow_new_clusters=True, image_id=image_data["image_id"])
                 result.update({
                     "cluster_id": cluster_id,
                     "ultimo_centroide": centroid.tolist()
                 })
                 print(f"[SIFT-CLUSTER] id={image_data['image_id']} cluster={cluster_id} keypoints={len(descriptores)} centroid={centroid.tolist()}")
+            elif clustering_models.has_active_model("sift"):
+                # Sin vector (sin descriptores o codebook sin entrenar): se informa por imagen
+                result["cluster_error"] = _cluster_error(descriptores)
             
             results.append(result)
             
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {exc}")
 
-    # Guardar estado y obtener métricas si hay modelo
+    # Guardar codebook, estado y encolar métricas si hay modelo (se devuelven las últimas ya calculadas)
+    sift_encoding_service.save()
     response = {"results": results}
     if clustering_models.has_active_model("sift"):
         clustering_service.save_model_state("sift")
-        metrics = clustering_service.get_metrics("sift")
-        response["metrics"] = metrics
+        response.update(metrics_service.get_deferred("sift"))
     
     return response
 
@@ -98,35 +166,33 @@ async def add_images_sift(files: List[UploadFile] = File(...)):
     results = []
     paths = get_data_paths()
 
-    for file in files:
+    # Preprocesar y extraer características en el pool de trabajadores (orden de subida)
+    procesadas = await image_service.process_files(files, "sift")
+
+    # Codificar con el codebook visual (las imágenes nuevas pueden disparar su entrenamiento)
+    vectores = await _encode(procesadas)
+    _store_vectors(procesadas, vectores)
+
+    for file, procesada, vector_normalizado in zip(files, procesadas, vectores):
         try:
-            # Procesar imagen básica
-            file_content = await file.read()
-            image_data = image_service.process_image(file_content, file.content_type, file.filename)
-            
-            # Extraer características SIFT
-            sift_bytes, descriptores, vector_normalizado = image_service.extract_sift_features(image_data["processed_bytes"])
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, (_, descriptores, _) = procesada
             
-            if not descriptores or vector_normalizado is None:
-                raise ValueError("No se pudieron extraer características SIFT válidas")
+            if not len(descriptores) or vector_normalizado is None:
+                raise ValueError(_cluster_error(descriptores))
             
             # Predecir cluster (sin crear nuevos)
-            cluster_id, centroid = clustering_service.predict_cluster("sift", vector_normalizado, allow_new_clusters=False)
+            cluster_id, centroid = clustering_service.predict_cluster("sift", vector_normalizado, allow_new_clusters=False, image_id=image_data["image_id"])
             
             # Guardar archivo original
             file_service.save_image_files(image_data, paths)
             
-            # Guardar archivo SIFT procesado
-            file_service.save_specialized_image_file(sift_bytes, "sift", image_data, paths)
-            
-            # Crear resultado
+            # Crear resultado (los descriptores van al almacén binario, no al JSON)
             result = file_service.create_image_result(
                 image_data=image_data,
                 filename=file.filename,
-                features={
-                    "descriptores": descriptores,
-                    "num_keypoints": len(descriptores)
-                },
+                features=_descriptor_features(image_data["image_id"], descriptores),
                 cluster_data={"cluster_id": cluster_id, "centroid": centroid},
                 file_type="sift"
             )
@@ -137,13 +203,13 @@ async def add_images_sift(files: List[UploadFile] = File(...)):
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {exc}")
 
-    # Guardar estado y obtener métricas
+    # Guardar codebook, estado y encolar métricas (se devuelven las últimas ya calculadas)
+    sift_encoding_service.save()
     clustering_service.save_model_state("sift")
-    metrics = clustering_service.get_metrics("sift")
     
     return {
         "results": results,
-        "metrics": metrics
+        **metrics_service.get_deferred("sift")
     }
 
 
@@ -164,4 +230,88 @@ def get_cluster_status_sift():
     """
     Retorna el estado actual del clustering SIFT
     """
-    return clustering_service.get_model_status("sift")
\ No newline at end of file
+    return clustering_service.get_model_status("sift")
+
+
+@router.get("/descriptors/{image_id}")
+def get_descriptors_sift(image_id: str, format: str = "raw"):
+    """
+    Descarga los descriptores SIFT de una imagen en binario.
+    format=raw: bytes C-order transmitidos por fragmentos, con el dtype y la forma
+    en las cabeceras X-Descriptor-Dtype / X-Descriptor-Shape.
+    format=npy: el archivo .npy tal cual (np.load lo lee directamente).
+    """
+    if format not in ("raw", "npy"):
+        raise HTTPException(status_code=400, detail="format inválido: use raw o npy")
+    try:
+        if not sift_descriptor_store.exists(image_id):
+            raise HTTPException(status_code=404, detail="No hay descriptores para esa imagen")
+        if format == "npy":
+            return FileResponse(
+                sift_descriptor_store.path(image_id),
+                media_type="application/octet-stream",
+                filename=f"{image_id}_sift.npy",
+            )
+        descriptores = sift_descriptor_store.load(image_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        sift_descriptor_store.iter_bytes(image_id),
+        media_type="application/octet-stream",
+        headers={
+            "Content-Length": str(descriptores.nbytes),
+            "X-Descriptor-Dtype": str(descriptores.dtype),
+            "X-Descriptor-Shape": ",".join(str(d) for d in descriptores.shape),
+        },
+    )
+
+
+@router.get("/codebook")
+def get_codebook_sift():
+    """
+    Retorna el estado del codebook visual SIFT (codificación, palabras, descriptores vistos)
+    """
+    return sift_encoding_service.get_status()
+
+
+@router.post("/codebook/refit")
+async def refit_codebook_sift():
+    """
+    Re-entrena el codebook visual SIFT con los descriptores guardados de todas
+    las imágenes, vuelve a codificarlas y reconstruye el modelo SIFT activo
+    (mismas capacidades) con los vectores nuevos
+    """
+    try:
+        result = await recluster_service.refit_sift_codebook()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok", **result, **sift_encoding_service.get_status()}
+
+
+@router.delete("/codebook")
+def reset_codebook_sift():
+    """
+    Descarta el codebook visual SIFT y los vectores codificados con él; se
+    vuelve a entrenar (con todos los descriptores guardados) cuando lleguen
+    SIFT_CODEBOOK_MIN_IMAGES imágenes nuevas. El modelo actual queda
+    codificado con el anterior: conviene resetear el clustering (o usar refit).
+    """
+    sift_encoding_service.reset()
+    for key in CODEBOOK_VECTOR_KEYS:
+        feature_stores.get(key).reset()
+    return {"status": "ok", **sift_encoding_service.get_status()}
+
+
+@router.get("/metrics")
+async def get_metrics_sift(timeout: float | None = None):
+    """
+    Retorna las métricas de la versión actual del clustering SIFT, esperando a que terminen de calcularse
+    """
+    try:
+        clustering_service.ensure_model_exists("sift")
+        return await metrics_service.wait("sift", timeout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Las métricas aún se están calculando")
@@ -1,11 +1,13 @@
 """
 Router para endpoints de momentos Zernike
 """
+import asyncio
 from typing import List
 from fastapi import APIRouter, File, UploadFile, Form, HTTPException
 from models.clustering_models import clustering_models
 from services.image_service import image_service
 from services.clustering_service import clustering_service
+from services.metrics_service import metrics_service
 from services.file_service import file_service
 from utils.helpers import get_data_paths
 
@@ -35,14 +37,14 @@ async def analyze_images_zernike(
     results = []
     paths = get_data_paths()
 
-    for file in files:
+    # Preprocesar y extraer características en el pool de trabajadores (orden de subida)
+    procesadas = await image_service.process_files(files, "zernike")
+
+    for file, procesada in zip(files, procesadas):
         try:
-            # Procesar imagen
-            file_content = await file.read()
-            image_data = image_service.process_image(file_content, file.content_type, file.filename)
-            
-            # Extraer momentos Zernike
-            momentos_zernike, vector_normalizado = image_service.extract_zernike_moments(image_data["resized_bytes"])
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, (momentos_zernike, vector_normalizado) = procesada
             
             # Guardar archivos
             file_service.save_image_files(image_data, paths)
@@ -56,7 +58,7 @@ async def analyze_images_zernike(
             
             # Si hay modelo de clustering, hacer predicción
             if clustering_models.has_active_model("zernike"):
-                cluster_id, centroid = clustering_service.predict_cluster("zernike", vector_normalizado, allow_new_clusters=True)
+                cluster_id, centroid = clustering_service.predict_cluster("zernike", vector_normalizado, allow_new_clusters=True, image_id=image_data["image_id"])
                 result.update({
                     "cluster_id": cluster_id,
                     "ultimo_centroide": centroid.tolist()
@@ -68,12 +70,11 @@ async def analyze_images_zernike(
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {exc}")
 
-    # Guardar estado y obtener métricas si hay modelo
+    # Guardar estado y encolar métricas si hay modelo (se devuelven las últimas ya calculadas)
     response = {"results": results}
     if clustering_models.has_active_model("zernike"):
         clustering_service.save_model_state("zernike")
-        metrics = clustering_service.get_metrics("zernike")
-        response["metrics"] = metrics
+        response.update(metrics_service.get_deferred("zernike"))
     
     return response
 
@@ -91,17 +92,17 @@ async def add_images_zernike(files: List[UploadFile] = File(...)):
     results = []
     paths = get_data_paths()
 
-    for file in files:
+    # Preprocesar y extraer características en el pool de trabajadores (orden de subida)
+    procesadas = await image_service.process_files(files, "zernike")
+
+    for file, procesada in zip(files, procesadas):
         try:
-            # Procesar imagen
-            file_content = await file.read()
-            image_data = image_service.process_image(file_content, file.content_type, file.filename)
-            
-            # Extraer momentos Zernike
-            momentos_zernike, vector_normalizado = image_service.extract_zernike_moments(image_data["resized_bytes"])
+            if isinstance(procesada, Exception):
+                raise procesada
+            image_data, (momentos_zernike, vector_normalizado) = procesada
             
             # Predecir cluster (sin crear nuevos)
-            cluster_id, centroid = clustering_service.predict_cluster("zernike", vector_normalizado, allow_new_clusters=False)
+            cluster_id, centroid = clustering_service.predict_cluster("zernike", vector_normalizado, allow_new_clusters=False, image_id=image_data["image_id"])
             
             # Guardar archivos
             file_service.save_image_files(image_data, paths)
@@ -120,13 +121,12 @@ async def add_images_zernike(files: List[UploadFile] = File(...)):
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Error procesando {file.filename}: {exc}")
 
-    # Guardar estado y obtener métricas
+    # Guardar estado y encolar métricas (se devuelven las últimas ya calculadas)
     clustering_service.save_model_state("zernike")
-    metrics = clustering_service.get_metrics("zernike")
     
     return {
         "results": results,
-        "metrics": metrics
+        **metrics_service.get_deferred("zernike")
     }
 
 
@@ -147,4 +147,18 @@ def get_cluster_status_zernike():
     """
     Retorna el estado actual del clustering Zernike
     """
-    return clustering_service.get_model_status("zernike")
\ No newline at end of file
+    return clustering_service.get_model_status("zernike")
+
+
+@router.get("/metrics")
+async def get_metrics_zernike(timeout: float | None = None):
+    """
+    Retorna las métricas de la versión actual del clustering Zernike, esperando a que terminen de calcularse
+    """
+    try:
+        clustering_service.ensure_model_exists("zernike")
+        return await metrics_service.wait("zernike", timeout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Las métricas aún se están calculando")
@@ -0,0 +1,182 @@
+"""
+Localizador de artefactos en memoria: (image_id, tipo) -> ruta en disco, para
+servir imágenes sin sondear el sistema de archivos en cada petición
+"""
+import os
+import re
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import quote
+
+from utils.helpers import get_data_dir, get_data_paths, ACCEL_REDIRECT_PREFIX
+from services.image_index import image_index
+
+# Directorio (clave de get_data_paths) de cada tipo de artefacto
+ARTIFACT_DIRS = {
+    "original": "original_dir",
+    "processed": "processed_dir",
+    "binarized": "binarized_dir",
+    "sift": "processed_dir",
+    "hog": "processed_dir",
+    "cnn": "processed_dir",
+}
+
+# Nombres de generate_file_names: {id}.jpg|.png (original) o {id}_{tipo}.png
+ARTIFACT_NAME_RE = re.compile(r"^([0-9a-f]{32})(?:_(processed|binarized|sift|hog|cnn))?\.(?:jpg|jpeg|png)$")
+IMAGE_ID_PREFIX_RE = re.compile(r"^([0-9a-f]{32})(?:_[a-z]+)?$")
+
+# Los artefactos no cambian una vez escritos (el nombre incluye el image_id)
+ARTIFACT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Marca en la tabla meta del índice: los directorios ya se recorrieron una vez
+SCANNED_META_KEY = "artifacts_scanned"
+
+
+def parse_artifact_name(file_name: str) -> Optional[Tuple[str, str]]:
+    """(image_id, tipo) de un nombre de archivo generado, o None"""
+    match = ARTIFACT_NAME_RE.match(file_name or "")
+    if not match:
+        return None
+    return match.group(1), match.group(2) or "original"
+
+
+def derived_file_name(image_id: str, kind: str) -> str:
+    """Nombre del archivo de un artefacto derivado (igual que generate_file_names)"""
+    return f"{image_id}_{kind}.png"
+
+
+def image_id_from_name(name: str) -> Optional[str]:
+    """image_id con el que empieza un nombre ({id}, {id}_processed, ...), o None"""
+    match = IMAGE_ID_PREFIX_RE.match(name or "")
+    return match.group(1) if match else None
+
+
+class ArtifactLocator:
+    """
+    Se construye una vez por DATA_DIR desde la tabla artifacts del índice y se
+    actualiza al guardar archivos. Los archivos escritos antes de que existiera
+    esa tabla se incorporan con un único recorrido de los directorios. El stat
+    de cada archivo se guarda junto a su ruta la primera vez que se sirve.
+    """
+
+    def __init__(self):
+        self._data_dir: Optional[str] = None
+        self._paths: Dict[Tuple[str, str], str] = {}
+        self._resolved: Dict[Tuple[str, str], Tuple[str, os.stat_result]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _path(kind: str, file_name: str, paths: dict) -> str:
+        return os.path.join(paths[ARTIFACT_DIRS[kind]], file_name)
+
+    def load(self):
+        """Construye el mapa del DATA_DIR actual (no hace nada si ya está construido)"""
+        data_dir = get_data_dir()
+        if self._data_dir == data_dir:
+            return
+        with self._lock:
+            if self._data_dir == data_dir:
+                return
+            paths = get_data_paths()
+            if not image_index.get_meta(SCANNED_META_KEY):
+                self._scan(paths)
+            self._paths = {
+                (image_id, kind): self._path(kind, file_name, paths)
+                for image_id, kind, file_name in image_index.all_artifacts()
+                if kind in ARTIFACT_DIRS
+            }
+            self._resolved = {}
+            self._data_dir = data_dir
+            print(f"[ARTIFACTS] {len(self._paths)} artefactos indexados en {data_dir}")
+
+    @staticmethod
+    def _scan(paths: dict):
+        """Registra en el índice los artefactos que ya estaban en disco"""
+        rows = []
+        for directory in sorted(set(ARTIFACT_DIRS.values())):
+            with os.scandir(paths[directory]) as entries:
+                for entry in entries:
+                    parsed = parse_artifact_name(entry.name)
+                    if parsed and ARTIFACT_DIRS[parsed[1]] == directory and entry.is_file():
+                        rows.append((*parsed, entry.name))
+        image_index.add_artifacts(rows)
+        image_index.set_meta(SCANNED_META_KEY, 1)
+
+    def register(self, rows: Iterable[Tuple[str, str, str]]):
+        """Registra [(image_id, tipo, nombre de archivo)] recién escritos (memoria e índice)"""
+        rows = [row for row in rows if row[1] in ARTIFACT_DIRS]
+        if not rows:
+            return
+        image_index.add_artifacts(rows)
+        if self._data_dir != get_data_dir():
+            # Aún no construido: la construcción leerá estas filas del índice
+            return
+        paths = get_data_paths()
+        with self._lock:
+            for image_id, kind, file_name in rows:
+                self._paths[(image_id, kind)] = self._path(kind, file_name, paths)
+                self._resolved.pop((image_id, kind), None)
+
+    def resolve(self, image_id: str, kind: str) -> Optional[Tuple[str, os.stat_result]]:
+        """(ruta, stat) del artefacto o None si no existe"""
+        self.load()
+        if not image_id:
+            return None
+        key = (image_id, kind)
+        resolved = self._resolved.get(key)
+        if resolved is not None:
+            return resolved
+
+        path = self._paths.get(key)
+        if path is None:
+            # Puede haberlo escrito otro proceso: se consulta el índice, no el disco
+            file_name = image_index.artifacts(image_id).get(kind)
+            if file_name is None or kind not in ARTIFACT_DIRS:
+                return None
+            path = self._path(kind, file_name, get_data_paths())
+        try:
+            stat = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._paths.pop(key, None)
+            return None
+        with self._lock:
+            self._paths[key] = path
+            self._resolved[key] = (path, stat)
+        return path, stat
+
+    def resolve_name(self, file_name: str, kinds: Tuple[str, ...] = None) -> Optional[Tuple[str, os.stat_result]]:
+        """Resuelve un nombre de archivo generado, opcionalmente restringido a ciertos tipos"""
+        parsed = parse_artifact_name(file_name)
+        if parsed is None or (kinds and parsed[1] not in kinds):
+            return None
+        found = self.resolve(*parsed)
+        if found is None or os.path.basename(found[0]) != file_name:
+            return None
+        return found
+
+    @staticmethod
+    def accel_uri(path: str) -> str:
+        """URI interna de nginx para un artefacto (ruta relativa a DATA_DIR bajo ACCEL_REDIRECT_PREFIX)"""
+        relativa = os.path.relpath(path, get_data_dir()).replace(os.sep, "/")
+        return ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + quote(relativa)
+
+    @staticmethod
+    def etag(stat: os.stat_result) -> str:
+        return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+    def forget(self, image_id: str, kind: str):
+        """Olvida la ruta de un artefacto (su archivo se acaba de borrar)"""
+        with self._lock:
+            self._paths.pop((image_id, kind), None)
+            self._resolved.pop((image_id, kind), None)
+
+    def clear(self):
+        """Olvida todas las rutas (los archivos se acaban de borrar)"""
+        with self._lock:
+            self._paths = {}
+            self._resolved = {}
+
+
+# Instancia global del localizador
+artifact_locator = ArtifactLocator()
@@ -1,10 +1,17 @@
 """
 Servicio para lógica de clustering
 """
+import threading
 import numpy as np
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from models.clustering_models import clustering_models
-from utils.helpers import parse_capacities
+from services.image_index import image_index
+from utils.helpers import (
+    parse_capacities,
+    SILHOUETTE_EXACT_MAX_POINTS,
+    SILHOUETTE_SAMPLE_SIZE,
+    SILHOUETTE_SAMPLE_SEED,
+)
 
 
 class ClusteringService:
@@ -12,6 +19,11 @@ class ClusteringService:
     Servicio para manejar la lógica de clustering
     """
     
+    # Asignaciones pendientes por método: se escriben en el índice en un solo
+    # lote al guardar el estado del modelo (una transacción por petición)
+    _pending_assignments: Dict[str, list] = {}
+    _pending_lock = threading.Lock()
+    
     @staticmethod
     def initialize_clustering(
         model_type: str,
@@ -22,9 +34,19 @@ class ClusteringService:
         """
         Inicializa un modelo de clustering con capacidades o número de clusters
         """
+        # Se valida antes de resetear: unos parámetros inválidos no destruyen el modelo
+        caps = ClusteringService.resolve_capacities(capacities, clusters)
         if reset or capacities or clusters:
             clustering_models.reset_model(model_type)
         
+        return caps
+    
+    @staticmethod
+    def resolve_capacities(capacities: Optional[str] = None, clusters: Optional[int] = None) -> List[int]:
+        """
+        Valida capacities o el número de clusters y retorna las capacidades,
+        sin tocar el modelo activo
+        """
         if capacities is None and clusters is None:
             raise ValueError("Debes indicar capacities o número de clusters")
         
@@ -45,26 +67,77 @@ class ClusteringService:
         return caps
     
     @staticmethod
-    def predict_cluster(model_type: str, vector, allow_new_clusters: bool = True, true_label: int = None) -> tuple:
+    def predict_cluster(model_type: str, vector, allow_new_clusters: bool = True, true_label: int = None, image_id: str = None) -> tuple:
         """
-        Predice el cluster para un vector dado
+        Predice el cluster para un vector dado. Con image_id, la asignación
+        queda registrada en el índice al guardar el estado del modelo.
         """
         model = clustering_models._models.get(model_type)
         if not model:
             raise ValueError(f"No hay modelo activo para {model_type}")
         
-        # Convertir vector a numpy array si no lo es
-        if not isinstance(vector, np.ndarray):
-            vector = np.array(vector, dtype=float)
-        
+        vector = ClusteringService._check_vector(model_type, model, vector)
         cluster_id, centroid = model.predict_with_centroid(
             vector,
             allow_new_clusters=allow_new_clusters,
             true_label=true_label
         )
         
+        if image_id:
+            with ClusteringService._pending_lock:
+                ClusteringService._pending_assignments.setdefault(model_type, []).append((model.model_id, image_id, cluster_id))
+        
         return cluster_id, centroid
     
+    @staticmethod
+    def _check_vector(model_type: str, model, vector) -> np.ndarray:
+        # Convertir vector a numpy array si no lo es
+        if not isinstance(vector, np.ndarray):
+            vector = np.array(vector, dtype=float)
+        
+        # Un modelo no puede mezclar vectores de distinta dimensión (p. ej. al cambiar la codificación)
+        if model.store.n and vector.shape[-1] != model.store.vectors.shape[1]:
+            raise ValueError(
+                f"El vector de {model_type} tiene dimensión {vector.shape[-1]} y el modelo "
+                f"{model.store.vectors.shape[1]}: resetea el modelo"
+            )
+        return vector
+    
+    @staticmethod
+    def build_model(model_type: str, capacities: List[int], vectores: List[Tuple[str, Any]]) -> tuple:
+        """
+        Construye un modelo nuevo, sin activarlo, asignando los vectores
+        [(image_id, vector)] en orden. No toca el modelo activo: puede
+        ejecutarse fuera del hilo principal.
+        Retorna (modelo, [(image_id, cluster_id, centroide)], (image_id, error)
+        del primer vector que no se pudo asignar o None); los siguientes a ese
+        tampoco se asignan.
+        """
+        model = clustering_models.new_model(capacities)
+        asignaciones = []
+        for image_id, vector in vectores:
+            try:
+                vector = ClusteringService._check_vector(model_type, model, vector)
+                cluster_id, centroid = model.predict_with_centroid(vector)
+            except (ValueError, RuntimeError) as e:
+                # Capacidad agotada o dimensión distinta: el resto tampoco entraría
+                return model, asignaciones, (image_id, str(e))
+            asignaciones.append((image_id, cluster_id, centroid))
+        return model, asignaciones, None
+    
+    @staticmethod
+    def install_model(model_type: str, model, asignaciones: list):
+        """
+        Activa un modelo construido con build_model y guarda su estado y sus
+        asignaciones en el índice
+        """
+        clustering_models.set_model(model_type, model)
+        with ClusteringService._pending_lock:
+            ClusteringService._pending_assignments.setdefault(model_type, []).extend(
+                (model.model_id, image_id, cluster_id) for image_id, cluster_id, _ in asignaciones
+            )
+        ClusteringService.save_model_state(model_type)
+    
     @staticmethod
     def get_metrics(model_type: str) -> Dict[str, Any]:
         """
@@ -75,17 +148,34 @@ class ClusteringService:
         if not model:
             raise ValueError(f"No hay modelo activo para {model_type}")
         
+        return ClusteringService.compute_metrics(model)
+    
+    @staticmethod
+    def compute_metrics(model) -> Dict[str, Any]:
+        """
+        Calcula las métricas de un modelo (o de un snapshot del mismo)
+        Por encima de SILHOUETTE_EXACT_MAX_POINTS la silueta se estima por muestreo
+        """
         # Obtener métricas completas del modelo
-        comprehensive_metrics = model.get_comprehensive_metrics()
+        sample_size = SILHOUETTE_SAMPLE_SIZE if len(model.all_vectors) > SILHOUETTE_EXACT_MAX_POINTS else None
+        comprehensive_metrics = model.get_comprehensive_metrics(
+            silhouette_sample_size=sample_size, seed=SILHOUETTE_SAMPLE_SEED
+        )
+        internal = comprehensive_metrics["internal_metrics"]
         
         # Redondear valores para mejor presentación
         result = {
             "internal_metrics": {
-                "dunn_index": round(comprehensive_metrics["internal_metrics"]["dunn_index"], 4),
-                "silhouette_coefficient": round(comprehensive_metrics["internal_metrics"]["silhouette_coefficient"], 4)
+                "dunn_index": round(internal["dunn_index"], 4),
+                "silhouette_coefficient": round(internal["silhouette_coefficient"], 4)
             },
             "cluster_info": comprehensive_metrics["cluster_info"]
         }
+        if "silhouette_estimate" in internal:
+            estimate = dict(internal["silhouette_estimate"])
+            estimate["confidence_interval"] = [round(v, 4) for v in estimate["confidence_interval"]]
+            estimate["std_error"] = round(estimate["std_error"], 4)
+            result["internal_metrics"]["silhouette_estimate"] = estimate
         
         # Agregar métricas externas si están disponibles
         external = comprehensive_metrics["external_metrics"]
@@ -106,9 +196,17 @@ class ClusteringService:
     @staticmethod
     def save_model_state(model_type: str):
         """
-        Guarda el estado del modelo
+        Guarda el estado del modelo y las asignaciones pendientes
         """
         clustering_models.save_state(model_type)
+        
+        with ClusteringService._pending_lock:
+            pendientes = ClusteringService._pending_assignments.pop(model_type, [])
+        por_modelo = {}
+        for model_id, image_id, cluster_id in pendientes:
+            por_modelo.setdefault(model_id, []).append((image_id, cluster_id))
+        for model_id, asignaciones in por_modelo.items():
+            image_index.record_assignments(model_type, model_id, asignaciones)
     
     @staticmethod
     def load_model_state(model_type: str) -> bool:
@@ -0,0 +1,152 @@
+"""
+Servidor de inferencia CNN con micro-lotes dinámicos entre peticiones
+"""
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Any, List
+import numpy as np
+from feature_extraction.cnn import procesar_cnn_lote
+from preprocesamiento.preprocesamiento import ImagenPreprocesada
+from utils.helpers import CNN_BATCH_SIZE, CNN_MICROBATCH_MAX_SIZE, CNN_MICROBATCH_MAX_WAIT_MS
+
+
+class CnnInferenceService:
+    """
+    Agrupa en un hilo de fondo las imágenes enviadas por peticiones concurrentes
+    (hasta `max_batch_size` imágenes o `max_wait_ms` de espera desde la primera)
+    y resuelve el future de cada imagen con una sola pasada del modelo por lote.
+    """
+
+    def __init__(self, max_batch_size: int = CNN_MICROBATCH_MAX_SIZE, max_wait_ms: float = CNN_MICROBATCH_MAX_WAIT_MS):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._images = 0
+        self._errors = 0
+        self._max_batch = 0
+        self._last_batch_size = 0
+        self._last_batch_ms = 0.0
+        self._batch_sizes: Dict[int, int] = {}
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="cnn-inference", daemon=True)
+                self._thread.start()
+
+    def _collect_batch(self) -> list:
+        """Bloquea hasta la primera imagen y agrega las que lleguen dentro de la ventana"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            # Descartar imágenes cuyas peticiones ya se cancelaron
+            batch = [(gris, future) for gris, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                resultados = procesar_cnn_lote([gris for gris, _ in batch], CNN_BATCH_SIZE)
+            except Exception as exc:
+                if len(batch) == 1:
+                    with self._stats_lock:
+                        self._errors += 1
+                    batch[0][1].set_exception(exc)
+                    continue
+                # Un lote coalescido falla entero: se repite imagen por imagen para
+                # que solo la imagen culpable reciba la excepción
+                batch = self._run_per_item(batch)
+                if not batch:
+                    continue
+                resultados = [resultado for _, resultado in batch]
+                batch = [item for item, _ in batch]
+
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            with self._stats_lock:
+                size = len(batch)
+                self._batches += 1
+                self._images += size
+                self._max_batch = max(self._max_batch, size)
+                self._last_batch_size = size
+                self._last_batch_ms = elapsed_ms
+                self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+
+            for (_, future), (cnn_img, features_list) in zip(batch, resultados):
+                future.set_result((cnn_img, features_list, np.array(features_list, dtype=float)))
+
+    def _run_per_item(self, batch: list) -> list:
+        """Inferencia individual de cada imagen; retorna [(item, resultado)] de las que no fallan"""
+        correctos = []
+        for gris, future in batch:
+            try:
+                resultado = procesar_cnn_lote([gris], CNN_BATCH_SIZE)[0]
+            except Exception as exc:
+                with self._stats_lock:
+                    self._errors += 1
+                future.set_exception(exc)
+                continue
+            correctos.append(((gris, future), resultado))
+        return correctos
+
+    def submit(self, imagen) -> Future:
+        """
+        Encola una imagen (ImagenPreprocesada o bytes). El future se resuelve con
+        (cnn_img, features_list, vector_normalizado), igual que extract_cnn_features.
+        """
+        if not isinstance(imagen, ImagenPreprocesada):
+            imagen = ImagenPreprocesada.desde_bytes(imagen)
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((imagen.gris, future))
+        return future
+
+    async def extract(self, imagenes: list) -> List[tuple]:
+        """
+        Extrae características CNN de las imágenes de una petición compartiendo
+        lotes con otras peticiones concurrentes. Conserva el orden recibido.
+        """
+        futures = [asyncio.wrap_future(self.submit(imagen)) for imagen in imagenes]
+        try:
+            return list(await asyncio.gather(*futures))
+        except Exception as e:
+            for future in futures:
+                future.cancel()
+            raise ValueError(f"Error en extracción CNN: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Profundidad de la cola y estadísticas de tamaño de lote"""
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches": self._batches,
+                "images": self._images,
+                "errors": self._errors,
+                "avg_batch_size": round(self._images / self._batches, 2) if self._batches else 0.0,
+                "max_observed_batch_size": self._max_batch,
+                "last_batch_size": self._last_batch_size,
+                "last_batch_ms": round(self._last_batch_ms, 2),
+                "batch_size_histogram": {str(k): v for k, v in sorted(self._batch_sizes.items())},
+            }
+
+
+# Instancia global del servicio
+cnn_inference_service = CnnInferenceService()
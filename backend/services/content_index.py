@@ -0,0 +1,58 @@
+"""
+Índice de contenido: hash de los bytes subidos -> imagen ya procesada
+(image_id y artefactos en disco). Las características de cada imagen viven en
+el feature store, indexadas por su image_id.
+"""
+import hashlib
+import os
+from typing import List, Optional
+
+from utils.helpers import get_data_paths
+from services.image_index import image_index
+
+# blake2b de 128 bits: 32 caracteres hex, rápido y sin dependencias
+CONTENT_HASH_DIGEST_SIZE = 16
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=CONTENT_HASH_DIGEST_SIZE).hexdigest()
+
+
+class ContentIndex:
+    """
+    Tabla content_hashes del índice SQLite: {hash: image_id, content_type,
+    file_names}. Cada registro es un upsert por clave, así que dos procesos
+    que ingieren a la vez no se pisan. Una entrada solo cuenta como acierto
+    si su original sigue en disco.
+    """
+
+    @staticmethod
+    def _artifacts_exist(entry: dict) -> bool:
+        # Los derivados (procesada, binarizada...) se regeneran desde el original
+        file_names = entry.get("file_names") or {}
+        return bool(file_names.get("original")) and os.path.exists(os.path.join(get_data_paths()["original_dir"], file_names["original"]))
+
+    def lookup(self, digest: str) -> Optional[dict]:
+        """Entrada del contenido si ya se procesó y su original sigue en disco"""
+        entry = image_index.content(digest)
+        if entry is None:
+            return None
+        if not self._artifacts_exist(entry):
+            # Original borrado: se olvida la entrada y se reprocesa
+            image_index.forget_content(digest)
+            return None
+        return entry
+
+    def record_many(self, registros: List[tuple]):
+        """
+        Registra varias entradas en una transacción.
+        registros: [(hash, image_data, content_type)]
+        """
+        image_index.record_contents(
+            (digest, image_data["image_id"], content_type, image_data["file_names"])
+            for digest, image_data, content_type in registros
+        )
+
+
+# Instancia global del índice
+content_index = ContentIndex()
@@ -0,0 +1,152 @@
+"""
+Artefactos derivados bajo demanda (procesada, binarizada y visualizaciones
+SIFT/HOG/CNN): se generan desde el original la primera vez que se piden, se
+guardan en disco y se desalojan por uso al superar un presupuesto
+"""
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from utils.helpers import get_data_dir, get_data_paths, DERIVED_CACHE_MAX_MB
+from services.artifact_locator import artifact_locator, parse_artifact_name, derived_file_name, ARTIFACT_DIRS
+from services.image_service import generar_artefacto
+from services.worker_pool import worker_pool
+
+DERIVED_KINDS = tuple(kind for kind in ARTIFACT_DIRS if kind != "original")
+
+
+class DerivedArtifacts:
+    """
+    Lleva el tamaño de cada derivado en disco en orden de uso (LRU). Al
+    arrancar se inventarían los que ya existen, ordenados por fecha de
+    modificación. Las peticiones simultáneas de un mismo artefacto comparten
+    una sola generación en el pool de trabajadores.
+    """
+
+    def __init__(self):
+        self._data_dir: Optional[str] = None
+        # (image_id, tipo) -> bytes, del menos al más recientemente usado
+        self._uso: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._total = 0
+        self._generando: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Inventario de los derivados en disco del DATA_DIR actual (una sola vez)"""
+        data_dir = get_data_dir()
+        if self._data_dir == data_dir:
+            return
+        with self._lock:
+            if self._data_dir == data_dir:
+                return
+            paths = get_data_paths()
+            encontrados = []
+            for directory in sorted({ARTIFACT_DIRS[kind] for kind in DERIVED_KINDS}):
+                with os.scandir(paths[directory]) as entries:
+                    for entry in entries:
+                        parsed = parse_artifact_name(entry.name)
+                        if parsed and parsed[1] in DERIVED_KINDS and ARTIFACT_DIRS[parsed[1]] == directory and entry.is_file():
+                            stat = entry.stat()
+                            encontrados.append((stat.st_mtime, parsed, stat.st_size))
+            encontrados.sort()
+            self._uso = OrderedDict((parsed, size) for _, parsed, size in encontrados)
+            self._total = sum(self._uso.values())
+            self._data_dir = data_dir
+
+    def _usar(self, key: Tuple[str, str], size: int):
+        with self._lock:
+            if key in self._uso:
+                self._uso.move_to_end(key)
+            else:
+                self._uso[key] = size
+                self._total += size
+
+    def _desalojar(self, conservar: Tuple[str, str]):
+        """Borra los derivados menos usados hasta quedar dentro del presupuesto"""
+        limite = DERIVED_CACHE_MAX_MB * 1024 * 1024
+        if limite <= 0:
+            return
+        victimas = []
+        with self._lock:
+            while self._total > limite and len(self._uso) > 1:
+                key, size = next(iter(self._uso.items()))
+                if key == conservar:
+                    self._uso.move_to_end(key)
+                    continue
+                del self._uso[key]
+                self._total -= size
+                victimas.append(key)
+        if not victimas:
+            return
+        paths = get_data_paths()
+        for image_id, kind in victimas:
+            artifact_locator.forget(image_id, kind)
+            try:
+                os.remove(os.path.join(paths[ARTIFACT_DIRS[kind]], derived_file_name(image_id, kind)))
+            except FileNotFoundError:
+                pass
+        print(f"[DERIVED] {len(victimas)} artefactos desalojados ({self._total / 1024 / 1024:.1f} MB en uso)")
+
+    async def _generar(self, image_id: str, kind: str, origen: str) -> Optional[Tuple[str, os.stat_result]]:
+        nombre = derived_file_name(image_id, kind)
+        destino = os.path.join(get_data_paths()[ARTIFACT_DIRS[kind]], nombre)
+        size = await worker_pool.run(generar_artefacto, origen, kind, destino)
+        artifact_locator.register([(image_id, kind, nombre)])
+        self._usar((image_id, kind), size)
+        self._desalojar(conservar=(image_id, kind))
+        return artifact_locator.resolve(image_id, kind)
+
+    async def resolve(self, image_id: str, kind: str) -> Optional[Tuple[str, os.stat_result]]:
+        """
+        (ruta, stat) del artefacto; un derivado que no está en disco se genera
+        desde el original. None si no existe el original.
+        """
+        found = artifact_locator.resolve(image_id, kind)
+        if kind not in DERIVED_KINDS:
+            return found
+        self.load()
+        key = (image_id, kind)
+        if found is not None:
+            self._usar(key, found[1].st_size)
+            return found
+
+        original = artifact_locator.resolve(image_id, "original")
+        if original is None:
+            return None
+        futuro = self._generando.get(key)
+        if futuro is None:
+            futuro = asyncio.ensure_future(self._generar(image_id, kind, original[0]))
+            self._generando[key] = futuro
+            futuro.add_done_callback(lambda _: self._generando.pop(key, None))
+        # shield: si un cliente se desconecta, la generación sigue para los demás
+        return await asyncio.shield(futuro)
+
+    async def resolve_name(self, file_name: str, kinds: Tuple[str, ...]) -> Optional[Tuple[str, os.stat_result]]:
+        """Como resolve, a partir de un nombre de archivo generado de uno de los tipos dados"""
+        parsed = parse_artifact_name(file_name)
+        if parsed is None or parsed[1] not in kinds:
+            return None
+        found = await self.resolve(*parsed)
+        if found is None or os.path.basename(found[0]) != file_name:
+            return None
+        return found
+
+    def clear(self):
+        """Borra todos los derivados en disco"""
+        self.load()
+        paths = get_data_paths()
+        with self._lock:
+            keys = list(self._uso)
+            self._uso.clear()
+            self._total = 0
+        for image_id, kind in keys:
+            try:
+                os.remove(os.path.join(paths[ARTIFACT_DIRS[kind]], derived_file_name(image_id, kind)))
+            except FileNotFoundError:
+                pass
+
+
+# Instancia global de los artefactos derivados
+derived_artifacts = DerivedArtifacts()
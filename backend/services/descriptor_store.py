@@ -0,0 +1,85 @@
+"""
+Almacén en disco de descriptores locales por imagen (.npy, mapeables en memoria)
+"""
+import os
+import re
+import uuid
+from typing import Iterator, List
+
+import numpy as np
+from utils.helpers import get_data_paths
+
+IMAGE_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# Filas por fragmento al transmitir descriptores en binario
+STREAM_CHUNK_ROWS = 4096
+
+
+class DescriptorStore:
+    """
+    Un archivo {DATA_DIR}/descriptors/{kind}/{image_id}.npy por imagen, con
+    el dtype compacto con que se extrajeron (uint8 para SIFT). Las lecturas
+    usan mmap, así que servir o recodificar descriptores no los copia a memoria.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+
+    def _dir(self) -> str:
+        directory = os.path.join(get_data_paths()["descriptors_dir"], self.kind)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def path(self, image_id: str) -> str:
+        if not IMAGE_ID_RE.match(image_id or ""):
+            raise ValueError(f"Identificador de imagen no válido: {image_id}")
+        return os.path.join(self._dir(), f"{image_id}.npy")
+
+    def exists(self, image_id: str) -> bool:
+        return os.path.exists(self.path(image_id))
+
+    def save(self, image_id: str, descriptores: np.ndarray) -> str:
+        """Escribe los descriptores (temporal + rename: nunca queda un .npy a medias)"""
+        path = self.path(image_id)
+        temporal = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temporal, "wb") as f:
+            np.save(f, np.ascontiguousarray(descriptores))
+        os.replace(temporal, path)
+        return path
+
+    def load(self, image_id: str, mmap: bool = True) -> np.ndarray:
+        """Descriptores (N, D) de la imagen; con mmap=True, de solo lectura sin copiar"""
+        path = self.path(image_id)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No hay descriptores {self.kind} para {image_id}")
+        return np.load(path, mmap_mode="r" if mmap else None)
+
+    def iter_bytes(self, image_id: str, chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+        """Bytes crudos (C-order) de los descriptores, por fragmentos de filas"""
+        descriptores = self.load(image_id)
+        for inicio in range(0, len(descriptores), chunk_rows):
+            yield descriptores[inicio:inicio + chunk_rows].tobytes()
+
+    def ids(self) -> List[str]:
+        """image_id de todas las imágenes con descriptores guardados"""
+        with os.scandir(self._dir()) as entries:
+            return sorted(
+                entry.name[:-4] for entry in entries
+                if entry.name.endswith(".npy") and IMAGE_ID_RE.match(entry.name[:-4])
+            )
+
+    def delete(self, image_id: str):
+        path = self.path(image_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def clear(self):
+        """Elimina todos los descriptores de este tipo"""
+        directory = self._dir()
+        for name in os.listdir(directory):
+            if name.endswith(".npy"):
+                os.remove(os.path.join(directory, name))
+
+
+# Instancia global para los descriptores SIFT
+sift_descriptor_store = DescriptorStore("sift")
@@ -0,0 +1,236 @@
+"""
+Almacén persistente de vectores de características por método, indexado por
+image_id: re-agrupar con otras capacidades o umbrales no vuelve a extraer nada
+"""
+import json
+import os
+import shutil
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from utils.helpers import get_data_paths, HOG_BACKEND, SIFT_ENCODING
+from services.image_index import image_index
+
+FEATURE_STORE_DTYPE = np.float64
+
+
+def vector_key(method: str) -> str:
+    """
+    Clave del almacén para los vectores de un método. HOG y SIFT dependen de
+    la configuración (backend / codificación), así que cada una tiene la suya.
+    """
+    if method == "hog":
+        return f"hog_{HOG_BACKEND}"
+    if method == "sift":
+        return f"sift_{SIFT_ENCODING}"
+    return method
+
+
+def raw_key(key: str) -> str:
+    """
+    Clave del almacén para los valores sin normalizar de una clave (momentos
+    por nombre, descriptor HOG), que se devuelven junto al vector
+    """
+    return f"{key}_raw"
+
+
+class FeatureStore:
+    """
+    Layout columnar de solo anexado en {DATA_DIR}/feature_store/{clave}/:
+    vectors.f8 (filas float64 de dimensión fija, mapeable en memoria) y
+    meta.json (dimensión). La fila de cada image_id está en la tabla features
+    del índice SQLite, que es la única fuente de qué imágenes tienen vector.
+    Un id ya presente se sobrescribe en su fila. Solo escribe el proceso principal.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._dim: Optional[int] = None
+        self._ids: Optional[List[str]] = None
+        self._index: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _dir(self) -> str:
+        directory = os.path.join(get_data_paths()["feature_store_dir"], self.key)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self._dir(), name)
+
+    def _load(self):
+        if self._ids is not None:
+            return
+        self._ids, self._index, self._dim = [], {}, None
+        meta_file = self._file("meta.json")
+        if not os.path.exists(meta_file):
+            # Sin vectores en disco: no puede quedar ninguna fila en el índice
+            image_index.truncate_features(self.key)
+            return
+        with open(meta_file, "r", encoding="utf-8") as f:
+            self._dim = int(json.load(f)["dim"])
+
+        self._migrate_ids_txt()
+        rows = image_index.feature_rows(self.key)
+        # Una escritura interrumpida puede dejar vectores sin fila en el índice
+        # (o al revés): solo cuentan las filas consecutivas desde 0 que están
+        # completas en disco, y se recorta el resto para que el siguiente
+        # anexado quede alineado
+        row_bytes = self._dim * np.dtype(FEATURE_STORE_DTYPE).itemsize
+        vectors_file = self._file("vectors.f8")
+        size = os.path.getsize(vectors_file) if os.path.exists(vectors_file) else 0
+        ids = []
+        for image_id, row in rows:
+            if row != len(ids) or row >= size // row_bytes:
+                break
+            ids.append(image_id)
+        n_rows = len(ids)
+        if size != n_rows * row_bytes:
+            with open(vectors_file, "ab") as f:
+                f.truncate(n_rows * row_bytes)
+        if len(rows) != n_rows:
+            image_index.truncate_features(self.key, n_rows)
+        self._ids = ids
+        self._index = {image_id: i for i, image_id in enumerate(self._ids)}
+
+    def _migrate_ids_txt(self):
+        """Importa al índice el ids.txt heredado (fila i <-> línea i) y lo renombra a .migrated"""
+        ids_file = self._file("ids.txt")
+        if not os.path.exists(ids_file):
+            return
+        with open(ids_file, "r", encoding="utf-8") as f:
+            ids = [line.strip() for line in f if line.strip()]
+        image_index.truncate_features(self.key)
+        image_index.record_features(self.key, [(image_id, row) for row, image_id in enumerate(ids)], self._dim)
+        os.replace(ids_file, f"{ids_file}.migrated")
+
+    @property
+    def dim(self) -> Optional[int]:
+        with self._lock:
+            self._load()
+            return self._dim
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._ids)
+
+    def __contains__(self, image_id: str) -> bool:
+        with self._lock:
+            self._load()
+            return image_id in self._index
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            self._load()
+            return list(self._ids)
+
+    def _matrix(self, mode: str = "r") -> np.ndarray:
+        if not self._ids:
+            return np.empty((0, self._dim or 0), dtype=FEATURE_STORE_DTYPE)
+        return np.memmap(self._file("vectors.f8"), dtype=FEATURE_STORE_DTYPE, mode=mode, shape=(len(self._ids), self._dim))
+
+    def vectors(self) -> Tuple[List[str], np.ndarray]:
+        """(ids, matriz N x D) de todo el almacén; la matriz es un mmap de solo lectura"""
+        with self._lock:
+            self._load()
+            return list(self._ids), self._matrix()
+
+    def get(self, image_id: str) -> Optional[np.ndarray]:
+        """Vector de la imagen (copia) o None si no está"""
+        with self._lock:
+            self._load()
+            row = self._index.get(image_id)
+            return None if row is None else np.array(self._matrix()[row])
+
+    def get_many(self, image_ids: List[str]) -> Tuple[List[str], np.ndarray]:
+        """(ids encontrados, sus vectores) en el orden pedido; los ausentes se omiten"""
+        with self._lock:
+            self._load()
+            encontrados = [image_id for image_id in image_ids if image_id in self._index]
+            filas = [self._index[image_id] for image_id in encontrados]
+            return encontrados, np.array(self._matrix()[filas]) if filas else np.empty((0, self._dim or 0), dtype=FEATURE_STORE_DTYPE)
+
+    def put_many(self, image_ids: List[str], vectores) -> int:
+        """
+        Guarda los vectores de varias imágenes (nuevos al final, existentes en
+        su fila). Retorna cuántos se guardaron; los de otra dimensión se omiten.
+        """
+        with self._lock:
+            self._load()
+            pares = [(image_id, np.asarray(v, dtype=FEATURE_STORE_DTYPE).ravel()) for image_id, v in zip(image_ids, vectores) if v is not None]
+            if not pares:
+                return 0
+            if self._dim is None:
+                self._dim = int(len(pares[0][1]))
+                temporal = f"{self._file('meta.json')}.{uuid.uuid4().hex}.tmp"
+                with open(temporal, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self._dim, "dtype": np.dtype(FEATURE_STORE_DTYPE).name}, f)
+                os.replace(temporal, self._file("meta.json"))
+
+            validos = [(image_id, v) for image_id, v in pares if len(v) == self._dim]
+            if len(validos) < len(pares):
+                print(f"[FEATURE-STORE] {self.key}: {len(pares) - len(validos)} vectores con dimensión distinta de {self._dim} no se guardaron")
+
+            existentes = [(self._index[image_id], v) for image_id, v in validos if image_id in self._index]
+            nuevos = {}
+            for image_id, v in validos:
+                if image_id not in self._index:
+                    nuevos[image_id] = v
+            if existentes:
+                matriz = self._matrix("r+")
+                for fila, v in existentes:
+                    matriz[fila] = v
+                matriz.flush()
+                del matriz
+            if nuevos:
+                # Primero los vectores y después sus filas en el índice: una
+                # fila sin registrar se recorta al cargar
+                with open(self._file("vectors.f8"), "ab") as f:
+                    f.write(np.stack(list(nuevos.values())).astype(FEATURE_STORE_DTYPE).tobytes())
+                for image_id in nuevos:
+                    self._index[image_id] = len(self._ids)
+                    self._ids.append(image_id)
+            filas = [(image_id, self._index[image_id]) for image_id in dict(validos)]
+            image_index.record_features(self.key, filas, self._dim)
+        return len(validos)
+
+    def reset(self):
+        """Olvida los vectores de esta clave"""
+        with self._lock:
+            image_index.truncate_features(self.key)
+            shutil.rmtree(self._dir(), ignore_errors=True)
+            self._ids, self._index, self._dim = [], {}, None
+
+
+class FeatureStores:
+    """
+    Un FeatureStore por clave (moments, hu, zernike, hog_<backend>, sift_<codificación>, cnn)
+    """
+
+    def __init__(self):
+        self._stores: Dict[str, FeatureStore] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> FeatureStore:
+        with self._lock:
+            if key not in self._stores:
+                self._stores[key] = FeatureStore(key)
+            return self._stores[key]
+
+    def for_method(self, method: str) -> FeatureStore:
+        return self.get(vector_key(method))
+
+    def clear(self):
+        """Elimina los vectores de todas las claves"""
+        with self._lock:
+            stores = list(self._stores.values())
+        for store in stores:
+            store.reset()
+        shutil.rmtree(get_data_paths()["feature_store_dir"], ignore_errors=True)
+
+
+# Instancia global de los almacenes
+feature_stores = FeatureStores()
@@ -1,10 +1,14 @@
 """
 Servicio para manejo de archivos
 """
-import json
 import os
+import shutil
 from typing import List, Dict, Any
-from utils.helpers import get_data_paths
+from utils.helpers import get_data_paths, ALLOWED_TYPES
+from services.descriptor_store import sift_descriptor_store, IMAGE_ID_RE
+from services.feature_store import feature_stores
+from services.image_index import image_index
+from services.artifact_locator import artifact_locator
 
 
 class FileService:
@@ -15,70 +19,34 @@ class FileService:
     @staticmethod
     def load_index() -> List[dict]:
         """
-        Carga el índice de imágenes desde archivo
+        Carga el índice de imágenes (SQLite) en orden de inserción
         """
-        paths = get_data_paths()
-        index_file = paths["index_file"]
-        
-        if not os.path.exists(index_file):
-            return []
-        
-        try:
-            with open(index_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                return data if isinstance(data, list) else []
-        except Exception:
-            return []
+        return image_index.list_images()
     
     @staticmethod
-    def save_index(items: List[dict]) -> None:
+    def add_to_index(items: List[dict]) -> int:
         """
-        Guarda el índice de imágenes a archivo
+        Agrega items al índice en una sola transacción; los ids ya indexados
+        se ignoran. Retorna cuántos se insertaron.
         """
-        paths = get_data_paths()
-        index_file = paths["index_file"]
-        
-        with open(index_file, "w", encoding="utf-8") as f:
-            json.dump(items, f, ensure_ascii=False, indent=2)
+        return image_index.add_images(items)
     
     @staticmethod
     def save_image_files(image_data: dict, paths: dict) -> None:
         """
-        Guarda los archivos de imagen (original, procesado, binarizado)
+        Guarda el original (reescalado). La procesada, la binarizada y las
+        visualizaciones se generan desde él la primera vez que se piden.
         """
-        file_names = image_data["file_names"]
+        if image_data.get("original_png") is None:
+            # Contenido deduplicado: el original ya está en disco
+            return
         
-        # Construir rutas completas
+        file_names = image_data["file_names"]
         original_path = os.path.join(paths["original_dir"], file_names["original"])
-        processed_path = os.path.join(paths["processed_dir"], file_names["processed"])
-        binarized_path = os.path.join(paths["binarized_dir"], file_names["binarized"])
-        
-        # Guardar archivos
         with open(original_path, "wb") as f:
-            f.write(image_data["resized_bytes"])
-        
-        with open(processed_path, "wb") as f:
-            f.write(image_data["processed_bytes"])
-        
-        with open(binarized_path, "wb") as f:
-            f.write(image_data["binarized_bytes"])
-    
-    @staticmethod
-    def save_specialized_image_file(image_bytes: bytes, file_type: str, image_data: dict, paths: dict) -> None:
-        """
-        Guarda archivos especializados (SIFT, HOG)
-        """
-        file_names = image_data["file_names"]
+            f.write(image_data["original_png"])
         
-        if file_type == "sift":
-            file_path = os.path.join(paths["processed_dir"], file_names["sift"])
-        elif file_type == "hog":
-            file_path = os.path.join(paths["processed_dir"], file_names["hog"])
-        else:
-            raise ValueError(f"Tipo de archivo no soportado: {file_type}")
-        
-        with open(file_path, "wb") as f:
-            f.write(image_bytes)
+        artifact_locator.register([(image_data["image_id"], "original", file_names["original"])])
     
     @staticmethod
     def create_image_result(
@@ -110,6 +78,8 @@ class FileService:
             result["processed_url"] = f"/files/processed/{file_names['sift']}"
         elif file_type == "hog":
             result["processed_url"] = f"/files/processed/{file_names['hog']}"
+        elif file_type == "cnn":
+            result["processed_url"] = f"/files/processed/{file_names['cnn']}"
         
         # Agregar características si se proporcionan
         if features:
@@ -156,8 +126,29 @@ class FileService:
                 if os.path.exists(binarized_path):
                     os.remove(binarized_path)
         
-        # Limpiar índice
-        FileService.save_index([])
+        # Eliminar descriptores binarios y vectores (y la caché .pkl heredada)
+        sift_descriptor_store.clear()
+        feature_stores.clear()
+        shutil.rmtree(os.path.join(paths["data_dir"], "features"), ignore_errors=True)
+        
+        # Limpiar índice (también los hashes de contenido) y rutas en memoria
+        image_index.clear()
+        artifact_locator.clear()
+    
+    @staticmethod
+    def find_original(image_id: str) -> tuple:
+        """
+        Retorna (ruta, content_type) del original guardado de una imagen
+        """
+        if not IMAGE_ID_RE.match(image_id or ""):
+            raise ValueError(f"Identificador de imagen no válido: {image_id}")
+        
+        paths = get_data_paths()
+        for content_type, ext in ALLOWED_TYPES.items():
+            path = os.path.join(paths["original_dir"], f"{image_id}{ext}")
+            if os.path.exists(path):
+                return path, content_type
+        raise ValueError(f"No existe la imagen {image_id}")
     
     @staticmethod
     def get_file_path(file_type: str, filename: str) -> str:
@@ -175,6 +166,5 @@ class FileService:
         else:
             raise ValueError(f"Tipo de archivo no válido: {file_type}")
 
-
 # Instancia global del servicio
 file_service = FileService()
\ No newline at end of file
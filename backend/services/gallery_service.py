@@ -0,0 +1,105 @@
+"""
+Servicio de consulta de la galería: paginación por cursor, filtros,
+proyección de campos y ETag derivado de la versión del índice
+"""
+import base64
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from models.clustering_models import clustering_models
+from services.image_index import image_index
+from utils.helpers import GALLERY_PAGE_SIZE, GALLERY_MAX_PAGE_SIZE
+
+
+class GalleryService:
+    """
+    Los cursores son opacos (seq del último item, en base64 url-safe), así
+    que una página no se desplaza si entretanto se suben imágenes nuevas.
+    """
+
+    @staticmethod
+    def encode_cursor(seq: Optional[int]) -> Optional[str]:
+        if seq is None:
+            return None
+        return base64.urlsafe_b64encode(str(seq).encode("ascii")).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: Optional[str]) -> int:
+        if not cursor:
+            return 0
+        try:
+            seq = int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii"))
+        except Exception:
+            raise ValueError("cursor no válido")
+        if seq < 0:
+            raise ValueError("cursor no válido")
+        return seq
+
+    @staticmethod
+    def _model_id(method: Optional[str]) -> Optional[str]:
+        """model_id del modelo activo del método (las asignaciones de modelos anteriores no cuentan)"""
+        if not method:
+            return None
+        if method not in clustering_models._models:
+            raise ValueError(f"Método no válido: {method}")
+        if not clustering_models.has_active_model(method):
+            clustering_models.load_state(method)
+        model = clustering_models._models.get(method)
+        return model.model_id if model else None
+
+    @staticmethod
+    def etag(version: int, query: Dict[str, Any]) -> str:
+        """ETag fuerte: versión del índice + parámetros normalizados de la consulta"""
+        clave = "&".join(f"{k}={query[k]}" for k in sorted(query) if query[k] is not None)
+        digest = hashlib.blake2b(clave.encode("utf-8"), digest_size=8).hexdigest()
+        return f'"{version}-{digest}"'
+
+    @staticmethod
+    def prepare(
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        method: Optional[str] = None,
+        cluster: Optional[int] = None,
+        tag: Optional[str] = None,
+        fields: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Valida y normaliza una consulta y calcula su ETag sin leer los items
+        (una revalidación con If-None-Match solo cuesta leer la versión).
+        cluster requiere method; fields es una lista separada por comas (id siempre se incluye).
+        """
+        limit = GALLERY_PAGE_SIZE if limit is None else int(limit)
+        if limit <= 0 or limit > GALLERY_MAX_PAGE_SIZE:
+            raise ValueError(f"limit debe estar entre 1 y {GALLERY_MAX_PAGE_SIZE}")
+        if cluster is not None and not method:
+            raise ValueError("Filtrar por cluster requiere method")
+        campos: List[str] = [f.strip() for f in fields.split(",") if f.strip()] if fields else []
+
+        query = {
+            "limit": limit,
+            "after_seq": GalleryService.decode_cursor(cursor),
+            "method": method,
+            "model_id": GalleryService._model_id(method),
+            "cluster_id": cluster,
+            "tag": tag,
+            "fields": ",".join(campos) or None,
+        }
+        # La versión se lee antes que los datos: si algo cambia en medio, el
+        # ETag queda viejo y la siguiente revalidación descarga de nuevo
+        query["etag"] = GalleryService.etag(image_index.version(), query)
+        return query
+
+    @staticmethod
+    def fetch(query: Dict[str, Any]) -> Dict[str, Any]:
+        """Retorna {"items", "total", "next_cursor"} de una consulta preparada"""
+        items, siguiente, total = image_index.page(
+            query["limit"], query["after_seq"], query["method"], query["model_id"], query["cluster_id"], query["tag"]
+        )
+        if query["fields"]:
+            campos = ["id", *query["fields"].split(",")]
+            items = [{k: item[k] for k in campos if k in item} for item in items]
+        return {"items": items, "total": total, "next_cursor": GalleryService.encode_cursor(siguiente)}
+
+
+# Instancia global del servicio
+gallery_service = GalleryService()
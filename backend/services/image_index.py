@@ -0,0 +1,417 @@
+"""
+Índice de imágenes embebido en SQLite (modo WAL): imágenes de la galería,
+sus artefactos, las características extraídas, las asignaciones de cluster y
+el hash de contenido de cada imagen subida (deduplicación)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.helpers import get_data_paths
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    filename TEXT,
+    original_url TEXT,
+    processed_url TEXT,
+    binarized_url TEXT,
+    extra TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    image_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    PRIMARY KEY (image_id, kind)
+);
+CREATE TABLE IF NOT EXISTS features (
+    image_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    dim INTEGER,
+    updated_at REAL NOT NULL,
+    row_index INTEGER,
+    PRIMARY KEY (image_id, key)
+);
+CREATE TABLE IF NOT EXISTS cluster_assignments (
+    method TEXT NOT NULL,
+    image_id TEXT NOT NULL,
+    cluster_id INTEGER NOT NULL,
+    model_id TEXT,
+    assigned_at REAL NOT NULL,
+    PRIMARY KEY (method, image_id)
+);
+CREATE INDEX IF NOT EXISTS idx_assignments_model ON cluster_assignments (method, model_id);
+CREATE TABLE IF NOT EXISTS content_hashes (
+    hash TEXT PRIMARY KEY,
+    image_id TEXT NOT NULL,
+    content_type TEXT,
+    file_names TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+"""
+
+# Columnas propias de un item de la galería; cualquier otra clave va a `extra`
+ITEM_COLUMNS = ("id", "filename", "original_url", "processed_url", "binarized_url")
+URL_ARTIFACTS = (("original_url", "original"), ("processed_url", "processed"), ("binarized_url", "binarized"))
+
+
+class ImageIndex:
+    """
+    Una conexión por operación (seguro entre hilos del servidor); las
+    escrituras van en una sola transacción por lote. La primera vez que se
+    abre la base de un DATA_DIR se importan el index.json y el
+    content_index.json heredados, si existen.
+    """
+
+    def __init__(self):
+        self._initialized = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _db_file() -> str:
+        return get_data_paths()["index_db_file"]
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._db_file(), timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _ensure_schema(self):
+        path = self._db_file()
+        if path in self._initialized:
+            return
+        with self._lock:
+            if path in self._initialized:
+                return
+            conn = self._open()
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                self._migrate_schema(conn)
+                self._migrate_json(conn)
+                self._migrate_content_json(conn)
+            finally:
+                conn.close()
+            self._initialized.add(path)
+
+    @contextmanager
+    def _connect(self):
+        """Conexión en transacción: commit al salir, rollback si hay error"""
+        self._ensure_schema()
+        conn = self._open()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ---------- migración ----------
+
+    @staticmethod
+    def _migrate_schema(conn: sqlite3.Connection):
+        """Columnas añadidas después de crear la base"""
+        columnas = {row["name"] for row in conn.execute("PRAGMA table_info(features)")}
+        if "row_index" not in columnas:
+            with conn:
+                conn.execute("ALTER TABLE features ADD COLUMN row_index INTEGER")
+
+    def _migrate_json(self, conn: sqlite3.Connection):
+        """Importa una sola vez el index.json heredado y lo renombra a .migrated"""
+        json_file = get_data_paths()["index_file"]
+        if not os.path.exists(json_file):
+            return
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                items = json.load(f)
+        except Exception as e:
+            print(f"[IMAGE-INDEX] No se pudo leer {json_file}: {e}")
+            return
+        items = [item for item in items if isinstance(item, dict) and item.get("id")] if isinstance(items, list) else []
+
+        with conn:
+            self._insert(conn, items)
+        os.replace(json_file, f"{json_file}.migrated")
+        print(f"[IMAGE-INDEX] Migradas {len(items)} imágenes desde {json_file}")
+
+    def _migrate_content_json(self, conn: sqlite3.Connection):
+        """Importa una sola vez el content_index.json heredado y lo renombra a .migrated"""
+        json_file = os.path.join(get_data_paths()["data_dir"], "content_index.json")
+        if not os.path.exists(json_file):
+            return
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except Exception as e:
+            print(f"[IMAGE-INDEX] No se pudo leer {json_file}: {e}")
+            return
+        entries = entries if isinstance(entries, dict) else {}
+        rows = [
+            (digest, entry["image_id"], entry.get("content_type"), json.dumps(entry.get("file_names") or {}))
+            for digest, entry in entries.items()
+            if isinstance(entry, dict) and entry.get("image_id")
+        ]
+
+        with conn:
+            self._insert_content(conn, rows, ignore=True)
+        os.replace(json_file, f"{json_file}.migrated")
+        print(f"[IMAGE-INDEX] Migrados {len(rows)} hashes de contenido desde {json_file}")
+
+    # ---------- imágenes ----------
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection):
+        """Cada escritura que cambia lo que devuelve la galería incrementa la versión"""
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def version(self) -> int:
+        """Versión del índice (base de los ETag de la galería)"""
+        return self.get_meta("version")
+
+    def get_meta(self, key: str, default: int = 0) -> int:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: int):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, int(value)))
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, items: List[dict]) -> int:
+        ahora = time.time()
+        antes = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO images (id, filename, original_url, processed_url, binarized_url, extra, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    item["id"],
+                    item.get("filename"),
+                    item.get("original_url"),
+                    item.get("processed_url"),
+                    item.get("binarized_url"),
+                    json.dumps({k: v for k, v in item.items() if k not in ITEM_COLUMNS}, ensure_ascii=False) if set(item) - set(ITEM_COLUMNS) else None,
+                    ahora,
+                )
+                for item in items
+            ],
+        )
+        insertadas = conn.total_changes - antes
+        if insertadas:
+            ImageIndex._bump_version(conn)
+        conn.executemany(
+            "INSERT OR IGNORE INTO artifacts (image_id, kind, file_name) VALUES (?, ?, ?)",
+            [
+                (item["id"], kind, os.path.basename(item[url]))
+                for item in items
+                for url, kind in URL_ARTIFACTS
+                if item.get(url)
+            ],
+        )
+        return insertadas
+
+    @staticmethod
+    def _item(row: sqlite3.Row) -> dict:
+        item = {column: row[column] for column in ITEM_COLUMNS if row[column] is not None}
+        if row["extra"]:
+            item.update(json.loads(row["extra"]))
+        return item
+
+    def add_images(self, items: List[dict]) -> int:
+        """Inserta varios items de la galería en una transacción (los ids existentes se ignoran)"""
+        if not items:
+            return 0
+        with self._connect() as conn:
+            return self._insert(conn, items)
+
+    def get(self, image_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM images WHERE id = ?", (image_id,)).fetchone()
+        return self._item(row) if row else None
+
+    def get_many(self, image_ids: List[str]) -> Dict[str, dict]:
+        if not image_ids:
+            return {}
+        items = {}
+        with self._connect() as conn:
+            # Por bloques para no superar el límite de parámetros de SQLite
+            for inicio in range(0, len(image_ids), 500):
+                bloque = image_ids[inicio:inicio + 500]
+                filas = conn.execute(f"SELECT * FROM images WHERE id IN ({','.join('?' * len(bloque))})", bloque)
+                items.update({row["id"]: self._item(row) for row in filas})
+        return items
+
+    def list_images(self) -> List[dict]:
+        """Todos los items de la galería en orden de inserción"""
+        with self._connect() as conn:
+            return [self._item(row) for row in conn.execute("SELECT * FROM images ORDER BY seq")]
+
+    def list_ids(self) -> List[str]:
+        with self._connect() as conn:
+            return [row["id"] for row in conn.execute("SELECT id FROM images ORDER BY seq")]
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def page(
+        self,
+        limit: int,
+        after_seq: int = 0,
+        method: str = None,
+        model_id: str = None,
+        cluster_id: int = None,
+        tag: str = None,
+    ) -> Tuple[List[dict], Optional[int], int]:
+        """
+        Página de la galería por cursor (seq del último item de la página
+        anterior), con filtros opcionales por método (imágenes asignadas en el
+        modelo model_id), cluster y etiqueta.
+        Retorna (items, seq para la página siguiente o None, total filtrado).
+        """
+        joins, where, params = "", [], []
+        if method:
+            joins = "JOIN cluster_assignments ca ON ca.image_id = images.id AND ca.method = ?"
+            params.append(method)
+            if model_id:
+                joins += " AND ca.model_id = ?"
+                params.append(model_id)
+            if cluster_id is not None:
+                where.append("ca.cluster_id = ?")
+                params.append(int(cluster_id))
+        if tag:
+            where.append("json_extract(images.extra, '$.tag') = ?")
+            params.append(tag)
+        filtro = f"FROM images {joins}" + (f" WHERE {' AND '.join(where)}" if where else "")
+        columnas = "images.*" + (", ca.cluster_id AS cluster_id" if method else "")
+
+        with self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) {filtro}", params).fetchone()[0]
+            condicion = " AND " if where else " WHERE "
+            filas = conn.execute(
+                f"SELECT {columnas} {filtro}{condicion}images.seq > ? ORDER BY images.seq LIMIT ?",
+                params + [int(after_seq), int(limit) + 1],
+            ).fetchall()
+
+        siguiente = filas[limit - 1]["seq"] if len(filas) > limit else None
+        items = []
+        for row in filas[:limit]:
+            item = self._item(row)
+            if method:
+                item["cluster_id"] = row["cluster_id"]
+            items.append(item)
+        return items, siguiente, total
+
+    # ---------- artefactos, características y asignaciones ----------
+
+    def add_artifacts(self, rows: Iterable[Tuple[str, str, str]]):
+        """[(image_id, tipo, nombre de archivo)] en una transacción"""
+        rows = list(rows)
+        if rows:
+            with self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO artifacts (image_id, kind, file_name) VALUES (?, ?, ?)", rows)
+
+    def all_artifacts(self) -> List[Tuple[str, str, str]]:
+        """[(image_id, tipo, nombre de archivo)] de todos los artefactos registrados"""
+        with self._connect() as conn:
+            return [(row["image_id"], row["kind"], row["file_name"]) for row in conn.execute("SELECT image_id, kind, file_name FROM artifacts")]
+
+    def artifacts(self, image_id: str) -> Dict[str, str]:
+        with self._connect() as conn:
+            return {row["kind"]: row["file_name"] for row in conn.execute("SELECT kind, file_name FROM artifacts WHERE image_id = ?", (image_id,))}
+
+    def record_features(self, key: str, rows: List[Tuple[str, int]], dim: int = None):
+        """Registra [(image_id, fila)] de la clave del feature store en una transacción"""
+        if rows:
+            ahora = time.time()
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO features (image_id, key, dim, updated_at, row_index) VALUES (?, ?, ?, ?, ?)",
+                    [(image_id, key, dim, ahora, int(row)) for image_id, row in rows],
+                )
+
+    def feature_rows(self, key: str) -> List[Tuple[str, int]]:
+        """[(image_id, fila)] de la clave del feature store, por fila"""
+        with self._connect() as conn:
+            return [
+                (row["image_id"], row["row_index"])
+                for row in conn.execute("SELECT image_id, row_index FROM features WHERE key = ? AND row_index IS NOT NULL ORDER BY row_index", (key,))
+            ]
+
+    def truncate_features(self, key: str, n_rows: int = 0):
+        """Olvida las filas >= n_rows de la clave (y las que no tienen fila)"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM features WHERE key = ? AND (row_index IS NULL OR row_index >= ?)", (key, int(n_rows)))
+
+    def record_assignments(self, method: str, model_id: str, assignments: List[Tuple[str, int]]):
+        """Guarda en una transacción las asignaciones [(image_id, cluster_id)] de un modelo"""
+        if assignments:
+            ahora = time.time()
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO cluster_assignments (method, image_id, cluster_id, model_id, assigned_at) VALUES (?, ?, ?, ?, ?)",
+                    [(method, image_id, int(cluster_id), model_id, ahora) for image_id, cluster_id in assignments],
+                )
+                self._bump_version(conn)
+
+    def assignments(self, method: str, model_id: str = None) -> Dict[str, int]:
+        """{image_id: cluster_id} del método (solo las del modelo indicado, si se da)"""
+        query, params = "SELECT image_id, cluster_id FROM cluster_assignments WHERE method = ?", [method]
+        if model_id is not None:
+            query += " AND model_id = ?"
+            params.append(model_id)
+        with self._connect() as conn:
+            return {row["image_id"]: row["cluster_id"] for row in conn.execute(query, params)}
+
+    # ---------- hashes de contenido ----------
+
+    @staticmethod
+    def _insert_content(conn: sqlite3.Connection, rows: List[tuple], ignore: bool = False):
+        ahora = time.time()
+        conn.executemany(
+            f"INSERT OR {'IGNORE' if ignore else 'REPLACE'} INTO content_hashes (hash, image_id, content_type, file_names, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(*row, ahora) for row in rows],
+        )
+
+    def record_contents(self, rows: Iterable[Tuple[str, str, Optional[str], dict]]):
+        """[(hash, image_id, content_type, file_names)] en una transacción (un hash existente se reemplaza)"""
+        rows = [(digest, image_id, content_type, json.dumps(file_names)) for digest, image_id, content_type, file_names in rows]
+        if rows:
+            with self._connect() as conn:
+                self._insert_content(conn, rows)
+
+    def content(self, digest: str) -> Optional[dict]:
+        """Imagen registrada para el hash: {"image_id", "content_type", "file_names"} o None"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT image_id, content_type, file_names FROM content_hashes WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        return {"image_id": row["image_id"], "content_type": row["content_type"], "file_names": json.loads(row["file_names"])}
+
+    def forget_content(self, digest: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM content_hashes WHERE hash = ?", (digest,))
+
+    def clear(self):
+        """Vacía todas las tablas"""
+        with self._connect() as conn:
+            for table in ("images", "artifacts", "features", "cluster_assignments", "content_hashes"):
+                conn.execute(f"DELETE FROM {table}")
+            self._bump_version(conn)
+
+
+# Instancia global del índice
+image_index = ImageIndex()
@@ -1,29 +1,38 @@
 """
 Servicio para procesamiento de imágenes
 """
+import os
 import uuid
+from typing import Optional
 import numpy as np
 from sklearn.preprocessing import normalize
 
 # Importar desde módulos especializados
 from preprocesamiento.preprocesamiento import (
-    reescalar_imagen_bytes,
-    procesar_imagen_bytes,
-    binarizar_imagen_bytes,
+    ImagenPreprocesada,
+    codificar_png,
 )
 from feature_extraction.moments import (
-    calcular_momentos,
-    calcular_momentos_hu,
-    calcular_momentos_zernike,
+    momentos_desde_binaria,
+    momentos_hu_desde_binaria,
+    momentos_lote,
+    momentos_hu_lote,
+    momentos_zernike_desde_binaria,
+    momentos_zernike_lote,
+    descriptores_forma,
+    descriptores_forma_lote,
+    FAMILIAS_FORMA,
 )
 from feature_extraction.sift import (
-    procesar_sift_con_descriptores,
+    procesar_sift_gris,
 )
 from feature_extraction.hog import (
-    procesar_hog_con_descriptores,
+    descriptor_hog_gris,
+    descriptores_hog_lote,
+    visualizacion_hog_gris,
 )
 from feature_extraction.cnn import (
-    procesar_cnn_con_descriptores,
+    procesar_cnn_imagen,
 )
 from utils.helpers import (
     validate_file_type,
@@ -32,7 +41,145 @@ from utils.helpers import (
     get_moment_keys,
     get_hu_keys,
     get_zernike_keys,
+    get_data_paths,
+    HOG_BACKEND,
+    CONTENT_DEDUP,
+    EXTRACTION_BATCH_SIZE,
 )
+from services.worker_pool import worker_pool
+from services.file_service import FileService
+from services.content_index import content_index, content_hash
+from services.descriptor_store import sift_descriptor_store
+from services.feature_store import feature_stores, vector_key, raw_key
+
+
+def _como_imagen(imagen) -> ImagenPreprocesada:
+    """
+    Acepta una ImagenPreprocesada o bytes codificados (compatibilidad)
+    """
+    if isinstance(imagen, ImagenPreprocesada):
+        return imagen
+    return ImagenPreprocesada.desde_bytes(imagen)
+
+
+def _vector_medio(descriptores) -> np.ndarray:
+    """Promedio normalizado de los descriptores SIFT (vector cero si no hay)"""
+    if len(descriptores) == 0:
+        # SIFT tiene 128 dimensiones por descriptor
+        return np.zeros(128, dtype=float)
+    vector = np.mean(descriptores, axis=0, dtype=np.float64).reshape(1, -1)
+    return normalize(vector, norm='l2')[0]
+
+
+# Nombres de los valores de cada familia de momentos, en el orden del vector
+CLAVES_MOMENTOS = {"moments": get_moment_keys, "hu": get_hu_keys, "zernike": get_zernike_keys}
+
+
+def _feature_keys(method: str, familias: tuple = None) -> list:
+    """
+    Claves del feature store bajo las que se guardan las características
+    de un método (HOG depende del backend; "shape" se guarda por familia)
+    """
+    if method is None:
+        return []
+    if method == "shape":
+        return list(familias or FAMILIAS_FORMA)
+    if method == "hog":
+        return [vector_key("hog")]
+    return [method]
+
+
+def _datos_a_vector(datos) -> Optional[np.ndarray]:
+    """Valores sin normalizar (dict de momentos o descriptor HOG) como vector, o None si está vacío"""
+    valores = np.asarray(list(datos.values()) if isinstance(datos, dict) else datos, dtype=float)
+    return valores if valores.size else None
+
+
+def _datos_desde_vector(key: str, valores: np.ndarray):
+    """Inverso de _datos_a_vector: dict por nombre para los momentos, lista para HOG"""
+    if key in CLAVES_MOMENTOS:
+        return dict(zip(CLAVES_MOMENTOS[key](), (float(v) for v in valores)))
+    return valores.tolist()
+
+
+def _features_para_cache(method: str, familias: tuple, features) -> dict:
+    """
+    {clave del feature store: vector} con lo que se guarda de las
+    características de un método: el vector normalizado y, bajo raw_key, los
+    valores sin normalizar. No se guardan visualizaciones (se generan al
+    pedirlas) ni descriptores SIFT (viven en sift_descriptor_store); el
+    vector SIFT lo guarda el router una vez codificado.
+    """
+    if method is None or method == "sift":
+        return {}
+    if method == "cnn":
+        # La lista de características CNN es el propio vector
+        return {"cnn": features[2]}
+    por_clave = features if method == "shape" else {_feature_keys(method)[0]: features}
+    result = {}
+    for key in _feature_keys(method, familias):
+        datos, vector = por_clave[key]
+        result[key] = vector
+        result[raw_key(key)] = _datos_a_vector(datos)
+    return result
+
+
+def _features_desde_cache(entry: dict, method: str, familias: tuple = None):
+    """
+    Reconstruye las características del método para la entrada desde el
+    feature store (o los descriptores guardados), o None si falta alguna parte
+    """
+    image_id = entry["image_id"]
+    if method == "sift":
+        if not sift_descriptor_store.exists(image_id):
+            return None
+        descriptores = np.asarray(sift_descriptor_store.load(image_id))
+        return None, descriptores, _vector_medio(descriptores)
+    if method == "cnn":
+        vector = feature_stores.get("cnn").get(image_id)
+        return None if vector is None else (None, vector.tolist(), vector)
+    
+    familias = _feature_keys(method, familias)
+    result = {}
+    for familia in familias:
+        vector = feature_stores.get(familia).get(image_id)
+        valores = feature_stores.get(raw_key(familia)).get(image_id) if vector is not None else None
+        if valores is None:
+            return None
+        result[familia] = (_datos_desde_vector(familia, valores), vector)
+    return result if method == "shape" else result[familias[0]]
+
+
+def _registrar(registros: list):
+    """
+    Registra en el índice de contenido y en el feature store las
+    características recién extraídas: [(hash, image_data, content_type, method, familias, features)]
+    """
+    entradas, vectores = [], {}
+    for digest, image_data, content_type, method, familias, features in registros:
+        if CONTENT_DEDUP and digest:
+            entradas.append((digest, image_data, content_type))
+        for key, vector in _features_para_cache(method, familias, features).items():
+            ids, lote = vectores.setdefault(key, ([], []))
+            ids.append(image_data["image_id"])
+            lote.append(vector)
+    for key, (ids, lote) in vectores.items():
+        feature_stores.get(key).put_many(ids, lote)
+    content_index.record_many(entradas)
+
+
+def _image_data_deduplicada(entry: dict, digest: str) -> dict:
+    """
+    image_data de una subida ya procesada: mismo image_id y artefactos, sin
+    original que volver a escribir
+    """
+    return {
+        "image_id": entry["image_id"],
+        "file_names": entry["file_names"],
+        "original_png": None,
+        "content_hash": digest,
+        "deduplicated": True,
+    }
 
 
 class ImageProcessingService:
@@ -41,40 +188,37 @@ class ImageProcessingService:
     """
     
     @staticmethod
-    def process_image(content: bytes, content_type: str, filename: str) -> dict:
+    def process_image(content: bytes, content_type: str, filename: str, image_id: str = None) -> dict:
         """
-        Procesa una imagen y extrae todas las características básicas
+        Procesa una imagen y extrae todas las características básicas.
+        image_id permite reprocesar un contenido ya indexado conservando su id.
         """
         # Validaciones
         validate_file_size(content, filename)
         validate_file_type(content_type)
         
         # Generar ID y nombres de archivos
-        image_id = uuid.uuid4().hex
+        image_id = image_id or uuid.uuid4().hex
         file_names = generate_file_names(image_id, content_type)
         
         try:
-            # Procesar imagen
-            resized_bytes = reescalar_imagen_bytes(content)
-            processed_bytes = procesar_imagen_bytes(resized_bytes)
-            binarized_bytes = binarizar_imagen_bytes(resized_bytes)
+            # Decodificar una sola vez; el PNG se genera al persistir
+            imagen = ImagenPreprocesada.desde_bytes(content)
             
             return {
                 "image_id": image_id,
                 "file_names": file_names,
-                "resized_bytes": resized_bytes,
-                "processed_bytes": processed_bytes,
-                "binarized_bytes": binarized_bytes,
+                "imagen": imagen,
             }
         except Exception as e:
             raise ValueError(f"Error procesando {filename}: {e}")
     
     @staticmethod
-    def extract_moments(image_bytes: bytes) -> tuple:
+    def extract_moments(imagen) -> tuple:
         """
         Extrae momentos regulares y retorna vector normalizado
         """
-        momentos = calcular_momentos(image_bytes)
+        momentos = momentos_desde_binaria(_como_imagen(imagen).binaria)
         moment_keys = get_moment_keys()
         
         vector = [float(momentos[k]) for k in moment_keys]
@@ -84,11 +228,11 @@ class ImageProcessingService:
         return momentos, vector_normalizado
     
     @staticmethod
-    def extract_hu_moments(image_bytes: bytes) -> tuple:
+    def extract_hu_moments(imagen) -> tuple:
         """
         Extrae momentos Hu y retorna vector normalizado
         """
-        momentos_hu = calcular_momentos_hu(image_bytes)
+        momentos_hu = momentos_hu_desde_binaria(_como_imagen(imagen).binaria)
         hu_keys = get_hu_keys()
         
         vector = np.array([float(momentos_hu[k]) for k in hu_keys], dtype=float).reshape(1, -1)
@@ -97,11 +241,43 @@ class ImageProcessingService:
         return momentos_hu, vector_normalizado
     
     @staticmethod
-    def extract_zernike_moments(image_bytes: bytes) -> tuple:
+    def extract_moments_batch(imagenes: list) -> list:
+        """
+        Extrae momentos regulares de varias imágenes con el kernel vectorizado.
+        Retorna [(momentos, vector_normalizado)] en el orden recibido.
+        """
+        if not imagenes:
+            return []
+        lote = momentos_lote([_como_imagen(imagen).binaria for imagen in imagenes])
+        moment_keys = get_moment_keys()
+        
+        vectores = np.array([[float(m[k]) for k in moment_keys] for m in lote], dtype=float)
+        vectores_normalizados = normalize(vectores, norm='l2')
+        
+        return list(zip(lote, vectores_normalizados))
+    
+    @staticmethod
+    def extract_hu_moments_batch(imagenes: list) -> list:
+        """
+        Extrae momentos Hu de varias imágenes con el kernel vectorizado.
+        Retorna [(momentos_hu, vector_normalizado)] en el orden recibido.
+        """
+        if not imagenes:
+            return []
+        lote = momentos_hu_lote([_como_imagen(imagen).binaria for imagen in imagenes])
+        hu_keys = get_hu_keys()
+        
+        vectores = np.array([[float(m[k]) for k in hu_keys] for m in lote], dtype=float)
+        vectores_normalizados = normalize(vectores, norm='l2')
+        
+        return list(zip(lote, vectores_normalizados))
+    
+    @staticmethod
+    def extract_zernike_moments(imagen) -> tuple:
         """
         Extrae momentos Zernike y retorna vector normalizado
         """
-        momentos_zernike = calcular_momentos_zernike(image_bytes)
+        momentos_zernike = momentos_zernike_desde_binaria(_como_imagen(imagen).binaria)
         zernike_keys = get_zernike_keys()
         
         vector = [float(momentos_zernike[k]) for k in zernike_keys]
@@ -111,59 +287,397 @@ class ImageProcessingService:
         return momentos_zernike, vector_normalizado
     
     @staticmethod
-    def extract_sift_features(image_bytes: bytes) -> tuple:
+    def extract_zernike_moments_batch(imagenes: list) -> list:
         """
-        Extrae características SIFT y retorna vector normalizado
+        Extrae momentos Zernike de varias imágenes con un solo producto
+        matricial contra la base precalculada.
+        Retorna [(momentos_zernike, vector_normalizado)] en el orden recibido.
         """
-        sift_bytes, descriptores = procesar_sift_con_descriptores(image_bytes)
-        
-        if not descriptores:
-            # Retornar vector cero si no hay descriptores
-            vector_normalizado = np.zeros(128, dtype=float)  # SIFT tiene 128 dimensiones por descriptor
-            return sift_bytes, descriptores, vector_normalizado
+        if not imagenes:
+            return []
+        lote = momentos_zernike_lote([_como_imagen(imagen).binaria for imagen in imagenes])
+        zernike_keys = get_zernike_keys()
         
-        # Usar el promedio de todos los descriptores como vector característico
-        descriptores_array = np.array(descriptores, dtype=float)
-        vector = np.mean(descriptores_array, axis=0)
-        vector = vector.reshape(1, -1)
-        vector_normalizado = normalize(vector, norm='l2')[0]
+        vectores = np.array([[float(m[k]) for k in zernike_keys] for m in lote], dtype=float)
+        vectores_normalizados = normalize(vectores, norm='l2')
         
-        return sift_bytes, descriptores, vector_normalizado
+        return list(zip(lote, vectores_normalizados))
+    
+    @staticmethod
+    def extract_shape_descriptors(imagen, familias=FAMILIAS_FORMA) -> dict:
+        """
+        Extrae varias familias de momentos (moments, hu, zernike) con una sola
+        binarización y un solo cálculo de momentos crudos.
+        Retorna {familia: (descriptores, vector_normalizado)}
+        """
+        descriptores = descriptores_forma(_como_imagen(imagen).binaria, familias)
+        return ImageProcessingService._shape_result(descriptores)
     
     @staticmethod
-    def extract_hog_features(image_bytes: bytes) -> tuple:
+    def extract_shape_descriptors_batch(imagenes: list, familias=FAMILIAS_FORMA) -> list:
         """
-        Extrae características HOG y retorna vector normalizado
+        Extrae las familias de momentos de varias imágenes con los kernels por lote.
+        Retorna [{familia: (descriptores, vector_normalizado)}] en el orden recibido.
         """
-        hog_bytes, descriptores_hog = procesar_hog_con_descriptores(image_bytes)
+        lote = descriptores_forma_lote([_como_imagen(imagen).binaria for imagen in imagenes], familias)
+        return [ImageProcessingService._shape_result(descriptores) for descriptores in lote]
+    
+    @staticmethod
+    def _shape_result(descriptores: dict) -> dict:
+        result = {}
+        for familia, valores in descriptores.items():
+            vector = np.array([float(valores[k]) for k in CLAVES_MOMENTOS[familia]()], dtype=float).reshape(1, -1)
+            result[familia] = (valores, normalize(vector, norm='l2')[0])
         
-        if not descriptores_hog:
+        return result
+    
+    @staticmethod
+    def extract_sift_features(imagen) -> tuple:
+        """
+        Extrae características SIFT y retorna vector normalizado.
+        Los descriptores se retornan como ndarray (N, 128) compacto (uint8) y la
+        visualización como ndarray (se codifica al guardarla).
+        """
+        sift_img, descriptores = procesar_sift_gris(_como_imagen(imagen).gris)
+        return sift_img, descriptores, _vector_medio(descriptores)
+    
+    @staticmethod
+    def _hog_result(descriptores: np.ndarray) -> tuple:
+        if descriptores.size == 0:
             # Retornar vector cero si no hay descriptores
             vector_normalizado = np.zeros(1000, dtype=float)  # HOG dimensiones típicas
-            return hog_bytes, descriptores_hog, vector_normalizado
+            return [], vector_normalizado
         
         # HOG devuelve un vector de características directamente
-        vector = np.array(descriptores_hog, dtype=float).reshape(1, -1)
-        vector_normalizado = normalize(vector, norm='l2')[0]
+        vector_normalizado = normalize(descriptores.reshape(1, -1), norm='l2')[0]
         
-        return hog_bytes, descriptores_hog, vector_normalizado
+        return descriptores.tolist(), vector_normalizado
     
     @staticmethod
-    def extract_cnn_features(image_bytes: bytes) -> tuple:
+    def extract_hog_features(imagen, backend: str = None) -> tuple:
         """
-        Extrae características CNN usando la función ya implementada en feature_extraction
+        Extrae características HOG (solo el vector, sin visualización) y
+        retorna (descriptores_hog, vector_normalizado).
+        La visualización *_hog.png se genera bajo demanda (generar_artefacto).
+        """
+        descriptores = descriptor_hog_gris(_como_imagen(imagen).gris, backend or HOG_BACKEND)
+        return ImageProcessingService._hog_result(descriptores)
+    
+    @staticmethod
+    def extract_hog_features_batch(imagenes: list, backend: str = None) -> list:
+        """
+        Extrae características HOG de varias imágenes.
+        Retorna [(descriptores_hog, vector_normalizado)] en el orden recibido.
+        """
+        grises = [_como_imagen(imagen).gris for imagen in imagenes]
+        return [
+            ImageProcessingService._hog_result(descriptores)
+            for descriptores in descriptores_hog_lote(grises, backend or HOG_BACKEND)
+        ]
+    
+    @staticmethod
+    def extract_cnn_features(imagen) -> tuple:
+        """
+        Extrae características CNN usando la función ya implementada en feature_extraction.
+        La visualización se retorna como ndarray (se codifica al guardarla).
         """
         try:
-            # Usar la función CNN que ya está bien implementada
-            cnn_image_bytes, features_list = procesar_cnn_con_descriptores(image_bytes)
+            # Usar la versión procesada (escala de grises) ya decodificada
+            cnn_img, features_list = procesar_cnn_imagen(_como_imagen(imagen).gris)
             
             # Convertir features a numpy array normalizado
             vector_normalizado = np.array(features_list, dtype=float)
             
-            return cnn_image_bytes, features_list, vector_normalizado
+            return cnn_img, features_list, vector_normalizado
             
         except Exception as e:
             raise ValueError(f"Error en extracción CNN: {e}")
+    
+    @staticmethod
+    def load_imagen(image_data: dict) -> ImagenPreprocesada:
+        """
+        Imagen decodificada de un image_data: desde su PNG original o, en las
+        subidas deduplicadas (original_png None), desde el original guardado
+        """
+        if image_data.get("imagen") is not None:
+            return _como_imagen(image_data["imagen"])
+        if image_data.get("original_png") is not None:
+            return ImagenPreprocesada.desde_bytes(image_data["original_png"])
+        path = os.path.join(get_data_paths()["original_dir"], image_data["file_names"]["original"])
+        with open(path, "rb") as f:
+            return ImagenPreprocesada.desde_bytes(f.read())
+
+    @staticmethod
+    async def extract_cnn_features_cached(image_datas: list, extract) -> list:
+        """
+        Características CNN de las imágenes de una petición: las ya extraídas
+        para el mismo contenido se toman del índice y el resto pasa por
+        extract(imagenes) (p. ej. el servidor de micro-lotes).
+        Retorna [(cnn_img o None, features_list, vector)] en el orden recibido.
+        """
+        resultados = [None] * len(image_datas)
+        pendientes = []
+        for i, image_data in enumerate(image_datas):
+            digest = image_data.get("content_hash")
+            entry = content_index.lookup(digest) if CONTENT_DEDUP and digest else None
+            cached = _features_desde_cache(entry, "cnn") if entry and entry["image_id"] == image_data["image_id"] else None
+            if cached is not None:
+                resultados[i] = cached
+            else:
+                pendientes.append(i)
+        
+        if pendientes:
+            imagenes = [ImageProcessingService.load_imagen(image_datas[i]) for i in pendientes]
+            extraidas = await extract(imagenes)
+            for i, features in zip(pendientes, extraidas):
+                resultados[i] = features
+            _registrar([
+                (image_datas[i].get("content_hash"), image_datas[i], None, "cnn", None, resultados[i])
+                for i in pendientes
+            ])
+        
+        return resultados
+
+    @staticmethod
+    async def process_files(files: list, method: str = None, familias: tuple = None) -> list:
+        """
+        Lee los archivos subidos y ejecuta process_image + la extracción del
+        método en el pool de trabajadores. Retorna, en el orden de subida,
+        (image_data, características) o la excepción de ese archivo.
+        Un contenido ya procesado (mismo hash) no vuelve al pool: se reutilizan
+        su image_id, sus artefactos y las características cacheadas del método
+        (image_data["original_png"] es None e image_data["deduplicated"] True).
+        Los vectores extraídos se guardan en el feature store del método.
+        """
+        resultados = [None] * len(files)
+        jobs, pendientes, repetidos = [], [], {}
+        vistos = {}
+        for i, file in enumerate(files):
+            content = await file.read()
+            digest = content_hash(content)
+            
+            if digest in vistos:
+                # Mismo contenido dos veces en la petición: se procesa una sola vez
+                repetidos[i] = vistos[digest]
+                continue
+            vistos[digest] = i
+            
+            entry = content_index.lookup(digest) if CONTENT_DEDUP else None
+            if entry is not None:
+                try:
+                    validate_file_size(content, file.filename)
+                    validate_file_type(file.content_type)
+                except ValueError as e:
+                    resultados[i] = e
+                    continue
+                features = _features_desde_cache(entry, method, familias) if method else None
+                if method is None or features is not None:
+                    resultados[i] = (_image_data_deduplicada(entry, digest), features)
+                    continue
+            
+            image_id = entry["image_id"] if entry else None
+            jobs.append((content, file.content_type, file.filename, image_id))
+            pendientes.append((i, digest, file.content_type))
+        
+        procesadas = await _extraer_en_pool(method, jobs, familias)
+        
+        registros = []
+        for (i, digest, content_type), procesada in zip(pendientes, procesadas):
+            resultados[i] = procesada
+            if isinstance(procesada, Exception):
+                continue
+            image_data, features = procesada
+            image_data["content_hash"] = digest
+            registros.append((digest, image_data, content_type, method, familias, features))
+        _registrar(registros)
+        
+        for i, origen in repetidos.items():
+            resultados[i] = resultados[origen]
+        return resultados
+
+    @staticmethod
+    async def process_stored(image_ids: list, method: str = None, familias: tuple = None) -> list:
+        """
+        Vuelve a extraer en el pool las características de imágenes ya
+        guardadas, a partir de su original en disco y conservando su id (no se
+        escribe ningún archivo). Los vectores quedan en el feature store.
+        Retorna, en el orden recibido, (image_data, características) o la excepción.
+        """
+        resultados = [None] * len(image_ids)
+        jobs, pendientes = [], []
+        for i, image_id in enumerate(image_ids):
+            try:
+                path, content_type = FileService.find_original(image_id)
+                with open(path, "rb") as f:
+                    content = f.read()
+            except (ValueError, OSError) as e:
+                resultados[i] = e
+                continue
+            jobs.append((content, content_type, os.path.basename(path), image_id))
+            pendientes.append(i)
+        
+        procesadas = await _extraer_en_pool(method, jobs, familias)
+        
+        registros = []
+        for i, procesada in zip(pendientes, procesadas):
+            resultados[i] = procesada
+            if not isinstance(procesada, Exception):
+                registros.append((None, procesada[0], None, method, familias, procesada[1]))
+        _registrar(registros)
+        return resultados
+
+
+def procesar_y_extraer(method: str, content: bytes, content_type: str, filename: str, familias: tuple = None, image_id: str = None) -> tuple:
+    """
+    Trabajo del pool (función de módulo, serializable): preprocesa la imagen y
+    extrae las características del método. Solo vuelven al proceso principal
+    el PNG del original (para escribirlo) y las características: los arreglos
+    decodificados se quedan en el trabajador.
+    method=None solo preprocesa (p. ej. CNN, cuya inferencia va por lotes);
+    method="shape" extrae las familias de momentos indicadas de una sola vez.
+    """
+    image_data, imagen = _preprocesar(content, content_type, filename, image_id)
+    if method is None:
+        return image_data, None
+    
+    features = _extractor(method, familias)(imagen)
+    if method == "sift":
+        # La visualización no viaja de vuelta: se genera al pedir el artefacto
+        _, *resto = features
+        features = (None, *resto)
+    return image_data, features
+
+
+def _preprocesar(content: bytes, content_type: str, filename: str, image_id: str = None) -> tuple:
+    """(image_data con el PNG del original, imagen decodificada)"""
+    image_data = ImageProcessingService.process_image(content, content_type, filename, image_id)
+    imagen = image_data.pop("imagen")
+    # Solo se persiste el original; los derivados se generan al pedirlos
+    image_data["original_png"] = imagen.png("original")
+    return image_data, imagen
+
+
+def _extractor(method: str, familias: tuple = None):
+    extractores = {
+        "moments": ImageProcessingService.extract_moments,
+        "hu": ImageProcessingService.extract_hu_moments,
+        "zernike": ImageProcessingService.extract_zernike_moments,
+        "sift": ImageProcessingService.extract_sift_features,
+        "hog": ImageProcessingService.extract_hog_features,
+        "shape": lambda imagen: ImageProcessingService.extract_shape_descriptors(imagen, familias or FAMILIAS_FORMA),
+    }
+    if method not in extractores:
+        raise ValueError(f"Método de extracción no válido: {method}")
+    return extractores[method]
+
+
+def _extractor_lote(method: str, familias: tuple = None):
+    """Extractor por lote del método (un fragmento de imágenes en una llamada) o None si no tiene"""
+    extractores = {
+        "moments": ImageProcessingService.extract_moments_batch,
+        "hu": ImageProcessingService.extract_hu_moments_batch,
+        "zernike": ImageProcessingService.extract_zernike_moments_batch,
+        "hog": ImageProcessingService.extract_hog_features_batch,
+        "shape": lambda imagenes: ImageProcessingService.extract_shape_descriptors_batch(imagenes, familias or FAMILIAS_FORMA),
+    }
+    return extractores.get(method)
+
+
+def procesar_y_extraer_lote(method: str, jobs: list, familias: tuple = None) -> list:
+    """
+    Trabajo del pool: procesar_y_extraer para un fragmento de imágenes
+    [(content, content_type, filename, image_id)]. En los métodos con
+    extractor por lote las imágenes preprocesadas del fragmento se extraen
+    juntas. Retorna, en orden, (image_data, características) o la excepción
+    de cada imagen.
+    """
+    extractor_lote = _extractor_lote(method, familias)
+    if extractor_lote is None:
+        return [_o_excepcion(procesar_y_extraer, method, *job[:3], familias, job[3]) for job in jobs]
+    
+    resultados = [None] * len(jobs)
+    preparadas = []
+    for i, job in enumerate(jobs):
+        preparada = _o_excepcion(_preprocesar, *job)
+        if isinstance(preparada, Exception):
+            resultados[i] = preparada
+        else:
+            preparadas.append((i, *preparada))
+    if not preparadas:
+        return resultados
+    
+    imagenes = [imagen for _, _, imagen in preparadas]
+    try:
+        extraidas = extractor_lote(imagenes)
+    except Exception:
+        # El lote falla entero: se repite imagen por imagen para que solo la
+        # culpable reciba la excepción
+        extraidas = [_o_excepcion(_extractor(method, familias), imagen) for imagen in imagenes]
+    for (i, image_data, _), features in zip(preparadas, extraidas):
+        resultados[i] = features if isinstance(features, Exception) else (image_data, features)
+    return resultados
+
+
+def _o_excepcion(fn, *args):
+    """fn(*args) o la excepción que lance (se devuelve en su posición del lote)"""
+    try:
+        return fn(*args)
+    except Exception as e:
+        return e
+
+
+async def _extraer_en_pool(method: str, jobs: list, familias: tuple = None) -> list:
+    """
+    Reparte los jobs [(content, content_type, filename, image_id)] en
+    fragmentos de hasta EXTRACTION_BATCH_SIZE imágenes (sin dejar
+    trabajadores ociosos) y retorna un resultado o excepción por job, en orden
+    """
+    if not jobs:
+        return []
+    tam = max(1, min(EXTRACTION_BATCH_SIZE, -(-len(jobs) // worker_pool.max_workers)))
+    fragmentos = [jobs[i:i + tam] for i in range(0, len(jobs), tam)]
+    lotes = await worker_pool.map(
+        procesar_y_extraer_lote,
+        [(method, fragmento, familias) for fragmento in fragmentos],
+        return_exceptions=True,
+    )
+    resultados = []
+    for fragmento, lote in zip(fragmentos, lotes):
+        # Un fragmento que falla entero (p. ej. un trabajador caído) falla en cada imagen
+        resultados.extend([lote] * len(fragmento) if isinstance(lote, Exception) else lote)
+    return resultados
+
+
+def _png_derivado(imagen: ImagenPreprocesada, tipo: str) -> bytes:
+    if tipo == "processed":
+        return imagen.png("procesada")
+    if tipo == "binarized":
+        return imagen.png("binarizada")
+    if tipo == "sift":
+        return codificar_png(procesar_sift_gris(imagen.gris)[0], "imagen SIFT")
+    if tipo == "hog":
+        return codificar_png(visualizacion_hog_gris(imagen.gris), "imagen HOG")
+    if tipo == "cnn":
+        # La visualización CNN es la entrada del modelo: la imagen gris de 256x256
+        return codificar_png(imagen.gris, "imagen CNN")
+    raise ValueError(f"Tipo de artefacto no válido: {tipo}")
+
+
+def generar_artefacto(origen: str, tipo: str, destino: str) -> int:
+    """
+    Trabajo del pool: genera un artefacto derivado (processed, binarized,
+    sift, hog o cnn) a partir del original guardado. Se escribe en un
+    temporal y se renombra para que una lectura concurrente nunca vea un PNG
+    a medias. Retorna el tamaño en bytes.
+    """
+    with open(origen, "rb") as f:
+        png = _png_derivado(ImagenPreprocesada.desde_bytes(f.read()), tipo)
+    
+    temporal = f"{destino}.{uuid.uuid4().hex}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(png)
+    os.replace(temporal, destino)
+    return len(png)
 
 
 # Instancia global del servicio
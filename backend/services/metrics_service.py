@@ -0,0 +1,95 @@
+"""
+Servicio de métricas diferidas: se calculan en segundo plano y se cachean por versión del modelo
+"""
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+from models.clustering_models import clustering_models
+from services.clustering_service import ClusteringService
+
+
+class MetricsService:
+    """
+    Calcula las métricas de clustering en un hilo de fondo sobre un snapshot
+    del modelo y las cachea por (tipo de modelo, versión). Las peticiones de
+    ingesta solo encolan el cálculo y devuelven la última métrica disponible.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="metrics")
+        self._lock = threading.Lock()
+        # model_type -> (version_token, métricas)
+        self._latest: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        # model_type -> (version_token, future)
+        self._pending: Dict[str, Tuple[str, Future]] = {}
+
+    def _compute(self, model_type: str, token: str, snapshot) -> Dict[str, Any]:
+        try:
+            metrics = ClusteringService.compute_metrics(snapshot)
+            with self._lock:
+                self._latest[model_type] = (token, metrics)
+            return metrics
+        finally:
+            # También si falla: la siguiente petición de esta versión reintenta
+            with self._lock:
+                if self._pending.get(model_type, (None,))[0] == token:
+                    del self._pending[model_type]
+
+    def schedule(self, model_type: str) -> Tuple[str, Future]:
+        """
+        Encola el cálculo de métricas para la versión actual del modelo (si no
+        está ya cacheada o en curso). Debe llamarse desde el hilo que muta el modelo.
+        """
+        model = clustering_models._models.get(model_type)
+        if not model:
+            raise ValueError(f"No hay modelo activo para {model_type}")
+
+        token = model.version_token
+        with self._lock:
+            latest = self._latest.get(model_type)
+            if latest and latest[0] == token:
+                future: Future = Future()
+                future.set_result(latest[1])
+                return token, future
+            pending = self._pending.get(model_type)
+            if pending and pending[0] == token:
+                return pending
+            future = self._executor.submit(self._compute, model_type, token, model.snapshot())
+            self._pending[model_type] = (token, future)
+            return token, future
+
+    def get_deferred(self, model_type: str) -> Dict[str, Any]:
+        """
+        Para respuestas de ingesta: encola el cálculo y devuelve la última
+        métrica cacheada junto con el token de la versión solicitada
+        """
+        token, future = self.schedule(model_type)
+        latest = self.get_latest(model_type)
+        # Solo se reutilizan métricas de la misma instancia del modelo
+        if latest and latest[0].split(":")[0] != token.split(":")[0]:
+            latest = None
+        ready = latest is not None and latest[0] == token
+        return {
+            "metrics": latest[1] if latest else None,
+            "metrics_version": token,
+            "metrics_ready": ready,
+        }
+
+    def get_latest(self, model_type: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Última métrica cacheada (token, métricas) o None"""
+        with self._lock:
+            return self._latest.get(model_type)
+
+    async def wait(self, model_type: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Espera (sin bloquear el event loop) a que las métricas de la versión
+        actual estén listas
+        """
+        token, future = self.schedule(model_type)
+        metrics = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        return {"metrics": metrics, "metrics_version": token, "metrics_ready": True}
+
+
+# Instancia global del servicio
+metrics_service = MetricsService()
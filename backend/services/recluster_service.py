@@ -0,0 +1,151 @@
+"""
+Servicio de re-agrupamiento: agrupa imágenes ya guardadas a partir de sus
+vectores persistidos, sin volver a subirlas
+"""
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from models.clustering_models import clustering_models
+from services.image_service import image_service
+from services.image_index import image_index
+from services.clustering_service import clustering_service
+from services.feature_store import feature_stores
+from services.descriptor_store import sift_descriptor_store, IMAGE_ID_RE
+from services.sift_encoding_service import sift_encoding_service, CODEBOOK_VECTOR_KEYS
+from services.cnn_inference_service import cnn_inference_service
+
+RECLUSTER_METHODS = ("moments", "hu", "zernike", "sift", "hog", "cnn")
+
+
+class ReclusterService:
+    """
+    Resuelve el vector de cada imagen desde el feature store; las que no
+    están se extraen una sola vez desde su original (y quedan guardadas)
+    """
+
+    # Un solo re-entrenamiento del codebook SIFT a la vez
+    _sift_refit_lock = asyncio.Lock()
+
+    @staticmethod
+    def _errores(image_ids: List[str], procesadas: list) -> Tuple[list, Dict[str, str]]:
+        """Separa ([(id, (image_data, características))], {id: error})"""
+        ok, errores = [], {}
+        for image_id, procesada in zip(image_ids, procesadas):
+            if isinstance(procesada, Exception):
+                errores[image_id] = str(procesada)
+            else:
+                ok.append((image_id, procesada))
+        return ok, errores
+
+    @staticmethod
+    async def _extract_sift(image_ids: List[str]) -> Tuple[Dict[str, np.ndarray], Dict[str, str], int]:
+        """
+        Codifica con el codebook actual los descriptores guardados (o
+        re-extraídos) de todas las imágenes, en un solo lote: todos los
+        vectores corresponden a la misma versión del codebook.
+        Retorna ({id: vector}, {id: error}, imágenes re-extraídas del original)
+        """
+        descriptores = {i: sift_descriptor_store.load(i) for i in image_ids if IMAGE_ID_RE.match(i) and sift_descriptor_store.exists(i)}
+        sin_descriptores = [i for i in image_ids if i not in descriptores]
+        ok, errores = ReclusterService._errores(sin_descriptores, await image_service.process_stored(sin_descriptores, "sift"))
+        for image_id, (_, (_, desc, _)) in ok:
+            sift_descriptor_store.save(image_id, desc)
+            descriptores[image_id] = desc
+
+        ids = [i for i in image_ids if i in descriptores]
+        if ids and not sift_encoding_service.ready:
+            # Sin codebook todavía: se entrena con todos los descriptores guardados
+            await ReclusterService.refit_sift_codebook()
+        codificados = await asyncio.to_thread(sift_encoding_service.encode_batch, [descriptores[i] for i in ids])
+
+        vectores = {}
+        for image_id, vector in zip(ids, codificados):
+            if vector is None:
+                errores[image_id] = "No se pudieron codificar descriptores SIFT"
+            else:
+                vectores[image_id] = vector
+        feature_stores.for_method("sift").put_many(list(vectores), list(vectores.values()))
+        return vectores, errores, len(ok)
+
+    @staticmethod
+    async def _extract_cnn(image_ids: List[str]) -> Tuple[Dict[str, np.ndarray], Dict[str, str]]:
+        ok, errores = ReclusterService._errores(image_ids, await image_service.process_stored(image_ids))
+        extraidas = await image_service.extract_cnn_features_cached([data for _, (data, _) in ok], cnn_inference_service.extract)
+        return {image_id: features[2] for (image_id, _), features in zip(ok, extraidas)}, errores
+
+    @staticmethod
+    async def resolve_vectors(method: str, image_ids: List[str]) -> Tuple[Dict[str, np.ndarray], Dict[str, str], int]:
+        """
+        Retorna ({id: vector}, {id: error}, extraídas): los vectores del
+        feature store y los de las imágenes que hubo que extraer. En SIFT se
+        vuelven a codificar todos desde sus descriptores, para no mezclar
+        vectores de distintas versiones del codebook.
+        """
+        if method not in RECLUSTER_METHODS:
+            raise ValueError(f"Método no válido: {method} (use {', '.join(RECLUSTER_METHODS)})")
+
+        if method == "sift":
+            return await ReclusterService._extract_sift(list(dict.fromkeys(image_ids)))
+
+        encontrados, matriz = feature_stores.for_method(method).get_many(image_ids)
+        vectores = dict(zip(encontrados, matriz))
+        faltantes = list(dict.fromkeys(i for i in image_ids if i not in vectores))
+        if not faltantes:
+            return vectores, {}, 0
+
+        if method == "cnn":
+            extraidos, errores = await ReclusterService._extract_cnn(faltantes)
+        else:
+            ok, errores = ReclusterService._errores(faltantes, await image_service.process_stored(faltantes, method))
+            extraidos = {image_id: features[-1] for image_id, (_, features) in ok}
+
+        vectores.update(extraidos)
+        return vectores, errores, len(extraidos)
+
+    @staticmethod
+    async def refit_sift_codebook(automatic: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Entrena un codebook nuevo con los descriptores guardados de todas las
+        imágenes, descarta los vectores SIFT codificados con el anterior y
+        vuelve a codificar todas. Si hay modelo SIFT activo se reconstruye con
+        sus capacidades y sus imágenes (en el orden en que se asignaron).
+        Con automatic=True (ingesta) retorna None si ya no toca entrenar.
+        """
+        async with ReclusterService._sift_refit_lock:
+            if automatic and not sift_encoding_service.training_due:
+                # Otra petición lo re-entrenó mientras esta esperaba
+                return None
+            return await ReclusterService._refit_sift_codebook()
+
+    @staticmethod
+    async def _refit_sift_codebook() -> Dict[str, Any]:
+        ids = sift_descriptor_store.ids()
+        descriptores = [sift_descriptor_store.load(i) for i in ids]
+        # El entrenamiento no toca el codebook activo: fuera del hilo principal
+        codebook = await asyncio.to_thread(sift_encoding_service.train, descriptores)
+
+        sift_encoding_service.install(codebook)
+        for key in CODEBOOK_VECTOR_KEYS:
+            feature_stores.get(key).reset()
+        codificados = sift_encoding_service.encode_batch(descriptores)
+        vectores = {image_id: vector for image_id, vector in zip(ids, codificados) if vector is not None}
+        feature_stores.for_method("sift").put_many(list(vectores), list(vectores.values()))
+
+        result = {"encoded": len(vectores), "model_rebuilt": False}
+        model = clustering_models._models.get("sift")
+        if model is not None:
+            del_modelo = image_index.assignments("sift", model.model_id)
+            pares = [(i, vectores[i]) for i in del_modelo if i in vectores]
+            nuevo, asignaciones, error = clustering_service.build_model("sift", model.capacities, pares)
+            clustering_service.install_model("sift", nuevo, asignaciones)
+            result.update({"model_rebuilt": True, "assigned": len(asignaciones)})
+            if error is not None or len(pares) < len(del_modelo):
+                result["not_assigned"] = len(del_modelo) - len(asignaciones)
+        print(f"[SIFT-CODEBOOK] Re-entrenado (versión {codebook.version_id}): {len(vectores)} imágenes codificadas")
+        return result
+
+
+# Instancia global del servicio
+recluster_service = ReclusterService()
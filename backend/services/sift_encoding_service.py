@@ -0,0 +1,206 @@
+"""
+Servicio de codificación SIFT: convierte los descriptores de cada imagen en un
+vector de longitud fija (BoVW, VLAD o promedio) con un codebook visual
+persistente. El codebook se entrena cuando hay descriptores de suficientes
+imágenes y entre un re-entrenamiento (refit) y el siguiente queda fijo.
+"""
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sklearn.preprocessing import normalize
+
+from clustering.codebook import VisualCodebook, CODIFICACIONES
+from utils.helpers import (
+    get_data_paths,
+    SIFT_ENCODING,
+    SIFT_CODEBOOK_SIZE,
+    SIFT_CODEBOOK_SEED,
+    SIFT_CODEBOOK_MIN_IMAGES,
+    SIFT_CODEBOOK_REFIT_GROWTH,
+)
+
+SIFT_DIM = 128
+SIFT_ENCODINGS = ("mean",) + CODIFICACIONES
+
+# Claves del feature store cuyos vectores dependen del codebook
+CODEBOOK_VECTOR_KEYS = tuple(f"sift_{encoding}" for encoding in CODIFICACIONES)
+
+
+class SiftEncodingService:
+    """
+    Mantiene el codebook visual en el proceso principal (un solo escritor,
+    igual que el clustering). Los trabajadores solo extraen descriptores.
+    Una vez entrenado, el codebook no cambia al ingerir: todos los vectores
+    guardados y los del modelo corresponden a la misma versión. Solo cuenta
+    las imágenes nuevas para saber cuándo toca entrenarlo o re-entrenarlo.
+    """
+
+    def __init__(self, encoding: str = SIFT_ENCODING, codebook_size: int = SIFT_CODEBOOK_SIZE, seed: int = SIFT_CODEBOOK_SEED):
+        if encoding not in SIFT_ENCODINGS:
+            raise ValueError(f"SIFT_ENCODING no válido: {encoding} (use {', '.join(SIFT_ENCODINGS)})")
+        self.encoding = encoding
+        self.codebook_size = int(codebook_size)
+        self.seed = int(seed)
+        self._codebook: Optional[VisualCodebook] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _codebook_file() -> str:
+        return get_data_paths()["sift_codebook_file"]
+
+    def _get_codebook(self) -> VisualCodebook:
+        """Carga el codebook persistido la primera vez (o crea uno vacío)"""
+        if self._codebook is None:
+            path = self._codebook_file()
+            codebook = None
+            if os.path.exists(path):
+                try:
+                    codebook = VisualCodebook.load(path)
+                except Exception as e:
+                    print(f"[SIFT-CODEBOOK] No se pudo cargar {path}: {e}")
+                if codebook is not None and codebook.k != self.codebook_size:
+                    print(f"[SIFT-CODEBOOK] El codebook guardado tiene {codebook.k} palabras y SIFT_CODEBOOK_SIZE={self.codebook_size}: se crea uno nuevo")
+                    codebook = None
+            self._codebook = codebook or VisualCodebook(k=self.codebook_size, dim=SIFT_DIM, seed=self.seed)
+        return self._codebook
+
+    @property
+    def ready(self) -> bool:
+        """Si hay codebook entrenado (la codificación mean no lo necesita)"""
+        if self.encoding == "mean":
+            return True
+        with self._lock:
+            return self._get_codebook().ready
+
+    @property
+    def output_dim(self) -> int:
+        if self.encoding == "mean":
+            return SIFT_DIM
+        return self._get_codebook().output_dim(self.encoding)
+
+    @staticmethod
+    def _as_array(descriptores) -> np.ndarray:
+        if descriptores is None or len(descriptores) == 0:
+            return np.empty((0, SIFT_DIM), dtype=np.float32)
+        return np.asarray(descriptores, dtype=np.float32)
+
+    @staticmethod
+    def _toca_entrenar(codebook: VisualCodebook) -> bool:
+        if not codebook.ready:
+            return codebook.imagenes_nuevas >= max(1, SIFT_CODEBOOK_MIN_IMAGES)
+        if SIFT_CODEBOOK_REFIT_GROWTH <= 0:
+            return False
+        return codebook.imagenes_nuevas >= max(1, SIFT_CODEBOOK_REFIT_GROWTH * codebook.n_imagenes)
+
+    def observe(self, n_imagenes: int) -> bool:
+        """
+        Cuenta imágenes recién ingeridas (con sus descriptores ya guardados).
+        Retorna si toca entrenar el codebook: el primero cuando hay
+        SIFT_CODEBOOK_MIN_IMAGES imágenes, y un refit cuando las nuevas llegan
+        a SIFT_CODEBOOK_REFIT_GROWTH veces las del entrenamiento anterior.
+        """
+        if self.encoding == "mean":
+            return False
+        with self._lock:
+            codebook = self._get_codebook()
+            codebook.imagenes_nuevas += int(n_imagenes)
+            return self._toca_entrenar(codebook)
+
+    @property
+    def training_due(self) -> bool:
+        """Si toca entrenar o re-entrenar el codebook (ver observe)"""
+        if self.encoding == "mean":
+            return False
+        with self._lock:
+            return self._toca_entrenar(self._get_codebook())
+
+    def encode_batch(self, descriptores_lote: List[Any]) -> List[Optional[np.ndarray]]:
+        """
+        Codifica los descriptores de cada imagen de un lote con la versión
+        actual del codebook (no lo modifica). Retorna un vector normalizado
+        por imagen, o None si la imagen no tiene descriptores o el codebook
+        aún no está entrenado.
+        """
+        lote = [self._as_array(d) for d in descriptores_lote]
+
+        if self.encoding == "mean":
+            return [
+                normalize(d.mean(axis=0, dtype=np.float64).reshape(1, -1), norm="l2")[0] if len(d) else None
+                for d in lote
+            ]
+
+        with self._lock:
+            codebook = self._get_codebook()
+            if not codebook.ready:
+                return [None] * len(lote)
+            return [codebook.encode(d, self.encoding) if len(d) else None for d in lote]
+
+    def train(self, descriptores_lote: List[Any]) -> VisualCodebook:
+        """
+        Entrena un codebook nuevo (k-means++ y Lloyd) con los descriptores de
+        las imágenes dadas, sin activarlo. Si hay más de los que usa la
+        inicialización se toma una muestra uniforme de cada imagen.
+        """
+        if self.encoding == "mean":
+            raise ValueError("SIFT_ENCODING=mean no usa codebook")
+        codebook = VisualCodebook(k=self.codebook_size, dim=SIFT_DIM, seed=self.seed)
+        lote = [d for d in (self._as_array(d) for d in descriptores_lote) if len(d)]
+        total = sum(len(d) for d in lote)
+        if total < codebook.k:
+            raise ValueError(f"Se necesitan al menos {codebook.k} descriptores para entrenar el codebook (hay {total})")
+        if total > codebook.max_init_samples:
+            rng = np.random.default_rng(self.seed)
+            fraccion = codebook.max_init_samples / total
+            lote = [d[rng.random(len(d)) < fraccion] for d in lote]
+        codebook.partial_fit(np.concatenate(lote))
+        codebook.n_imagenes = len(lote)
+        return codebook
+
+    def install(self, codebook: VisualCodebook):
+        """Activa y persiste un codebook entrenado con train"""
+        with self._lock:
+            self._codebook = codebook
+            codebook.save(self._codebook_file())
+
+    def save(self):
+        """Persiste el codebook junto al estado del clustering SIFT"""
+        if self.encoding == "mean":
+            return
+        with self._lock:
+            if self._codebook is not None:
+                self._codebook.save(self._codebook_file())
+
+    def reset(self):
+        """Descarta el codebook (en memoria y en disco)"""
+        with self._lock:
+            self._codebook = None
+            path = self._codebook_file()
+            if os.path.exists(path):
+                os.remove(path)
+
+    def get_status(self) -> Dict[str, Any]:
+        if self.encoding == "mean":
+            return {"encoding": "mean", "output_dim": SIFT_DIM}
+        with self._lock:
+            codebook = self._get_codebook()
+            return {
+                "encoding": self.encoding,
+                "codebook_size": codebook.k,
+                "output_dim": codebook.output_dim(self.encoding),
+                "ready": codebook.ready,
+                "pending_descriptors": int(len(codebook.pendientes)),
+                "descriptors_seen": codebook.n_descriptores,
+                "updates": codebook.n_actualizaciones,
+                "version": codebook.version_id,
+                "trained_images": codebook.n_imagenes,
+                "images_since_training": codebook.imagenes_nuevas,
+                "min_images": SIFT_CODEBOOK_MIN_IMAGES,
+                "refit_growth": SIFT_CODEBOOK_REFIT_GROWTH,
+                "words_in_use": int(np.count_nonzero(codebook.counts)),
+            }
+
+
+# Instancia global del servicio
+sift_encoding_service = SiftEncodingService()
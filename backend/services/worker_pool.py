@@ -0,0 +1,98 @@
+"""
+Pool de trabajadores para el trabajo CPU-bound (OpenCV/skimage/numpy) fuera del event loop
+"""
+import asyncio
+import multiprocessing
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional
+from utils.helpers import WORKER_POOL_MODE, WORKER_POOL_SIZE, WORKER_POOL_MAX_PENDING
+
+WORKER_POOL_MODES = ("process", "thread", "inline")
+
+
+def _init_worker():
+    """Un hilo de OpenCV por proceso: el paralelismo lo da el pool"""
+    try:
+        import cv2
+        cv2.setNumThreads(1)
+    except ImportError:
+        pass
+
+
+class WorkerPool:
+    """
+    Ejecuta trabajos de extracción en procesos (o hilos) con concurrencia acotada.
+
+    - mode="process": ProcessPoolExecutor (los trabajos deben ser funciones de
+      módulo con argumentos/resultados serializables con pickle)
+    - mode="thread": ThreadPoolExecutor
+    - mode="inline": en el mismo hilo (comportamiento anterior, para depurar)
+
+    Como mucho `max_pending` trabajos están en vuelo a la vez; map() devuelve
+    los resultados en el orden de entrada. La actualización del clustering no
+    pasa por aquí: sigue siendo de un solo escritor en el proceso principal.
+    """
+
+    def __init__(self, mode: str = WORKER_POOL_MODE, max_workers: int = WORKER_POOL_SIZE, max_pending: int = WORKER_POOL_MAX_PENDING):
+        if mode not in WORKER_POOL_MODES:
+            raise ValueError(f"WORKER_POOL_MODE no válido: {mode} (use {', '.join(WORKER_POOL_MODES)})")
+        self.mode = mode
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending or 2 * self.max_workers))
+        self._executor: Optional[Executor] = None
+        # Un semáforo por event loop activo
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                # spawn: seguro aunque el proceso principal tenga hilos activos
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="extraction")
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_pending)
+        return semaphore
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Ejecuta un trabajo respetando el límite de concurrencia"""
+        async with self._get_semaphore():
+            if self.mode == "inline":
+                return fn(*args)
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+            except BrokenProcessPool:
+                # Un trabajador murió: el próximo trabajo crea un pool nuevo
+                self._executor = None
+                raise
+
+    async def map(self, fn: Callable, args_list: List[tuple], return_exceptions: bool = False) -> List[Any]:
+        """
+        Ejecuta fn(*args) para cada tupla de argumentos y retorna los resultados
+        en el mismo orden. Con return_exceptions=True la excepción de cada
+        trabajo se devuelve en su posición en lugar de propagarse.
+        """
+        return await asyncio.gather(
+            *(self.run(fn, *args) for args in args_list),
+            return_exceptions=return_exceptions,
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Instancia global del pool
+worker_pool = WorkerPool()
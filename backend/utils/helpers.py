@@ -8,6 +8,81 @@ from typing import List
 ALLOWED_TYPES = {"image/jpeg": ".jpg", "image/png": ".png"}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
+# Silueta aproximada: por encima de este número de vectores se estima por muestreo
+SILHOUETTE_EXACT_MAX_POINTS = int(os.getenv("SILHOUETTE_EXACT_MAX_POINTS", "5000"))
+SILHOUETTE_SAMPLE_SIZE = int(os.getenv("SILHOUETTE_SAMPLE_SIZE", "2000"))
+SILHOUETTE_SAMPLE_SEED = int(os.getenv("SILHOUETTE_SAMPLE_SEED", "0"))
+
+# Persistencia: el journal se compacta en un snapshot nuevo al superar
+# max(JOURNAL_COMPACT_MIN_RECORDS, registros del snapshot)
+JOURNAL_COMPACT_MIN_RECORDS = int(os.getenv("JOURNAL_COMPACT_MIN_RECORDS", "1000"))
+
+# Si se define, la matriz de vectores de cada modelo se respalda con un archivo
+# mapeado en memoria dentro de este directorio (en lugar de memoria anónima)
+VECTOR_STORE_MMAP_DIR = os.getenv("VECTOR_STORE_MMAP_DIR", "")
+
+# Tamaño de lote para la inferencia CNN (ResNet50) de todas las imágenes de una petición
+CNN_BATCH_SIZE = int(os.getenv("CNN_BATCH_SIZE", "32"))
+
+# Micro-lotes entre peticiones concurrentes: se agrupan hasta este número de
+# imágenes o hasta esta espera (ms) desde la primera imagen encolada
+CNN_MICROBATCH_MAX_SIZE = int(os.getenv("CNN_MICROBATCH_MAX_SIZE", "64"))
+CNN_MICROBATCH_MAX_WAIT_MS = float(os.getenv("CNN_MICROBATCH_MAX_WAIT_MS", "10"))
+
+# Codificación del vector SIFT: bovw (histograma de palabras visuales), vlad o
+# mean (promedio de descriptores, comportamiento anterior). El codebook visual
+# tiene SIFT_CODEBOOK_SIZE palabras y se persiste en sift_codebook.npz
+SIFT_ENCODING = os.getenv("SIFT_ENCODING", "bovw")
+SIFT_CODEBOOK_SIZE = int(os.getenv("SIFT_CODEBOOK_SIZE", "64"))
+SIFT_CODEBOOK_SEED = int(os.getenv("SIFT_CODEBOOK_SEED", "0"))
+# El codebook no se entrena hasta tener descriptores de SIFT_CODEBOOK_MIN_IMAGES
+# imágenes; después se re-entrena solo (refit) cada vez que las imágenes nuevas
+# llegan a SIFT_CODEBOOK_REFIT_GROWTH veces las usadas al entrenar (0: nunca)
+SIFT_CODEBOOK_MIN_IMAGES = int(os.getenv("SIFT_CODEBOOK_MIN_IMAGES", "20"))
+SIFT_CODEBOOK_REFIT_GROWTH = float(os.getenv("SIFT_CODEBOOK_REFIT_GROWTH", "1.0"))
+
+# Backend del vector HOG: skimage (referencia) u opencv (cv2.HOGDescriptor, más
+# rápido pero con valores distintos; no mezclar ambos en un mismo modelo)
+HOG_BACKEND = os.getenv("HOG_BACKEND", "skimage")
+
+# Deduplicación por contenido: una subida con los mismos bytes que una ya
+# procesada reutiliza su image_id, artefactos y características (0 desactiva)
+CONTENT_DEDUP = os.getenv("CONTENT_DEDUP", "1") == "1"
+
+# Paginación de /gallery e /images: tamaño de página por defecto y máximo
+GALLERY_PAGE_SIZE = int(os.getenv("GALLERY_PAGE_SIZE", "100"))
+GALLERY_MAX_PAGE_SIZE = int(os.getenv("GALLERY_MAX_PAGE_SIZE", "1000"))
+
+# Servicio de artefactos: python (FileResponse) o accel (el backend resuelve la
+# ruta y nginx envía el archivo desde el volumen compartido vía X-Accel-Redirect;
+# solo en peticiones que llegan por el proxy con X-Sendfile-Type: X-Accel-Redirect)
+ARTIFACT_SERVING = os.getenv("ARTIFACT_SERVING", "python")
+ACCEL_REDIRECT_PREFIX = os.getenv("ACCEL_REDIRECT_PREFIX", "/_artifacts/")
+
+# Presupuesto en disco (MB) de los artefactos derivados generados bajo demanda
+# (procesada, binarizada, visualizaciones SIFT/HOG/CNN); al superarlo se
+# desalojan los menos usados recientemente. 0 = sin límite
+DERIVED_CACHE_MAX_MB = int(os.getenv("DERIVED_CACHE_MAX_MB", "1024"))
+
+# Pool de trabajadores para la extracción CPU-bound: process | thread | inline.
+# WORKER_POOL_MAX_PENDING=0 usa el doble de trabajadores como límite de trabajos en vuelo
+WORKER_POOL_MODE = os.getenv("WORKER_POOL_MODE", "process")
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", str(max(1, (os.cpu_count() or 2) - 1))))
+WORKER_POOL_MAX_PENDING = int(os.getenv("WORKER_POOL_MAX_PENDING", "0"))
+# Imágenes por trabajo del pool: cada fragmento se preprocesa y se extrae con
+# los extractores por lote (momentos, Hu, Zernike, HOG). Se reparte entre todos los trabajadores
+EXTRACTION_BATCH_SIZE = int(os.getenv("EXTRACTION_BATCH_SIZE", "16"))
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    If-None-Match puede traer varios ETag separados por comas, o *
+    """
+    if not if_none_match:
+        return False
+    candidatos = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidatos or etag in candidatos
+
 
 def parse_capacities(capacities_text: str) -> List[int]:
     """
@@ -36,30 +111,42 @@ def validate_file_size(content: bytes, filename: str) -> None:
         raise ValueError(f"Archivo demasiado grande: {filename}")
 
 
+def get_data_dir() -> str:
+    """
+    Directorio de datos del entorno (sin crear subdirectorios)
+    """
+    return os.getenv("DATA_DIR", "/data")
+
+
 def get_data_paths():
     """
     Obtiene las rutas de datos del entorno
     """
-    DATA_DIR = os.getenv("DATA_DIR", "/data")
+    DATA_DIR = get_data_dir()
     
     paths = {
         "data_dir": DATA_DIR,
         "original_dir": os.path.join(DATA_DIR, "originals"),
         "processed_dir": os.path.join(DATA_DIR, "processed"),
         "binarized_dir": os.path.join(DATA_DIR, "binarized"),
+        "descriptors_dir": os.path.join(DATA_DIR, "descriptors"),
+        "feature_store_dir": os.path.join(DATA_DIR, "feature_store"),
         "index_file": os.path.join(DATA_DIR, "index.json"),
+        "index_db_file": os.path.join(DATA_DIR, "index.sqlite3"),
         "cluster_state_file": os.path.join(DATA_DIR, "cluster_state.json"),
         "cluster_state_file_hu": os.path.join(DATA_DIR, "cluster_state_hu.json"),
         "cluster_state_file_zernike": os.path.join(DATA_DIR, "cluster_state_zernike.json"),
         "cluster_state_file_sift": os.path.join(DATA_DIR, "cluster_state_sift.json"),
         "cluster_state_file_hog": os.path.join(DATA_DIR, "cluster_state_hog.json"),
         "cluster_state_file_cnn": os.path.join(DATA_DIR, "cluster_state_cnn.json"),
+        "sift_codebook_file": os.path.join(DATA_DIR, "sift_codebook.npz"),
     }
     
     # Crear directorios si no existen
     os.makedirs(paths["original_dir"], exist_ok=True)
     os.makedirs(paths["processed_dir"], exist_ok=True)
     os.makedirs(paths["binarized_dir"], exist_ok=True)
+    os.makedirs(paths["descriptors_dir"], exist_ok=True)
     
     return paths
 
@@ -77,6 +164,7 @@ def generate_file_names(image_id: str, content_type: str) -> dict:
         "binarized": f"{image_id}_binarized{processed_ext}",
         "sift": f"{image_id}_sift{processed_ext}",
         "hog": f"{image_id}_hog{processed_ext}",
+        "cnn": f"{image_id}_cnn{processed_ext}",
     }
 
 
@@ -21,7 +21,8 @@ document.addEventListener('DOMContentLoaded', () => {
  */
 async function updateGalleryCount() {
     try {
-        const response = await fetch('/gallery');
+        // Solo hace falta el total: página de un item con solo el id (revalidada por ETag)
+        const response = await fetch('/gallery?limit=1&fields=id');
         if (response.ok) {
             const data = await response.json();
             const total = data.total || 0;
@@ -173,7 +174,7 @@ function disableActionButtons() {
 async function checkGalleryImages() {
     await updateGalleryCount(); // Usar la nueva función
     
-    const response = await fetch('/gallery');
+    const response = await fetch('/gallery?limit=1&fields=id');
     if (response.ok) {
         const data = await response.json();
         const total = data.total || 0;
@@ -188,6 +189,29 @@ async function checkGalleryImages() {
     }
 }
 
+/**
+ * Leer una respuesta NDJSON línea a línea
+ */
+async function readNdjson(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+    }
+
+    if (buffer.trim()) {
+        onEvent(JSON.parse(buffer));
+    }
+}
+
 /**
  * Inicializar clustering automático con todas las imágenes de galería
  */
@@ -200,50 +224,39 @@ async function initializeClusteringAuto() {
     try {
         showToast('Obteniendo imágenes de la galería...', 'info');
         
-        // Obtener todas las imágenes de la galería
-        const response = await fetch('/gallery');
+        // Solo se necesita el total: el servidor agrupa las imágenes ya guardadas
+        const response = await fetch('/gallery?limit=1&fields=id');
         if (!response.ok) {
             throw new Error('Error al obtener imágenes de la galería');
         }
 
         const data = await response.json();
-        const images = data.items || [];
+        const totalImages = data.total || 0;
 
-        if (images.length === 0) {
+        if (totalImages === 0) {
             showToast('No hay imágenes en la galería. Sube algunas primero en la sección Galería.', 'warning');
             return;
         }
 
         // Validar capacidad total vs número de imágenes
         const totalCapacity = momentsState.capacities.reduce((sum, cap) => sum + cap, 0);
-        if (images.length > totalCapacity) {
+        if (totalImages > totalCapacity) {
             showToast(
-                `⚠️ Capacidad insuficiente: Tienes ${images.length} imágenes pero la capacidad total es ${totalCapacity}. ` +
+                `⚠️ Capacidad insuficiente: Tienes ${totalImages} imágenes pero la capacidad total es ${totalCapacity}. ` +
                 `Aumenta las capacidades o reduce el número de imágenes.`,
                 'error'
             );
             return;
         }
 
-        showToast(`Procesando ${images.length} imágenes...`, 'info');
+        showToast(`Agrupando ${totalImages} imágenes...`, 'info');
 
-        // Descargar las imágenes binarias
+        // Re-agrupar en el servidor las imágenes ya guardadas (sin descargarlas ni volver a subirlas)
         const formData = new FormData();
-        
-        for (const img of images) {
-            const imgResponse = await fetch(img.binarized_url);
-            const blob = await imgResponse.blob();
-            const filename = img.binarized_url.split('/').pop();
-            formData.append('files', blob, filename);
-        }
-
-        // Agregar configuración
         formData.append('clusters', momentsState.numClusters);
         formData.append('capacities', momentsState.capacities.join(','));
-        formData.append('reset', 'true');
 
-        // Ejecutar clustering
-        const clusterResponse = await fetch('/api/moments/analyze', {
+        const clusterResponse = await fetch('/api/moments/recluster', {
             method: 'POST',
             body: formData
         });
@@ -253,14 +266,27 @@ async function initializeClusteringAuto() {
             throw new Error(error.detail || 'Error al ejecutar clustering');
         }
 
-        const result = await clusterResponse.json();
+        // Respuesta NDJSON: una asignación por línea a medida que se calculan
+        const results = [];
+        let streamError = null;
+        await readNdjson(clusterResponse, event => {
+            if (event.type === 'assignment') {
+                results.push(event);
+            } else if (event.type === 'error') {
+                streamError = streamError || event.detail;
+            }
+        });
+
+        if (streamError) {
+            throw new Error(streamError);
+        }
         
         momentsState.clusteringActive = true;
         
-        showToast(`✓ Clustering completado: ${images.length} imágenes procesadas`, 'success');
+        showToast(`✓ Clustering completado: ${results.length} imágenes agrupadas`, 'success');
         
         // Mostrar resultados y métricas
-        displayClusteringResults(result.results);
+        displayClusteringResults(results);
         
         // Obtener y mostrar estado con métricas
         await viewClusterStatus();
@@ -138,10 +138,18 @@ async function uploadImages(files) {
     }
 }
 
-// Obtener todas las imágenes
+// Obtener todas las imágenes (recorriendo las páginas de la galería)
 async function getAllImages() {
     try {
-        return await fetchAPI('/images');
+        const images = [];
+        let cursor = null;
+        do {
+            const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+            const data = await fetchAPI('/gallery' + query);
+            images.push(...(data.items || []));
+            cursor = data.next_cursor;
+        } while (cursor);
+        return images;
     } catch (error) {
         console.error('Error getting images:', error);
         return [];
@@ -159,13 +167,13 @@ async function deleteAllImages() {
     }
 }
 
-// Obtener datos de la galería
-async function getGalleryData() {
+// Obtener una página de la galería ({ items, total, next_cursor })
+async function getGalleryData(params = {}) {
     try {
-        const data = await fetchAPI('/gallery');
-        return data.images || [];
+        const query = new URLSearchParams(params).toString();
+        return await fetchAPI('/gallery' + (query ? `?${query}` : ''));
     } catch (error) {
         console.error('Error getting gallery data:', error);
-        return [];
+        return { items: [], total: 0, next_cursor: null };
     }
 }